@@ -0,0 +1,43 @@
+"""
+Benchmark commons.consume_json over large script bodies, to check that it scales linearly.
+
+Run with: python benchmarks/bench_consume_json.py
+"""
+
+import json
+import time
+
+from kegscraper.util import commons
+
+
+def make_script(n_items: int) -> tuple[str, int]:
+    """Make a script body with a large JSON blob inside some JS, like moodle's M.cfg"""
+    blob = json.dumps(
+        {
+            "sesskey": "abcdef",
+            "items": [
+                {"id": i, "name": f"item \"{i}\"", "value": i * 1.5, "ok": i % 2 == 0}
+                for i in range(n_items)
+            ],
+        }
+    )
+    pfx = "var M = {}; M.yui = {};\nM.cfg = "
+    return f"{pfx}{blob};\nM.yui.loader = {{}};", len(pfx)
+
+
+def main():
+    for n_items in (1_000, 10_000, 50_000, 100_000):
+        script, i = make_script(n_items)
+
+        start = time.perf_counter()
+        commons.consume_json(script, i)
+        elapsed = time.perf_counter() - start
+
+        size_mb = len(script) / 1e6
+        print(
+            f"{size_mb:7.2f} MB: {elapsed * 1000:8.2f} ms ({elapsed / size_mb * 1000:6.2f} ms/MB)"
+        )
+
+
+if __name__ == "__main__":
+    main()
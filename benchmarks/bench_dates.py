@@ -0,0 +1,54 @@
+"""
+Benchmark the per-item cost of util.dates.parse_date against dateparser.parse, for the date formats the scrapers see.
+
+Run with: python benchmarks/bench_dates.py
+"""
+
+import random
+import time
+from datetime import datetime, timedelta
+
+import dateparser
+
+from kegscraper.util import dates
+
+FORMATS = {
+    "moodle": lambda d: d.strftime("%A, %d %B %Y, %I:%M %p").replace(" 0", " "),
+    "iso": lambda d: d.isoformat(),
+    "bromcom": lambda d: d.strftime("%m/%d/%Y %I:%M:%S %p"),
+    "no year": lambda d: d.strftime("%A, %d %B, %I:%M %p"),
+}
+
+
+def make_samples(fmt, n: int, distinct: int) -> list[str]:
+    start = datetime(2024, 9, 1)
+    pool = [fmt(start + timedelta(minutes=random.randrange(525_600))) for _ in range(distinct)]
+    return [random.choice(pool) for _ in range(n)]
+
+
+def per_item_us(parse, samples: list[str]) -> float:
+    start = time.perf_counter()
+    for text in samples:
+        parse(text)
+    return (time.perf_counter() - start) / len(samples) * 1e6
+
+
+def main():
+    # Load dateparser's language data first, so it isn't counted
+    dateparser.parse("1 January 2024")
+
+    n = 2_000
+    print(f"{'format':<10}{'dateparser':>14}{'cold':>12}{'warm':>12}  (us per item, {n} items, 200 distinct)")
+    for name, fmt in FORMATS.items():
+        samples = make_samples(fmt, n, 200)
+
+        baseline = per_item_us(dateparser.parse, samples[:200])
+        dates.clear_cache()
+        cold = per_item_us(dates.parse_date, samples[:200])
+        warm = per_item_us(dates.parse_date, samples)
+
+        print(f"{name:<10}{baseline:>14.1f}{cold:>12.1f}{warm:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
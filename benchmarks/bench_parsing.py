@@ -0,0 +1,86 @@
+"""
+Compare CPU time and peak memory of parsing saved pages with a full html.parser soup
+against util.parsing (with each backend that is installed, and the strainer each scraper uses).
+
+Run with: python benchmarks/bench_parsing.py [pages dir]
+
+By default, this uses the small anonymised pages in benchmarks/samples. For numbers from real pages, save pages
+(while logged in) as benchmarks/fixtures/<page type>.html, e.g. vle_profile.html - these are used instead if there
+are any, and are gitignored as they contain personal data.
+"""
+
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+from bs4 import BeautifulSoup, SoupStrainer
+
+from kegscraper.util import parsing
+from kegscraper.vle import user
+
+STRAINERS: dict[str, SoupStrainer | None] = {
+    "vle_profile": user._PROFILE_STRAINER,
+    "vle_forum": parsing.MAIN,
+    "vle_discussion": parsing.MAIN,
+    "vle_tag": parsing.MAIN,
+    "vle_login": parsing.INPUTS,
+    "bromcom_timetable": SoupStrainer("select", {"id": "WeekStartDate"}),
+    "bromcom_dashboard": None,
+    "papercut_dashboard": None,
+    "it_news_listing": SoupStrainer("a", {"rel": "bookmark"}),
+    "it_news_item": None,
+}
+
+REPEATS = 20
+
+
+def measure(parse) -> tuple[float, float]:
+    """:return: CPU ms per parse, and peak MB of one parse"""
+    start = time.process_time()
+    for _ in range(REPEATS):
+        parse()
+    cpu = (time.process_time() - start) / REPEATS * 1000
+
+    tracemalloc.start()
+    parse()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return cpu, peak / 1e6
+
+
+def main():
+    if len(sys.argv) > 1:
+        pages_dir = Path(sys.argv[1])
+    else:
+        pages_dir = Path(__file__).parent / "fixtures"
+        if not any(pages_dir.glob("*.html")):
+            pages_dir = Path(__file__).parent / "samples"
+
+    pages = sorted(pages_dir.glob("*.html"))
+    if not pages:
+        sys.exit(
+            f"No pages found in {pages_dir}. Save pages as <page type>.html, "
+            f"where page type is one of {', '.join(STRAINERS)}"
+        )
+
+    backends = [b for b in parsing.BACKENDS if b != "lxml" or parsing.LXML_AVAILABLE]
+
+    for page in pages:
+        html = page.read_text(encoding="utf-8", errors="replace")
+        strainer = STRAINERS.get(page.stem)
+
+        print(f"{page.stem} ({len(html) / 1e3:.0f} kB)")
+        cpu, peak = measure(lambda: BeautifulSoup(html, "html.parser"))
+        print(f"  {'full html.parser':<28}{cpu:8.2f} ms {peak:8.2f} MB")
+
+        for backend in backends:
+            parsing.set_backend(backend)
+            cpu, peak = measure(lambda: parsing.soup(html, strainer))
+            label = f"{backend}{' + strainer' if strainer is not None else ''}"
+            print(f"  {label:<28}{cpu:8.2f} ms {peak:8.2f} MB")
+
+
+if __name__ == "__main__":
+    main()
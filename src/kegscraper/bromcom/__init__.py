@@ -2,4 +2,7 @@
 Anything to do with the BromcomVLE website: https://bromcomvle.com/
 """
 from .session import login
+from .pool import SessionPool, Account
 from .timetable import WeekDate, Lesson
+from .lessontable import LessonTable
+from .sync import TimetableSync, LessonChange
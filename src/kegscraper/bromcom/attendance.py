@@ -0,0 +1,87 @@
+"""
+Attendance chart extraction and the AttendanceBreakdown dataclass for bromcom
+"""
+
+from __future__ import annotations
+
+import re
+
+from dataclasses import dataclass
+from typing_extensions import Final, Optional
+
+from ..util import commons
+
+_CHART: Final = re.compile(rb"""bindto\s*:\s*['"]#AttendanceChart['"]""")
+_COLUMNS: Final = re.compile(rb"columns\s*:\s*\[")
+_CODE: Final = re.compile(r"\((\w+)\)\s*$")
+
+
+def extract_chart_columns(content: bytes, encoding: str = "utf-8") -> Optional[list]:
+    """
+    Find the `columns` array of the AttendanceChart c3 chart in the raw /Attendance page, without parsing the HTML.
+    :return: the columns, e.g. [["Present (P)", 176], ["Late (L)", 21]], or None if there is no chart
+    """
+    chart = _CHART.search(content)
+    if chart is None:
+        return None
+
+    columns = _COLUMNS.search(content, chart.end())
+    if columns is None:
+        return None
+
+    # Only the text from the array onwards is decoded
+    data = commons.consume_json(content[columns.end() - 1 :].decode(encoding, errors="replace"))
+    assert isinstance(data, list)
+    return data
+
+
+@dataclass
+class AttendanceBreakdown:
+    """
+    The counts of each attendance status, as shown in the attendance chart
+    """
+
+    counts: dict[str, int]
+    """e.g. {"Present (P)": 176, "Late (L)": 21}"""
+
+    @classmethod
+    def from_columns(cls, columns: list) -> AttendanceBreakdown:
+        return cls({cat: count for cat, count in columns})
+
+    @property
+    def total(self) -> int:
+        return sum(self.counts.values())
+
+    @property
+    def by_code(self) -> dict[str, int]:
+        """
+        The counts keyed by the mark code in brackets, e.g. {"P": 176, "L": 21}
+        """
+        ret = {}
+        for cat, count in self.counts.items():
+            match = _CODE.search(cat)
+            code = match[1] if match else cat
+            ret[code] = ret.get(code, 0) + count
+        return ret
+
+    @property
+    def present(self) -> int:
+        return self.by_code.get("P", 0)
+
+    @property
+    def late(self) -> int:
+        return self.by_code.get("L", 0)
+
+    def rate(self, *codes: str) -> float:
+        """
+        The fraction of sessions with any of the given mark codes, e.g. rate("P", "L")
+        """
+        if not self.total:
+            return 0.0
+        by_code = self.by_code
+        return sum(by_code.get(code, 0) for code in codes) / self.total
+
+    @property
+    def attendance_rate(self) -> float:
+        """The fraction of sessions marked present or late"""
+        return self.rate("P", "L")
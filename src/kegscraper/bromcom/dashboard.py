@@ -0,0 +1,104 @@
+"""
+Dashboard parsing, and the Snapshot dataclass for fetching everything on the bromcom dashboard at once
+"""
+
+from __future__ import annotations
+
+import asyncio
+
+from datetime import datetime
+from dataclasses import dataclass, field
+from typing_extensions import Any, Final, Optional
+from bs4 import BeautifulSoup, SoupStrainer
+
+from ..util import exceptions
+
+from . import session
+
+NAME_STRAINER: Final = SoupStrainer("span", {"id": "UsernameLabel"})
+
+
+def parse_name(soup: BeautifulSoup) -> Optional[str]:
+    """
+    Find the student name in the welcome message of the dashboard page
+    """
+    message = soup.find("span", {"id": "UsernameLabel"})
+    if message is None:
+        raise exceptions.NotFound(f"Could not find welcome message! Page: {soup}")
+
+    name = message.text.strip()
+    return name if isinstance(name, str) else None
+
+
+def parse_contact_details(soup: BeautifulSoup) -> dict[str, str | Any]:
+    """
+    Read the school contact details as a key:value table from the hidden drop-down menu of the dashboard page
+    """
+    conn_anchor = soup.find("a", {"title": "Contact School"})
+    assert conn_anchor is not None
+    table = conn_anchor.parent.find("table")
+
+    data = {}
+    for tr in table.find_all("tr"):
+        tr_data = []
+        for i, td in enumerate(tr.find_all("td")):
+            text: str = td.text
+            if i == 0:
+                continue
+
+            elif text.endswith(":"):
+                # Trim off colon
+                text = text[:-1]
+
+            tr_data.append(text)
+
+        if len(tr_data) == 2:
+            # Only add stuff that can be made into a dict
+            data[tr_data[0]] = tr_data[1]
+
+    return data
+
+
+@dataclass
+class Snapshot:
+    """
+    Everything on a student's dashboard, fetched at once with Session.snapshot()
+    """
+
+    name: Optional[str]
+    school_contact_details: dict[str, str | Any]
+
+    attendance_status: Any
+    reports_data: dict[str, list[dict[str, str]]]
+    exam_data: list[dict[str, str]]
+    bookmarks_data: list[dict]
+    homework_data: list
+
+    taken_at: datetime = field(default_factory=datetime.now)
+
+
+async def snapshot(sess: session.Session) -> Snapshot:
+    """
+    Fetch the dashboard page and every widget concurrently, and parse the dashboard once
+    """
+    dashboard, attendance, reports, exams, bookmarks, homework = await asyncio.gather(
+        sess._get_dashboard(),
+        sess._get_widget_data("Attendance"),
+        sess._get_widget_data("Reports"),
+        sess._get_widget_data("ExamResults"),
+        sess._get_widget_data("Bookmarks"),
+        sess._get_widget_data("Homework"),
+    )
+
+    name = parse_name(dashboard)
+    sess._name = name
+
+    return Snapshot(
+        name,
+        parse_contact_details(dashboard),
+        attendance,
+        reports,
+        exams,
+        bookmarks,
+        homework,
+    )
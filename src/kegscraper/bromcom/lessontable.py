@@ -0,0 +1,266 @@
+"""
+LessonTable class, a compact columnar store of many bromcom lessons
+"""
+
+from __future__ import annotations
+
+import math
+import importlib.util
+
+from array import array
+from datetime import datetime
+from dataclasses import dataclass, field
+from typing_extensions import Any, Final, Iterable, Iterator, Optional
+
+from . import timetable
+
+NUMPY_AVAILABLE: Final[bool] = importlib.util.find_spec("numpy") is not None
+
+STR_COLUMNS: Final = ("period", "subject", "class_name", "room", "teacher", "color")
+"""Columns stored as codes into a list of distinct values"""
+INT_COLUMNS: Final = ("teacher_id", "week_id")
+"""Columns stored as 64-bit ints, with -1 for None"""
+TIME_COLUMNS: Final = ("start", "end")
+"""Columns stored as float epoch timestamps, with NaN for None"""
+SMALL_COLUMNS: Final = ("weekday", "week_a_b")
+"""Columns stored as bytes, with -1 for None. weekday is 0 for Monday, week_a_b is 0 for 'a'"""
+
+COLUMNS: Final = STR_COLUMNS + INT_COLUMNS + TIME_COLUMNS + SMALL_COLUMNS
+
+
+@dataclass
+class _StrColumn:
+    """A dictionary-encoded column of optional strings"""
+
+    values: list[Optional[str]] = field(default_factory=list)
+    index: dict[Optional[str], int] = field(default_factory=dict)
+    codes: array = field(default_factory=lambda: array("i"))
+
+    def code(self, value: Optional[str]) -> int:
+        if value not in self.index:
+            self.index[value] = len(self.values)
+            self.values.append(value)
+        return self.index[value]
+
+    def append(self, value: Optional[str]):
+        self.codes.append(self.code(value))
+
+    def take(self, rows: list[int]) -> _StrColumn:
+        # The dictionary is shared, as codes are only ever added to it
+        codes = self.codes
+        return _StrColumn(self.values, self.index, array("i", [codes[i] for i in rows]))
+
+    def decode(self) -> list[Optional[str]]:
+        values = self.values
+        return [values[c] for c in self.codes]
+
+
+def _encode(name: str, value: Any) -> int | float:
+    """Encode a value for a numeric column"""
+    if name in TIME_COLUMNS:
+        return math.nan if value is None else value.timestamp()
+    if name == "week_a_b":
+        return -1 if value is None else "ab".index(value)
+    return -1 if value is None else value
+
+
+def _decode(name: str, value: int | float) -> Any:
+    """Decode a value from a numeric column"""
+    if name in TIME_COLUMNS:
+        return None if math.isnan(value) else datetime.fromtimestamp(value)
+    if value == -1:
+        return None
+    if name == "week_a_b":
+        return "ab"[value]
+    return value
+
+
+@dataclass
+class LessonTable:
+    """
+    A columnar store of lessons: each attribute is held in one typed array (strings as codes into a list of distinct values),
+    rather than as thousands of Lesson objects. Lesson._sess is not stored.
+
+    The columns save memory, but filter/between/group_by are plain Python loops over the arrays - they are not vectorised.
+    For vectorised work, export the columns with to_numpy().
+
+    e.g.:
+    table = LessonTable.from_lessons(await sess.get_timetable_range(0, 40))
+    maths = table.filter(subject="Maths", week_a_b="a")
+    by_slot = table.group_by("weekday", "period")
+    """
+
+    _str: dict[str, _StrColumn] = field(
+        default_factory=lambda: {name: _StrColumn() for name in STR_COLUMNS}
+    )
+    _num: dict[str, array] = field(
+        default_factory=lambda: {
+            **{name: array("q") for name in INT_COLUMNS},
+            **{name: array("d") for name in TIME_COLUMNS},
+            **{name: array("b") for name in SMALL_COLUMNS},
+        }
+    )
+
+    @classmethod
+    def from_lessons(cls, lessons: Iterable[timetable.Lesson]) -> LessonTable:
+        table = cls()
+        table.extend(lessons)
+        return table
+
+    def append(self, lesson: timetable.Lesson):
+        for name, column in self._str.items():
+            column.append(getattr(lesson, name))
+
+        num = self._num
+        for name in INT_COLUMNS + TIME_COLUMNS:
+            num[name].append(_encode(name, getattr(lesson, name)))
+
+        num["weekday"].append(-1 if lesson.start is None else lesson.start.weekday())
+        num["week_a_b"].append(_encode("week_a_b", lesson.week_a_b))
+
+    def extend(self, lessons: Iterable[timetable.Lesson]):
+        for lesson in lessons:
+            self.append(lesson)
+
+    def __len__(self) -> int:
+        return len(self._num["start"])
+
+    def __getitem__(self, i: int) -> timetable.Lesson:
+        values = {name: column.values[column.codes[i]] for name, column in self._str.items()}
+        for name, column in self._num.items():
+            if name != "weekday":
+                values[name] = _decode(name, column[i])
+
+        return timetable.Lesson(**values)
+
+    def __iter__(self) -> Iterator[timetable.Lesson]:
+        for i in range(len(self)):
+            yield self[i]
+
+    def column(self, name: str) -> list[Any]:
+        """
+        Decode a whole column, e.g. table.column("subject")
+        """
+        if name in self._str:
+            return self._str[name].decode()
+        if name in self._num:
+            if name == "weekday":
+                return [None if v == -1 else v for v in self._num[name]]
+            return [_decode(name, v) for v in self._num[name]]
+        raise KeyError(f"No column {name!r}. Columns: {COLUMNS}")
+
+    def _codes(self, name: str) -> array:
+        if name in self._str:
+            return self._str[name].codes
+        if name in self._num:
+            return self._num[name]
+        raise KeyError(f"No column {name!r}. Columns: {COLUMNS}")
+
+    def _target(self, name: str, value: Any) -> Optional[int | float]:
+        """The stored code for a value, or None if no row can have it"""
+        if name in self._str:
+            return self._str[name].index.get(value)
+        return _encode(name, value)
+
+    def take(self, rows: list[int]) -> LessonTable:
+        """
+        Make a new table from the rows at the given indices
+        """
+        return LessonTable(
+            {name: column.take(rows) for name, column in self._str.items()},
+            {
+                name: array(column.typecode, [column[i] for i in rows])
+                for name, column in self._num.items()
+            },
+        )
+
+    def rows_where(self, **conditions: Any) -> list[int]:
+        """
+        Find the indices of rows whose columns equal the given values, e.g. rows_where(weekday=0, period="1")
+        """
+        rows: Iterable[int] = range(len(self))
+        for name, value in conditions.items():
+            codes = self._codes(name)
+            target = self._target(name, value)
+            if target is None:
+                return []
+
+            if isinstance(target, float) and math.isnan(target):
+                rows = [i for i in rows if math.isnan(codes[i])]
+            else:
+                rows = [i for i in rows if codes[i] == target]
+        return list(rows)
+
+    def filter(self, **conditions: Any) -> LessonTable:
+        """
+        Make a new table of the rows whose columns equal the given values, e.g. filter(subject="Maths", week_a_b="b")
+        """
+        return self.take(self.rows_where(**conditions))
+
+    def between(self, start: datetime, end: datetime) -> LessonTable:
+        """
+        Make a new table of the lessons starting in [start, end)
+        """
+        lo, hi = start.timestamp(), end.timestamp()
+        starts = self._num["start"]
+        return self.take([i for i, ts in enumerate(starts) if lo <= ts < hi])
+
+    def group_by(self, *names: str) -> dict[tuple, LessonTable]:
+        """
+        Split the table by the values of some columns, e.g. group_by("weekday", "period").
+        :return: {(value, ...): table}, in the order each group first appears
+        """
+        columns = [self._codes(name) for name in names]
+        groups: dict[tuple, list[int]] = {}
+        for i in range(len(self)):
+            key = tuple(column[i] for column in columns)
+            rows = groups.get(key)
+            if rows is None:
+                groups[key] = [i]
+            else:
+                rows.append(i)
+
+        def decode_key(key: tuple) -> tuple:
+            ret = []
+            for name, code in zip(names, key):
+                if name in self._str:
+                    ret.append(self._str[name].values[code])
+                elif name == "weekday":
+                    ret.append(None if code == -1 else code)
+                else:
+                    ret.append(_decode(name, code))
+            return tuple(ret)
+
+        return {decode_key(key): self.take(rows) for key, rows in groups.items()}
+
+    def to_lessons(self) -> list[timetable.Lesson]:
+        return list(self)
+
+    def to_dict(self) -> dict[str, array | list[Optional[str]]]:
+        """
+        Export the columns as a dict of arrays. Numeric columns are copies of the stored arrays (with -1/NaN for None, and
+        week_a_b as 0/1), string columns are lists of the decoded values.
+        """
+        ret: dict[str, array | list[Optional[str]]] = {
+            name: column.decode() for name, column in self._str.items()
+        }
+        for name, column in self._num.items():
+            ret[name] = array(column.typecode, column)
+        return ret
+
+    def to_numpy(self) -> dict[str, Any]:
+        """
+        Export the columns as a dict of NumPy arrays (needs numpy to be installed).
+        String columns are object arrays, as decoded by indexing an array of distinct values with the codes.
+        """
+        if not NUMPY_AVAILABLE:
+            raise ImportError("numpy needs to be installed to use LessonTable.to_numpy()")
+        import numpy as np
+
+        ret = {}
+        for name, column in self._str.items():
+            values = np.array(column.values, dtype=object)
+            ret[name] = values[np.frombuffer(column.codes, dtype=np.intc)]
+        for name, column in self._num.items():
+            ret[name] = np.array(column)
+        return ret
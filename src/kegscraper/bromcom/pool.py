@@ -0,0 +1,233 @@
+"""
+SessionPool class, for keeping many bromcom accounts logged in across restarts
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import json
+import os
+import time
+
+from dataclasses import dataclass, field
+from http.cookiejar import Cookie
+from pathlib import Path
+from typing_extensions import Any, Optional
+
+import httpx
+
+from . import session
+
+
+@dataclass
+class Account:
+    school_id: int
+    username: str
+    password: str
+    remember_me: bool = True
+
+
+def _cookie_to_json(cookie: Cookie) -> dict[str, Any]:
+    return {
+        "name": cookie.name,
+        "value": cookie.value,
+        "domain": cookie.domain,
+        "path": cookie.path,
+        "secure": cookie.secure,
+        "expires": cookie.expires,
+        "rest": cookie._rest,  # type: ignore[attr-defined]
+    }
+
+
+def _cookie_from_json(data: dict[str, Any]) -> Cookie:
+    return Cookie(
+        version=0,
+        name=data["name"],
+        value=data["value"],
+        port=None,
+        port_specified=False,
+        domain=data["domain"],
+        domain_specified=data["domain"].startswith("."),
+        domain_initial_dot=data["domain"].startswith("."),
+        path=data["path"],
+        path_specified=True,
+        secure=data["secure"],
+        expires=data["expires"],
+        discard=data["expires"] is None,
+        comment=None,
+        comment_url=None,
+        rest=data.get("rest", {}),
+    )
+
+
+@dataclass
+class _RateLimiter:
+    """Spaces out calls to `wait` by at least `interval` seconds"""
+
+    interval: float
+    _next: float = 0
+    _lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+
+    async def wait(self):
+        async with self._lock:
+            delay = self._next - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._next = time.monotonic() + self.interval
+
+
+@dataclass
+class SessionPool:
+    """
+    Keeps sessions for many bromcom accounts.
+
+    On start, each account's saved cookie jar (in `cookie_dir`) is loaded and checked, and only accounts without
+    a working saved session log in - at most `max_logins` at once, and `login_interval` seconds apart.
+    Sessions log in again by themselves (through the same limits) if a response shows they have expired,
+    i.e. a 401 or a redirect to the login page. Cookie jars are saved after each login and on `save()`/`aclose()`.
+
+    e.g.:
+    async with SessionPool(accounts, "cookies") as pool:
+        for sess in pool.sessions.values():
+            ...
+    """
+
+    accounts: list[Account]
+    cookie_dir: Optional[str | os.PathLike] = None
+    """Directory to save cookie jars in. None to not save them"""
+    max_logins: int = 4
+    login_interval: float = 0.5
+    client_kwargs: Optional[dict] = None
+
+    sessions: dict[str, session.Session] = field(default_factory=dict)
+    logins: int = 0
+    """Number of logins made (not counting sessions reused from disk)"""
+
+    _login_semaphore: asyncio.Semaphore = field(init=False, repr=False)
+    _limiter: _RateLimiter = field(init=False, repr=False)
+
+    def __post_init__(self):
+        self._login_semaphore = asyncio.Semaphore(self.max_logins)
+        self._limiter = _RateLimiter(self.login_interval)
+
+    def _cookie_path(self, username: str) -> Optional[Path]:
+        if self.cookie_dir is None:
+            return None
+        return Path(self.cookie_dir) / f"{username}.json"
+
+    def _load_cookies(self, rq: httpx.AsyncClient, username: str) -> bool:
+        path = self._cookie_path(username)
+        if path is None or not path.exists():
+            return False
+
+        with open(path, encoding="utf-8") as f:
+            for cookie_data in json.load(f):
+                rq.cookies.jar.set_cookie(_cookie_from_json(cookie_data))
+        return True
+
+    def save_cookies(self, username: str):
+        """
+        Save an account's cookie jar. The file holds live session cookies, so it is only readable by its owner
+        """
+        path = self._cookie_path(username)
+        sess = self.sessions.get(username)
+        if path is None or sess is None:
+            return
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        # The mode is only used when the file is created, so also tighten files saved before
+        os.chmod(path, 0o600)
+        with open(fd, "w", encoding="utf-8") as f:
+            json.dump([_cookie_to_json(cookie) for cookie in sess.rq.cookies.jar], f)
+
+    def save(self):
+        for username in self.sessions:
+            self.save_cookies(username)
+
+    @staticmethod
+    async def is_logged_in(rq: httpx.AsyncClient) -> bool:
+        """
+        Check whether a client's cookies are for a working session, without logging in again
+        """
+        request = rq.build_request("GET", "https://www.bromcomvle.com/Home/Dashboard")
+        response = await rq.send(request, auth=None)
+        await response.aclose()
+        return response.status_code == 200 and not session.is_login_redirect(request, response)
+
+    @contextlib.asynccontextmanager
+    async def _login_slot(self):
+        """Held for the whole of a login, so at most max_logins logins are in flight, started login_interval apart"""
+        async with self._login_semaphore:
+            await self._limiter.wait()
+            yield
+
+    async def _login(self, account: Account, rq: httpx.AsyncClient):
+        async with self._login_slot():
+            await session.authenticate(
+                rq, account.school_id, account.username, account.password, account.remember_me
+            )
+        self.logins += 1
+
+    async def _start(self, account: Account) -> session.Session:
+        rq = session.make_client(self.client_kwargs)
+        sess = session.Session(rq=rq, username=account.username)
+        self.sessions[account.username] = sess
+
+        if not (self._load_cookies(rq, account.username) and await self.is_logged_in(rq)):
+            rq.cookies.clear()
+            await self._login(account, rq)
+            self.save_cookies(account.username)
+
+        def after_login():
+            self.logins += 1
+            self.save_cookies(account.username)
+
+        auth = session.Reauthenticate(
+            account.school_id,
+            account.username,
+            account.password,
+            account.remember_me,
+            # Re-logins go through the same limits as the first ones
+            login_guard=self._login_slot,
+            after_login=after_login,
+        )
+        session.enable_reauthentication(rq, auth)
+        return sess
+
+    async def start(self) -> dict[str, BaseException]:
+        """
+        Reuse or log in sessions for every account, concurrently.
+        Accounts that fail to log in are left out of `sessions`
+        :return: a dict of username: exception for each account that failed
+        """
+        results = await asyncio.gather(
+            *(self._start(account) for account in self.accounts), return_exceptions=True
+        )
+
+        failed = {}
+        for account, result in zip(self.accounts, results):
+            if isinstance(result, BaseException):
+                failed[account.username] = result
+                sess = self.sessions.pop(account.username, None)
+                if sess is not None:
+                    await sess.aclose()
+        return failed
+
+    def get(self, username: str) -> session.Session:
+        return self.sessions[username]
+
+    async def aclose(self):
+        """
+        Save the cookie jars and close the sessions (without logging out, so they can be reused)
+        """
+        self.save()
+        await asyncio.gather(*(sess.aclose() for sess in self.sessions.values()))
+
+    async def __aenter__(self) -> SessionPool:
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.aclose()
@@ -0,0 +1,261 @@
+"""
+Bulk report downloading for bromcom, decoding the base64 reports to disk as they stream in
+"""
+
+from __future__ import annotations
+
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import re
+import time
+
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing_extensions import Any, BinaryIO, Callable, Final, Literal, Optional
+
+from . import session
+
+MANIFEST_NAME: Final = ".reports.json"
+_B64 = re.compile(rb"[A-Za-z0-9+/=]+")
+_TOKEN = re.compile(rb'[A-Za-z0-9+/=]+|\\u([0-9a-fA-F]{4})|\\([/nrt])|"')
+"""A run of base64, an escape that may appear in a JSON string of base64, or the closing quote"""
+_WHITESPACE = re.compile(rb"\s*")
+
+
+@dataclass
+class ReportDownloadStats:
+    """
+    What a download_reports run did
+    """
+
+    downloaded: int = 0
+    skipped: int = 0
+    failed: dict[str, BaseException] = field(default_factory=dict)
+    """filePath: exception for each report that could not be downloaded"""
+    bytes_written: int = 0
+    seconds: float = 0
+
+    @property
+    def throughput(self) -> float:
+        """Decoded bytes written per second"""
+        return self.bytes_written / self.seconds if self.seconds else 0.0
+
+    @property
+    def files_per_second(self) -> float:
+        return self.downloaded / self.seconds if self.seconds else 0.0
+
+
+@dataclass
+class _Base64Writer:
+    """
+    Decodes a JSON string of base64 (as sent by GetReport) to a file, chunk by chunk.
+    JSON escapes (e.g. \\/) are undone, keeping incomplete escapes/quads for the next chunk.
+    Anything else - e.g. an HTML login page, or a JSON error object - raises a ValueError rather than being written
+    """
+
+    file: BinaryIO
+    size: int = 0
+    sha256: Any = field(default_factory=hashlib.sha256)
+    _pending: bytes = b""
+    """Base64 not yet decoded (less than a quad)"""
+    _tail: bytes = b""
+    """Bytes of a possibly incomplete escape at the end of the last chunk"""
+    _state: Literal["before", "in", "after"] = "before"
+    """Whether the opening and closing quotes of the string have been read"""
+
+    def feed(self, chunk: bytes):
+        data = self._tail + chunk
+        self._tail = b""
+
+        pos = 0
+        if self._state == "before":
+            pos = _WHITESPACE.match(data).end()
+            if pos == len(data):
+                return
+            if data[pos : pos + 1] != b'"':
+                raise ValueError(f"Report is not a JSON string of base64: starts with {data[pos:pos + 20]!r}")
+            pos += 1
+            self._state = "in"
+
+        decodable = bytearray(self._pending)
+        while self._state == "in" and pos < len(data):
+            match = _TOKEN.match(data, pos)
+            if match is None:
+                if data[pos : pos + 1] == b"\\" and len(data) - pos < 6:
+                    # Hold back a possibly incomplete escape at the end
+                    self._tail = data[pos:]
+                    break
+                raise ValueError(f"Unexpected bytes in a base64 report: {data[pos:pos + 20]!r}")
+
+            pos = match.end()
+            if match[0] == b'"':
+                self._state = "after"
+            elif match[1] is not None:
+                char = chr(int(match[1], 16)).encode()
+                if not _B64.fullmatch(char):
+                    raise ValueError(f"Unexpected escape in a base64 report: {match[0]!r}")
+                decodable += char
+            elif match[2] is not None:
+                if match[2] == b"/":
+                    decodable += match[2]
+                # else, escaped whitespace (from line wrapping), which is skipped
+            else:
+                decodable += match[0]
+
+        if self._state == "after" and _WHITESPACE.match(data, pos).end() != len(data):
+            raise ValueError(f"Unexpected bytes after a base64 report: {data[pos:pos + 20]!r}")
+
+        usable = len(decodable) - len(decodable) % 4
+        self._write(base64.b64decode(bytes(decodable[:usable]), validate=True))
+        self._pending = bytes(decodable[usable:])
+
+    def close(self):
+        if self._state != "after" or self._tail:
+            raise ValueError("Report ended before the end of its JSON string")
+        if self._pending:
+            # Raises binascii.Error (a ValueError) if the last quad is incomplete
+            self._write(base64.b64decode(self._pending, validate=True))
+        self._pending = b""
+
+    def _write(self, decoded: bytes):
+        self.file.write(decoded)
+        self.sha256.update(decoded)
+        self.size += len(decoded)
+
+
+def _load_manifest(path: Path) -> dict[str, dict[str, Any]]:
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def _file_sha256(path: Path) -> str:
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 16), b""):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+def report_filename(report: dict[str, str]) -> str:
+    """
+    The name a report is saved as, e.g. 'Autumn Report.pdf'
+    """
+    name = f"{report.get('fileName') or 'report'}.{report.get('fileExtension') or 'pdf'}"
+    return os.path.basename(name.replace("\\", "/"))
+
+
+async def download_reports(
+    sess: session.Session,
+    target_dir: str | os.PathLike,
+    *,
+    reports: Optional[list[dict[str, str]]] = None,
+    concurrency: int = 4,
+    verify: bool = False,
+    on_progress: Optional[Callable[[dict[str, str], int], Any]] = None,
+) -> ReportDownloadStats:
+    """
+    Download reports into `target_dir`, decoding them to disk as they download rather than in memory.
+
+    A manifest of downloaded reports (with their size and sha256) is kept in target_dir, and reports that are already
+    on disk with the recorded size are skipped.
+    :param reports: the reports to download (items of reportsList). Defaults to all of them
+    :param concurrency: max number of reports to download at once
+    :param verify: also check the sha256 of existing files before skipping them
+    :param on_progress: called with (report, decoded bytes so far) as each report downloads
+    """
+    start = time.perf_counter()
+    target = Path(target_dir).resolve()
+    target.mkdir(parents=True, exist_ok=True)
+
+    if reports is None:
+        reports = (await sess.reports_data).get("reportsList", [])
+
+    manifest_path = target / MANIFEST_NAME
+    manifest = _load_manifest(manifest_path)
+
+    stats = ReportDownloadStats()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    def is_downloaded(fp: str, dest: Path) -> bool:
+        entry = manifest.get(fp)
+        if entry is None or not dest.exists() or dest.stat().st_size != entry["size"]:
+            return False
+        return not verify or _file_sha256(dest) == entry["sha256"]
+
+    # Give each report its own file, even if two share a name
+    names: dict[str, str] = {fp: entry["name"] for fp, entry in manifest.items()}
+    used = set(names.values())
+    for report in reports:
+        fp = report["filePath"]
+        if fp in names:
+            continue
+
+        name = report_filename(report)
+        stem, suffix = os.path.splitext(name)
+        n = 1
+        while name in used:
+            n += 1
+            name = f"{stem} ({n}){suffix}"
+        names[fp] = name
+        used.add(name)
+
+    async def download(report: dict[str, str]):
+        fp = report["filePath"]
+        dest = (target / names[fp]).resolve()
+        if not dest.is_relative_to(target):
+            raise ValueError(f"Refusing to write {report} outside of {target}")
+
+        if is_downloaded(fp, dest):
+            stats.skipped += 1
+            return
+
+        part = dest.with_name(dest.name + ".part")
+        async with semaphore:
+            try:
+                with open(part, "wb") as f:
+                    writer = _Base64Writer(f)
+                    async with sess.rq.stream(
+                        "GET",
+                        "https://www.bromcomvle.com/Report/GetReport",
+                        params={"filePath": fp},
+                    ) as resp:
+                        resp.raise_for_status()
+                        async for chunk in resp.aiter_bytes():
+                            writer.feed(chunk)
+                            if on_progress is not None:
+                                on_progress(report, writer.size)
+                    writer.close()
+            except BaseException:
+                # Don't leave a partial or invalid report behind
+                part.unlink(missing_ok=True)
+                raise
+
+        part.replace(dest)
+        manifest[fp] = {
+            "name": dest.name,
+            "size": writer.size,
+            "sha256": writer.sha256.hexdigest(),
+        }
+        stats.downloaded += 1
+        stats.bytes_written += writer.size
+
+    async def try_download(report: dict[str, str]):
+        try:
+            await download(report)
+        except Exception as e:
+            stats.failed[report.get("filePath", "")] = e
+
+    try:
+        await asyncio.gather(*(try_download(report) for report in reports))
+    finally:
+        with open(manifest_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=4)
+
+    stats.seconds = time.perf_counter() - start
+    return stats
@@ -4,17 +4,19 @@ Session class and login function. (most bromcom functionality)
 
 from __future__ import annotations
 
-import dateparser
+import asyncio
+import contextlib
+import os
 import httpx
 
 from datetime import date, datetime, timedelta
 from dataclasses import dataclass
-from typing_extensions import Optional, Any
+from typing_extensions import Optional, Any, AsyncContextManager, Callable
 from base64 import b64decode
 from bs4 import BeautifulSoup, SoupStrainer
 
-from . import timetable
-from ..util import exceptions, commons
+from . import timetable, reports, dashboard, attendance
+from ..util import exceptions, commons, parsing, transport, dates
 
 
 @dataclass
@@ -24,6 +26,7 @@ class Session:
 
     _name: Optional[str] = None
     _timetable_weeks: Optional[list[timetable.WeekDate]] = None
+    _week_index: Optional[timetable.WeekIndex] = None
 
     def __repr__(self):
         # repr can't be async. this is problematic
@@ -36,6 +39,12 @@ class Session:
         """
         return await self.rq.get("https://www.bromcomvle.com/Auth/Logout")
 
+    async def aclose(self):
+        """
+        Close this session's client. The shared connection pool stays open for other sessions.
+        """
+        await self.rq.aclose()
+
     # --- Account settings ---
     async def set_color_preference(
         self, *, name: str = "Theme", value: str = "default"
@@ -54,40 +63,27 @@ class Session:
         Fetch the user email from the account settings page
         """
         resp = await self.rq.get("https://www.bromcomvle.com/AccountSettings")
-        inps = commons.eval_inputs(BeautifulSoup(resp.text, "html.parser"))
+        inps = commons.eval_inputs(parsing.soup(resp.text, parsing.INPUTS))
         return inps.get("EmailAddress")
 
+    async def _get_dashboard(self, strainer: Optional[SoupStrainer] = None) -> BeautifulSoup:
+        resp = await self.rq.get("https://www.bromcomvle.com/Home/Dashboard")
+        return parsing.soup(resp.text, strainer)
+
+    async def _get_widget_data(self, widget: str) -> Any:
+        """
+        Fetch data from the widget api, e.g. _get_widget_data("Attendance")
+        """
+        return (
+            await self.rq.get(f"https://www.bromcomvle.com/Home/Get{widget}WidgetData")
+        ).json()
+
     @property
     async def school_contact_details(self) -> dict[str, str | Any]:
         """
         Fetch the school contact details as a key:value table from the hidden drop-down menu
         """
-        resp = await self.rq.get("https://www.bromcomvle.com/Home/Dashboard")
-        soup = BeautifulSoup(resp.text, "html.parser")
-
-        conn_anchor = soup.find("a", {"title": "Contact School"})
-        assert conn_anchor is not None
-        table = conn_anchor.parent.find("table")
-
-        data = {}
-        for tr in table.find_all("tr"):
-            tr_data = []
-            for i, td in enumerate(tr.find_all("td")):
-                text: str = td.text
-                if i == 0:
-                    continue
-
-                elif text.endswith(":"):
-                    # Trim off colon
-                    text = text[:-1]
-
-                tr_data.append(text)
-
-            if len(tr_data) == 2:
-                # Only add stuff that can be made into a dict
-                data[tr_data[0]] = tr_data[1]
-
-        return data
+        return dashboard.parse_contact_details(await self._get_dashboard())
 
     @property
     async def name(self) -> Optional[str]:
@@ -95,23 +91,19 @@ class Session:
         Fetch the student name (not username) from the dashboard page
         """
         if self._name is None:
-            resp = await self.rq.get("https://www.bromcomvle.com/Home/Dashboard")
-            soup = BeautifulSoup(
-                resp.text, "html.parser", parse_only=SoupStrainer("span")
+            self._name = dashboard.parse_name(
+                await self._get_dashboard(dashboard.NAME_STRAINER)
             )
 
-            message = soup.find("span", {"id": "UsernameLabel"})
-            if message is None:
-                raise exceptions.NotFound(
-                    f"Could not find welcome message! Response: {resp.text}"
-                )
-
-            self._name = message.text.strip()
-            if not isinstance(self._name, str):
-                self._name = None
-
         return self._name
 
+    async def snapshot(self) -> dashboard.Snapshot:
+        """
+        Fetch the dashboard and every widget at once, parsing the dashboard page once
+        :return: A snapshot of the student's name, contact details and widget data
+        """
+        return await dashboard.snapshot(self)
+
     @property
     async def pfp(self) -> tuple[bytes, str]:
         """
@@ -161,13 +153,32 @@ class Session:
         if end_date is None:
             end_date = start_date + timedelta(weeks=1)
 
+        week_index = await self.week_index
         if w_a_b is None:
-            tt_week = await self.get_tt_week(start_date)
+            tt_week = week_index.week(start_date)
             assert tt_week is not None, f"Could not find tt_week for {start_date}"
-            wab_offset = (await self.timetable_weeks).index(tt_week) % 2
+            wab_offset = week_index.index(tt_week) % 2
         else:
             wab_offset = "ab".index(w_a_b)
 
+        data = await self._fetch_timetable(start_date, end_date)
+        start_idx = week_index.next_idx(start_date)
+
+        lessons = []
+        for lesson_data in data:
+            lesson = self._parse_lesson(lesson_data)
+            lesson.week_a_b = week_index.a_b(
+                week_index.next_idx(lesson.start) - start_idx + wab_offset
+            )
+            lessons.append(lesson)
+        return lessons
+
+    async def _fetch_timetable(
+        self, start_date: datetime, end_date: datetime
+    ) -> list[dict[str, Any]]:
+        """
+        Fetch the raw lesson data between 2 dates
+        """
         resp = await self.rq.get(
             "https://www.bromcomvle.com/Timetable/GetTimeTable",
             params={
@@ -176,45 +187,78 @@ class Session:
                 "type": 1,
             },
         )
-        data = resp.json()["table"]
+        return resp.json()["table"]
+
+    def _parse_lesson(self, lesson_data: dict[str, Any]) -> timetable.Lesson:
+        return timetable.Lesson(
+            lesson_data.get("periods"),
+            lesson_data.get("subject"),
+            lesson_data.get("class"),
+            lesson_data.get("room"),
+            lesson_data.get("teacherName"),
+            lesson_data.get("teacherID"),
+            lesson_data.get("weekID"),
+            datetime.fromisoformat(lesson_data["startDate"]),
+            datetime.fromisoformat(lesson_data["endDate"]),
+            color=lesson_data.get("subjectColour"),
+            _sess=self,
+        )
+
+    async def get_timetable_range(
+        self,
+        start_idx: int,
+        end_idx: int,
+        *,
+        concurrency: int = 8,
+        single_request: bool = False,
+    ) -> list[timetable.Lesson]:
+        """
+        Fetch the lessons in the timetable weeks [start_idx, end_idx), with week_a_b set from each lesson's own week.
+        :param concurrency: Max number of week requests in flight
+        :param single_request: Request the whole span in one call instead of one call per week
+        :return: A list of lessons in the order of the weeks
+        """
+        weeks = await self.timetable_weeks
+        week_index = await self.week_index
+
+        start_idx = max(start_idx, 0)
+        end_idx = min(end_idx, len(weeks))
+        if start_idx >= end_idx:
+            return []
+
+        if single_request:
+            data = await self._fetch_timetable(
+                weeks[start_idx].date, weeks[end_idx - 1].date + timedelta(weeks=1)
+            )
+        else:
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def fetch_week(wdate: timetable.WeekDate):
+                async with semaphore:
+                    return await self._fetch_timetable(
+                        wdate.date, wdate.date + timedelta(weeks=1)
+                    )
+
+            pages = await asyncio.gather(
+                *(fetch_week(wdate) for wdate in weeks[start_idx:end_idx])
+            )
+            data = [lesson_data for page in pages for lesson_data in page]
 
         lessons = []
         for lesson_data in data:
-            # lesson_data: dict[str, str | int]
-            lesson_data: dict[str, Any]
-
-            lesson_start_date = datetime.fromisoformat(lesson_data["startDate"])
-            lessons.append(
-                timetable.Lesson(
-                    lesson_data.get("periods"),
-                    lesson_data.get("subject"),
-                    lesson_data.get("class"),
-                    lesson_data.get("room"),
-                    lesson_data.get("teacherName"),
-                    lesson_data.get("teacherID"),
-                    lesson_data.get("weekID"),
-                    lesson_start_date,
-                    datetime.fromisoformat(lesson_data["endDate"]),
-                    color=lesson_data.get("subjectColour"),
-                    _sess=self,
-                    week_a_b="ab"[
-                        (
-                            (await self.get_tt_week_idx(lesson_start_date))
-                            - (await self.get_tt_week_idx(start_date))
-                            + wab_offset
-                        )
-                        % 2
-                    ],
-                )
-            )
+            lesson = self._parse_lesson(lesson_data)
+            lesson.week_a_b = week_index.a_b(week_index.position(lesson.start))
+            lessons.append(lesson)
         return lessons
 
     async def get_weeks_a_b(
-        self, delta: int = 5
+        self, delta: int = 5, *, concurrency: int = 8, single_request: bool = False
     ) -> tuple[list[timetable.Lesson], list[timetable.Lesson]]:
         """
         Get 2 lists of lessons (weeka, weekb), generated `delta` weeks back and forth from the current week
         :param delta: number of weeks before and after to measure
+        :param concurrency: Max number of week requests in flight
+        :param single_request: Request the whole span in one call instead of one call per week
         :return:
         """
         idx = await self.current_week_idx
@@ -222,28 +266,32 @@ class Session:
         weeks0: list[timetable.Lesson] = []
         weeks1: list[timetable.Lesson] = []
 
-        for i in range(idx - delta, idx + delta):
-            if not 0 <= i < len(await self.timetable_weeks):
-                continue
-
-            weeks = await self.timetable_weeks
-            _timetable = await self.get_timetable_list(weeks[i])
-
-            for lesson in _timetable:
-                if lesson.week_a_b == "a":
-                    weeks0.append(lesson)
-                else:
-                    weeks1.append(lesson)
+        for lesson in await self.get_timetable_range(
+            idx - delta,
+            idx + delta,
+            concurrency=concurrency,
+            single_request=single_request,
+        ):
+            if lesson.week_a_b == "a":
+                weeks0.append(lesson)
+            else:
+                weeks1.append(lesson)
 
         return weeks0, weeks1
 
-    async def get_mode_timetables(self, delta: int = 5):
+    async def get_mode_timetables(
+        self, delta: int = 5, *, concurrency: int = 8, single_request: bool = False
+    ):
         """
         Infer the base timetable. Look over multiple weeks to avoid being tripped up by pshe, or Comp Room lessons etc.
         :param delta: # of weeks forward/back to look at
+        :param concurrency: Max number of week requests in flight
+        :param single_request: Request the whole span in one call instead of one call per week
         :return: a dictionary of a dictionary of a dictionary of lessons
         """
-        a, b = await self.get_weeks_a_b(delta)
+        a, b = await self.get_weeks_a_b(
+            delta, concurrency=concurrency, single_request=single_request
+        )
         return {
             "a": timetable.get_mode_timetable(a),
             "b": timetable.get_mode_timetable(b),
@@ -256,16 +304,16 @@ class Session:
         :return: A list of WeekDate objects, representing the start of each week, also containing a term and week index.
         """
         if self._timetable_weeks is None:
-            self._timetable_weeks = []
+            weeks = []
 
             resp = await self.rq.get("https://www.bromcomvle.com/Timetable")
-            soup = BeautifulSoup(resp.text, "html.parser")
+            soup = parsing.soup(resp.text, SoupStrainer("select", {"id": "WeekStartDate"}))
 
             date_selector = soup.find("select", {"id": "WeekStartDate"})
             assert date_selector is not None
 
             for option in date_selector.find_all("option"):
-                value = dateparser.parse(option.attrs.get("value"))
+                value = dates.parse_date(option.attrs.get("value"))
                 assert value is not None, f"Failed to parse date"
                 text = option.text
 
@@ -273,19 +321,28 @@ class Session:
                 term = commons.webscrape_section(term, "Term ", "", cls=int)
                 week = commons.webscrape_section(week, "Week ", "", cls=int)
 
-                self._timetable_weeks.append(timetable.WeekDate(term, week, value))
+                weeks.append(timetable.WeekDate(term, week, value))
+
+            self._week_index = timetable.WeekIndex(weeks)
+            self._timetable_weeks = weeks
 
         return self._timetable_weeks
 
+    @property
+    async def week_index(self) -> timetable.WeekIndex:
+        """
+        Lookup of timetable weeks by date, built when the weeks are first fetched
+        """
+        await self.timetable_weeks
+        if self._week_index is None:
+            self._week_index = timetable.WeekIndex(self._timetable_weeks)
+        return self._week_index
+
     async def get_tt_week(self, _dtime: datetime) -> timetable.WeekDate | None:
         """
         Gets the timetable week by datetime
         """
-        prev = None
-        for wdate in await self.timetable_weeks:
-            if wdate.date > _dtime:
-                return prev
-            prev = wdate
+        return (await self.week_index).week(_dtime)
 
     @property
     async def current_week(self) -> timetable.WeekDate | None:
@@ -298,10 +355,7 @@ class Session:
         """
         Gets the timetable week index by datetime
         """
-        for i, wdate in enumerate(await self.timetable_weeks):
-            if wdate.date > _dtime:
-                return i
-        return -1
+        return (await self.week_index).next_idx(_dtime)
 
     @property
     async def current_week_idx(self) -> int:
@@ -318,38 +372,24 @@ class Session:
         }
         :return: A dictionary of attendance statuses and their counts
         """
-        # Parse JSON inside of JS inside of HTML. Yeah....
-        resp = await self.rq.get("https://www.bromcomvle.com/Attendance")
-        soup = BeautifulSoup(resp.text, "html.parser")
-
-        script_prf = "$(document).ready(function () {\r\n            var AttendanceChart = c3.generate({\r\n                bindto: '#AttendanceChart',\r\n"
-
-        for script in soup.find_all("script", {"type": "text/javascript"}):
-            text = script.text.strip()
-
-            if script_prf in text:
-                # Found correct js script. Now webscrape.
-                text = text[text.find(script_prf) :]
-                text = text[text.find("data: ") :]
-                text = text[text.find("columns: [") + 9 :]
-
-                data = commons.consume_json(text)
-                assert isinstance(data, list)
-
-                ret = {cat: count for cat, count in data}
+        return (await self.attendance_breakdown).counts
 
-                return ret
-
-        return {}
+    @property
+    async def attendance_breakdown(self) -> attendance.AttendanceBreakdown:
+        """
+        Fetch the attendance chart's counts of each attendance status.
+        The chart data is found directly in the page bytes, without parsing the HTML
+        """
+        resp = await self.rq.get("https://www.bromcomvle.com/Attendance")
+        columns = attendance.extract_chart_columns(resp.content, resp.encoding or "utf-8")
+        return attendance.AttendanceBreakdown.from_columns(columns or [])
 
     @property
     async def attendance_status(self):
         """
         Get the Status for the current day. (Uses the widget api)
         """
-        return (
-            await self.rq.get("https://www.bromcomvle.com/Home/GetAttendanceWidgetData")
-        ).json()
+        return await self._get_widget_data("Attendance")
 
     # --- Reports data ---
 
@@ -360,9 +400,7 @@ class Session:
         :return: A list of dictionaries representing reports. The filePath attribute can be used in the get_report method to fetch the report pdf as bytes
         """
         # Parse this later
-        return (
-            await self.rq.get("https://www.bromcomvle.com/Home/GetReportsWidgetData")
-        ).json()
+        return await self._get_widget_data("Reports")
 
     async def get_report(
         self, filepath: str
@@ -380,6 +418,16 @@ class Session:
 
         return b64decode(resp.json())
 
+    async def download_reports(
+        self, target_dir: str | os.PathLike, **kwargs
+    ) -> reports.ReportDownloadStats:
+        """
+        Download all (or some) reports into a directory, concurrently and decoding them to disk as they stream in.
+        Reports that were already downloaded are skipped. See reports.download_reports for the options
+        :return: counts of downloaded/skipped/failed reports, and the throughput
+        """
+        return await reports.download_reports(self, target_dir, **kwargs)
+
     # --- Exam data ---
 
     @property
@@ -389,11 +437,7 @@ class Session:
         :return:
         """
         # Parse this
-        return (
-            await self.rq.get(
-                "https://www.bromcomvle.com/Home/GetExamResultsWidgetData"
-            )
-        ).json()
+        return await self._get_widget_data("ExamResults")
 
     # --- Bookmarks data ---
     @property
@@ -403,9 +447,7 @@ class Session:
         :return: list of dictionaries, each is a bookmark
         """
         # Parse this
-        return (
-            await self.rq.get("https://www.bromcomvle.com/Home/GetBookmarksWidgetData")
-        ).json()
+        return await self._get_widget_data("Bookmarks")
 
     # --- Homework data ---
     @property
@@ -414,40 +456,114 @@ class Session:
         Fetch homework data using the widget api. I have no homework here so I am unable to parse this
         :return: A list of something
         """
-        return (
-            await self.rq.get("https://www.bromcomvle.com/Home/GetHomeworkWidgetData")
-        ).json()
+        return await self._get_widget_data("Homework")
 
 
-async def login(
+LOGIN_URL = "https://www.bromcomvle.com/"
+
+
+def is_login_redirect(request: httpx.Request, response: httpx.Response) -> bool:
+    """
+    Whether a response means the session is not logged in: a 401, or being sent to the login page
+    """
+    if response.status_code == 401:
+        return True
+
+    if request.url.path.startswith("/Auth/") or request.url.path in ("", "/"):
+        # Logging in/out, or the login page itself
+        return False
+
+    if response.is_redirect:
+        target = request.url.join(response.headers.get("location", ""))
+        return target.path in ("", "/") or "login" in target.path.lower()
+
+    # Redirects were followed to the login page
+    return response.request.url.path in ("", "/") and response.request is not request
+
+
+class Reauthenticate(httpx.Auth):
+    """
+    Auth flow that logs in again (once, even for many concurrent requests) when a response shows the session has expired,
+    then retries the request with the new cookies.
+    :param login_guard: makes an async context manager that each login is made inside, e.g. to limit concurrent logins
+    """
+
+    requires_request_body = True
+
+    def __init__(
+        self,
+        school_id: int,
+        username: str,
+        password: str,
+        remember_me: bool = True,
+        login_guard: Optional[Callable[[], AsyncContextManager[Any]]] = None,
+        after_login: Optional[Callable[[], Any]] = None,
+    ):
+        self.school_id = school_id
+        self.username = username
+        self.password = password
+        self.remember_me = remember_me
+        self.login_guard = login_guard
+        self.after_login = after_login
+
+        self.client: Optional[httpx.AsyncClient] = None
+        self.logins = 0
+        self._lock = asyncio.Lock()
+
+    async def async_auth_flow(self, request: httpx.Request):
+        logins = self.logins
+        response = yield request
+
+        if self.client is None or not is_login_redirect(request, response):
+            return
+
+        async with self._lock:
+            # Another request may have logged in again already
+            if self.logins == logins:
+                guard = self.login_guard() if self.login_guard is not None else contextlib.nullcontext()
+                async with guard:
+                    await authenticate(
+                        self.client, self.school_id, self.username, self.password, self.remember_me
+                    )
+                self.logins += 1
+                if self.after_login is not None:
+                    self.after_login()
+
+        await response.aread()
+        request.headers.pop("Cookie", None)
+        self.client.cookies.set_cookie_header(request)
+        yield request
+
+
+def make_client(kwargs: Optional[dict] = None) -> httpx.AsyncClient:
+    """
+    Make a client for a bromcom session, with the default headers
+    """
+    if kwargs is None:
+        kwargs = {}
+    return transport.async_client(headers=commons.headers.copy(), **kwargs)
+
+
+async def authenticate(
+    rq: httpx.AsyncClient,
     school_id: int,
     username: str,
     password: str,
     remember_me: bool = True,
-    kwargs: Optional[dict] = None,
-) -> Session:
+) -> None:
     """
-    Login to bromcom with a school id, username and password.
-    :param school_id: KEGS school id (you provide it)
-    :param username: Your username
-    :param password: Your password
-    :param remember_me: Option to 'remember me.' Defaults to True
-    :return: A session representing your login
+    Submit the login form with a client, storing the login cookies in it
     """
-    if kwargs is None:
-        kwargs = {}
-    rq = httpx.AsyncClient(headers=commons.headers.copy(), **kwargs)
+    # auth=None so this is never sent through a Reauthenticate flow
     inputs = commons.eval_inputs(
-        BeautifulSoup((await rq.get("https://www.bromcomvle.com/")).text, "html.parser")
+        parsing.soup((await rq.get(LOGIN_URL, auth=None)).text, parsing.INPUTS)
     )
 
     inputs["schoolid"] = school_id
     inputs["username"] = username
     inputs["password"] = password
     inputs["rememberme"] = str(remember_me)
-    resp = await rq.post(
-        "https://www.bromcomvle.com/", data=inputs, follow_redirects=True
-    )
+    resp = await rq.post(LOGIN_URL, data=inputs, follow_redirects=True, auth=None)
 
     if resp.status_code != 200:
         if resp.status_code == 500:
@@ -460,4 +576,36 @@ async def login(
                 f"Response content: {resp.content}"
             )
 
+
+async def login(
+    school_id: int,
+    username: str,
+    password: str,
+    remember_me: bool = True,
+    kwargs: Optional[dict] = None,
+    reauthenticate: bool = False,
+) -> Session:
+    """
+    Login to bromcom with a school id, username and password.
+    :param school_id: KEGS school id (you provide it)
+    :param username: Your username
+    :param password: Your password
+    :param remember_me: Option to 'remember me.' Defaults to True
+    :param reauthenticate: Whether to log in again automatically if the session expires. This keeps the password in memory
+    :return: A session representing your login
+    """
+    rq = make_client(kwargs)
+    await authenticate(rq, school_id, username, password, remember_me)
+
+    if reauthenticate:
+        enable_reauthentication(rq, Reauthenticate(school_id, username, password, remember_me))
+
     return Session(rq=rq, username=username)
+
+
+def enable_reauthentication(rq: httpx.AsyncClient, auth: Reauthenticate):
+    """
+    Make a client log in again with `auth` when its session expires
+    """
+    auth.client = rq
+    rq.auth = auth
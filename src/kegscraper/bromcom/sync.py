@@ -0,0 +1,193 @@
+"""
+TimetableSync class, for polling a student's timetable and only reporting lessons that changed
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+
+from datetime import datetime, timedelta
+from dataclasses import dataclass, field
+from os import PathLike
+from typing_extensions import Any, AsyncIterator, Final, Literal, Optional
+
+from . import session, timetable
+
+COMPARED_FIELDS: Final = ("subject", "class_name", "room", "teacher", "teacher_id", "end")
+"""Lesson attributes that count as a change when they differ between polls"""
+_STORED_FIELDS: Final = ("period",) + COMPARED_FIELDS + ("week_id", "color", "week_a_b")
+
+Slot = tuple[datetime, Optional[str]]
+
+
+def _lesson_to_json(lesson: timetable.Lesson) -> dict[str, Any]:
+    data: dict[str, Any] = {name: getattr(lesson, name) for name in _STORED_FIELDS}
+    data["start"] = lesson.start.isoformat()
+    data["end"] = None if lesson.end is None else lesson.end.isoformat()
+    return data
+
+
+def _lesson_from_json(data: dict[str, Any], _sess: Optional[session.Session] = None) -> timetable.Lesson:
+    data = data.copy()
+    data["start"] = datetime.fromisoformat(data["start"])
+    if data["end"] is not None:
+        data["end"] = datetime.fromisoformat(data["end"])
+    return timetable.Lesson(**data, _sess=_sess)
+
+
+@dataclass
+class LessonChange:
+    """
+    A lesson that was added, removed or changed between 2 polls of a timetable
+    """
+
+    kind: Literal["added", "removed", "changed"]
+    slot: Slot
+    """The (start, period) the lesson is in"""
+    old: Optional[timetable.Lesson] = None
+    new: Optional[timetable.Lesson] = None
+
+    @property
+    def changed_fields(self) -> list[str]:
+        if self.old is None or self.new is None:
+            return []
+        return [
+            name
+            for name in COMPARED_FIELDS
+            if getattr(self.old, name) != getattr(self.new, name)
+        ]
+
+
+@dataclass
+class TimetableSync:
+    """
+    Keeps the last fetched lessons of one student's timetable, and on each poll refetches only the current and upcoming
+    weeks, reporting the lessons that were added, removed or changed (e.g. a room or teacher change).
+    Lessons are matched by their (start, period) slot.
+
+    The first poll of a new sync records the lessons without reporting anything. Likewise, as the window moves on,
+    the lessons of a week that has just come into view are recorded without being reported, as there is nothing to
+    compare them to - only the weeks covered by both polls are compared.
+    The state can be saved to/loaded from a JSON file, so a service can carry on between runs.
+    """
+
+    sess: session.Session
+    weeks_ahead: int = 2
+    """Number of weeks to sync, starting at the current week"""
+
+    lessons: dict[Slot, timetable.Lesson] = field(default_factory=dict)
+    synced_at: Optional[datetime] = None
+    synced_until: Optional[datetime] = None
+    """The end of the window fetched by the last poll"""
+
+    async def _fetch(
+        self,
+    ) -> tuple[Optional[datetime], Optional[datetime], dict[Slot, timetable.Lesson]]:
+        """
+        :return: the start of the current week, the end of the window (weeks_ahead weeks later),
+        and the lessons in between
+        """
+        week_index = await self.sess.week_index
+        weeks = week_index.weeks
+        if not weeks:
+            return None, None, {}
+
+        first = max(week_index.position(datetime.today()), 0)
+        end = min(first + self.weeks_ahead, len(weeks))
+        until = weeks[end].date if end < len(weeks) else weeks[end - 1].date + timedelta(weeks=1)
+
+        lessons = await self.sess.get_timetable_range(first, end)
+        return weeks[first].date, until, {
+            (lesson.start, lesson.period): lesson for lesson in lessons
+        }
+
+    def _previous_until(self) -> Optional[datetime]:
+        if self.synced_until is not None:
+            return self.synced_until
+        # Saved before the window end was recorded: assume it ended after the last lesson
+        if self.lessons:
+            return max(slot[0] for slot in self.lessons) + timedelta(microseconds=1)
+        return None
+
+    async def poll(self) -> list[LessonChange]:
+        """
+        Refetch the current and upcoming weeks, and update the stored lessons
+        :return: the lessons that were added, removed or changed since the last poll, in slot order
+        """
+        since, until, fetched = await self._fetch()
+        baseline = self.synced_at is None
+        previous_until = self._previous_until()
+
+        changes = []
+        if not baseline and since is not None and previous_until is not None:
+            # Only the weeks covered by both polls are compared: lessons before the current week are not refetched,
+            # so they are dropped rather than reported as removed, and lessons in newly visible weeks are new to us
+            # rather than added
+            def overlap(lessons: dict[Slot, timetable.Lesson]) -> dict[Slot, timetable.Lesson]:
+                return {slot: lesson for slot, lesson in lessons.items() if since <= slot[0] < previous_until}
+
+            previous, current = overlap(self.lessons), overlap(fetched)
+
+            for slot in sorted(previous.keys() | current.keys(), key=lambda s: (s[0], s[1] or "")):
+                old, new = previous.get(slot), current.get(slot)
+                if old is None:
+                    changes.append(LessonChange("added", slot, new=new))
+                elif new is None:
+                    changes.append(LessonChange("removed", slot, old=old))
+                else:
+                    change = LessonChange("changed", slot, old, new)
+                    if change.changed_fields:
+                        changes.append(change)
+
+        self.lessons = fetched
+        self.synced_at = datetime.now()
+        self.synced_until = until
+        return changes
+
+    async def watch(self, interval: float = 300) -> AsyncIterator[LessonChange]:
+        """
+        Poll forever, every `interval` seconds, yielding each change as it is found
+        """
+        while True:
+            for change in await self.poll():
+                yield change
+            await asyncio.sleep(interval)
+
+    def to_json(self) -> dict[str, Any]:
+        return {
+            "username": self.sess.username,
+            "synced_at": None if self.synced_at is None else self.synced_at.isoformat(),
+            "synced_until": None if self.synced_until is None else self.synced_until.isoformat(),
+            "lessons": [_lesson_to_json(lesson) for lesson in self.lessons.values()],
+        }
+
+    @classmethod
+    def from_json(cls, sess: session.Session, data: dict[str, Any], **kwargs) -> TimetableSync:
+        lessons = [_lesson_from_json(lesson_data, sess) for lesson_data in data["lessons"]]
+        synced_at = data.get("synced_at")
+        synced_until = data.get("synced_until")
+        return cls(
+            sess,
+            lessons={(lesson.start, lesson.period): lesson for lesson in lessons},
+            synced_at=None if synced_at is None else datetime.fromisoformat(synced_at),
+            synced_until=None if synced_until is None else datetime.fromisoformat(synced_until),
+            **kwargs,
+        )
+
+    def save(self, path: str | PathLike):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_json(), f)
+
+    @classmethod
+    def load(cls, sess: session.Session, path: str | PathLike, **kwargs) -> TimetableSync:
+        """
+        Load a sync saved with `save`. If the file does not exist, start a new one
+        """
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return cls(sess, **kwargs)
+
+        return cls.from_json(sess, data, **kwargs)
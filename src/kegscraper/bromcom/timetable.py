@@ -4,12 +4,12 @@ Timetable Dataclasses for bromcom
 
 from __future__ import annotations
 
+import bisect
+
 from datetime import datetime
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing_extensions import Optional
 
-from ..util import commons
-
 from . import session
 
 
@@ -25,6 +25,60 @@ class WeekDate:
     _sess: Optional[session.Session] = None
 
 
+@dataclass
+class WeekIndex:
+    """
+    Lookup of timetable weeks by date, by bisecting the (date-ordered) week start dates.
+    """
+
+    weeks: list[WeekDate]
+
+    _dates: list[datetime] = field(init=False, repr=False)
+    _positions: dict[datetime, int] = field(init=False, repr=False)
+
+    def __post_init__(self):
+        self._dates = [wdate.date for wdate in self.weeks]
+        self._positions = {wdate.date: i for i, wdate in enumerate(self.weeks)}
+
+    def next_idx(self, _dtime: datetime) -> int:
+        """
+        :return: the index of the first week starting after _dtime, or -1 if there is none
+        """
+        i = bisect.bisect_right(self._dates, _dtime)
+        return i if i < len(self._dates) else -1
+
+    def week(self, _dtime: datetime) -> WeekDate | None:
+        """
+        :return: the week containing _dtime. None if it is before the first week or after the start of the last week
+        """
+        i = self.next_idx(_dtime)
+        if i <= 0:
+            return None
+        return self.weeks[i - 1]
+
+    def position(self, _dtime: datetime) -> int:
+        """
+        :return: the index of the week containing _dtime (the last week for anything after its start), or -1 if it is before the first week
+        """
+        i = self.next_idx(_dtime)
+        if i == -1:
+            return len(self.weeks) - 1
+        return i - 1
+
+    def index(self, wdate: WeekDate) -> int:
+        """
+        :return: the index of a week in the list
+        """
+        return self._positions[wdate.date]
+
+    @staticmethod
+    def a_b(idx: int) -> str:
+        """
+        :return: 'a' or 'b' for the parity of a week index
+        """
+        return "ab"[idx % 2]
+
+
 @dataclass
 class Lesson:
     """
@@ -49,6 +103,20 @@ class Lesson:
     _sess: Optional[session.Session] = None
     week_a_b: Optional[str] = None
 
+    @property
+    def key(self) -> tuple:
+        """
+        The attributes that identify a recurring lesson (i.e. not its dates)
+        """
+        return (
+            self.period,
+            self.subject,
+            self.class_name,
+            self.room,
+            self.teacher,
+            self.teacher_id,
+        )
+
     @property
     def weekday(self):
         if self.start is None:
@@ -60,32 +128,47 @@ class Lesson:
     #     return "ba"[self.week_id % 2]
 
 
-def get_mode_timetable(_timetable: list[Lesson]) -> dict[str, dict[str, Lesson]]:
-    def find_lessons(
-        _period: Optional[str] = None, day_name: Optional[str] = None
-    ) -> list[Lesson]:
-        ret = []
-        for _lesson in _timetable:
-            if _lesson.period == _period or _period is None:
-                assert _lesson.start is not None
-                if _lesson.start.strftime("%A") == day_name or day_name is None:
-                    ret.append(_lesson)
-        return ret
+WEEKDAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday"]
 
+
+def get_mode_timetable(_timetable: list[Lesson]) -> dict[str, dict[str, Lesson]]:
+    """
+    Find the most common lesson in each period of each weekday, in one pass over the lessons.
+    :return: {weekday: {period: lesson}}, where lesson is the first lesson seen with the most common key (None if there were none)
+    """
     periods = []
     for lesson in _timetable:
         if lesson.period in periods:
             break
         periods.append(lesson.period)
 
-    weekdays = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday"]
-    result = {}
+    # slot -> lesson key -> the first lesson with that key, and its count
+    slots: dict[tuple[int, Optional[str]], dict[tuple, list]] = {}
 
-    for weekday in weekdays:
+    for lesson in _timetable:
+        if lesson.start is None:
+            continue
+
+        slot = lesson.start.weekday(), lesson.period
+        seen = slots.get(slot)
+        if seen is None:
+            seen = slots[slot] = {}
+
+        key = lesson.key
+        entry = seen.get(key)
+        if entry is None:
+            seen[key] = [lesson, 1]
+        else:
+            entry[1] += 1
+
+    result = {}
+    for day_i, weekday in enumerate(WEEKDAYS):
         result[weekday] = {}
         for period in periods:
-            lessons = find_lessons(period, weekday)
-            result[weekday][period] = commons.get_mode(lessons, no_dunder=True)
+            seen = slots.get((day_i, period))
+            # max keeps the first of any tied entries, which are in the order they were seen
+            result[weekday][period] = (
+                max(seen.values(), key=lambda entry: entry[1])[0] if seen else None
+            )
 
     return result
-
@@ -1,6 +1,13 @@
 """
 Anything to do with the IT website (KEGS IT): https://it.kegs.org.uk/
 """
-from .news import get_news_page, load_news_category, NewsItem, Category
+from .news import (
+    get_news_page,
+    get_news_item,
+    load_news_category,
+    iter_news_category,
+    NewsItem,
+    Category,
+)
 from .images import download_header, download_banner
 from .article import get_article_by_id, Article
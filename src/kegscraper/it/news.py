@@ -4,15 +4,16 @@ Get news page & load news category functions & related dataclasses
 
 from __future__ import annotations
 
+import asyncio
 from urllib.parse import parse_qs, urlparse
 
 from dataclasses import dataclass, field
 from datetime import datetime
-from typing_extensions import Optional
+from typing_extensions import AsyncIterator, Optional
 
-from bs4 import BeautifulSoup, Comment
+from bs4 import BeautifulSoup, Comment, SoupStrainer
 
-from ..util import commons, exceptions
+from ..util import commons, exceptions, paginator, parsing
 
 
 @dataclass
@@ -41,40 +42,46 @@ class NewsItem:
     category: Optional[Category] = None
 
 
-async def get_news_page(page: int = 1, category: int | Category = 7) -> NewsItem:
+async def _get_listing_ids(category: int, page: int) -> list[int]:
     """
-    Get the news item at the specified page index
-    :param category: Category of news
-    :param page: Page index
-    :return: The news item
+    Get the ids of the news items listed on a page of a category
     """
-    if isinstance(category, Category):
-        category = category.id
-
-    # Find the page corresponding to the category & post
     resp = await commons.REQ.get(
-        f"https://it.kegs.org.uk/", params={"cat": category, "paged": page}
+        "https://it.kegs.org.uk/", params={"cat": category, "paged": page}
     )
 
     if resp.status_code == 404:
-        raise exceptions.NotFound(f"Could not find news page. Content: {resp.content}")
+        return []
 
-    soup = BeautifulSoup(resp.text, "html.parser")
+    soup = parsing.soup(resp.text, SoupStrainer("a", {"rel": "bookmark"}))
 
-    anchor = soup.find("a", {"rel": "bookmark"})
-    assert anchor is not None
+    ids = []
+    for anchor in soup.find_all("a", {"rel": "bookmark"}):
+        qparse = parse_qs(urlparse(anchor.attrs.get("href")).query)
+        if "p" in qparse:
+            news_id = int(qparse["p"][0])
+            if news_id not in ids:
+                ids.append(news_id)
 
-    url = anchor.attrs.get("href")
-    qparse = parse_qs(urlparse(url).query)
+    return ids
 
-    news_id = int(qparse["p"][0])
 
-    # Actually scrape the main page for this news item
+async def get_news_item(news_id: int, category: int | Category = 7) -> NewsItem:
+    """
+    Get a news item by its id
+    :param news_id: The news item (post) id
+    :param category: Category of the news item
+    :return: The news item
+    """
+    if isinstance(category, Category):
+        category = category.id
+
     resp = await commons.REQ.get("https://it.kegs.org.uk/", params={"p": news_id})
-    soup = BeautifulSoup(resp.text, "html.parser")
+    soup = parsing.soup(resp.text)
 
     title_elem = soup.find("div", {"class": "singlepage"})
-    assert title_elem is not None
+    if title_elem is None:
+        raise exceptions.NotFound(f"News item {news_id} probably doesn't exist.")
     title = title_elem.text
 
     date_elem = soup.find("abbr")
@@ -107,23 +114,135 @@ async def get_news_page(page: int = 1, category: int | Category = 7) -> NewsItem
     return NewsItem(news_id, author, title, content, date, category_obj)
 
 
-def load_news_category(
-    category: int | Category = 7, *, limit: int = 10, offset: int = 0
+async def get_news_page(page: int = 1, category: int | Category = 7) -> NewsItem:
+    """
+    Get the news item at the specified page index
+    :param category: Category of news
+    :param page: Page index
+    :return: The news item
+    """
+    if isinstance(category, Category):
+        category = category.id
+
+    # Find the page corresponding to the category & post
+    ids = await _get_listing_ids(category, page)
+    if not ids:
+        raise exceptions.NotFound(f"Could not find news page {page} of category {category}")
+
+    # Actually scrape the main page for this news item
+    return await get_news_item(ids[0], category)
+
+
+def _news_ids(
+    category: int, first_page: list[int], limit: Optional[int], offset: int, concurrency: int
+) -> paginator.Paginator[int]:
+    """
+    Stream the news item ids of a category. Each listing page may list several items, so this takes few requests
+    :param first_page: the ids on the first listing page, which tell how many items there are per page
+    """
+
+    async def fetch_page(page: int) -> list[int]:
+        if page == 1:
+            return first_page
+        return await _get_listing_ids(category, page)
+
+    return paginator.Paginator(
+        fetch_page,
+        limit=limit,
+        offset=offset,
+        items_per_page=max(len(first_page), 1),
+        starting_page=1,
+        prefetch=concurrency,
+        stop_on_short_page=True,
+    )
+
+
+async def iter_news_category(
+    category: int | Category = 7,
+    *,
+    limit: Optional[int] = None,
+    offset: int = 0,
+    concurrency: int = 8,
+) -> AsyncIterator[NewsItem]:
+    """
+    Stream the news items of a category, fetching up to `concurrency` posts at once.
+    Items are yielded as soon as they are fetched, so they may be out of order.
+    :param category: Category of news data to scrape. Defaults to the 'news' category
+    :param limit: # of Posts to scrape. None for the whole category
+    :param offset: Starting post index
+    :param concurrency: Max number of requests in flight
+    """
+    if isinstance(category, Category):
+        category = category.id
+
+    ids = _news_ids(category, await _get_listing_ids(category, 1), limit, offset, concurrency)
+
+    # A fetch holds its slot until its item is taken by the queue, so when the consumer is slow,
+    # at most `concurrency` items are fetched ahead of it
+    semaphore = asyncio.Semaphore(concurrency)
+    results: asyncio.Queue[NewsItem | BaseException | None] = asyncio.Queue(maxsize=concurrency)
+    tasks: set[asyncio.Future] = set()
+
+    async def fetch_item(news_id: int):
+        try:
+            try:
+                result = await get_news_item(news_id, category)
+            except Exception as e:
+                result = e
+            await results.put(result)
+        finally:
+            semaphore.release()
+
+    async def discover():
+        try:
+            async for news_id in ids:
+                await semaphore.acquire()
+                task = asyncio.ensure_future(fetch_item(news_id))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            await asyncio.gather(*tasks)
+        except Exception as e:
+            await results.put(e)
+
+        await results.put(None)
+
+    discoverer = asyncio.ensure_future(discover())
+    try:
+        while (result := await results.get()) is not None:
+            if isinstance(result, BaseException):
+                raise result
+            yield result
+    finally:
+        pending = [discoverer, *tasks]
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+
+async def load_news_category(
+    category: int | Category = 7,
+    *,
+    limit: int = 10,
+    offset: int = 0,
+    concurrency: int = 8,
 ) -> list[NewsItem]:
     """
     Make mutliple requests to kegsIT to load an entire category of news data with a given offset and limit
     :param category: Category of news data to scrape. Defaults to the 'news' category
     :param limit: # of Posts to scrape
     :param offset: Starting post index
-    :return: A list of posts aka news items
+    :param concurrency: Max number of posts to fetch at once
+    :return: A list of posts aka news items, in order
     """
-    pages = []
-    for page in commons.generate_page_range(limit, offset, 1, 1)[0]:
-        # print(page)
-        try:
-            pages.append(get_news_page(page, category))
+    if isinstance(category, Category):
+        category = category.id
+
+    first_page = await _get_listing_ids(category, 1)
+    ids = await _news_ids(category, first_page, limit, offset, concurrency).collect()
+    semaphore = asyncio.Semaphore(concurrency)
 
-        except exceptions.NotFound:
-            break
+    async def fetch_item(news_id: int) -> NewsItem:
+        async with semaphore:
+            return await get_news_item(news_id, category)
 
-    return pages
+    return list(await asyncio.gather(*(fetch_item(news_id) for news_id in ids)))
@@ -7,12 +7,11 @@ from dataclasses import dataclass, field
 from datetime import datetime
 from urllib.parse import urlparse, urlunparse
 
-import dateparser
 from bs4 import BeautifulSoup
 
 from . import session, course
 
-from ..util import commons
+from ..util import commons, dates, parsing
 
 
 @dataclass
@@ -57,7 +56,7 @@ class DigitalBook:
             not isinstance(self.subs_end_date, datetime)
             and self.subs_end_date is not None
         ):
-            dt = dateparser.parse(str(self.subs_end_date))
+            dt = dates.parse_date(str(self.subs_end_date))
             if dt is not None:
                 self.subs_end_date = dt
 
@@ -72,7 +71,7 @@ class DigitalBook:
     @property
     async def _interactive_html_data(self) -> dict | None:
         resp = await self._sess.rq.get(self.url)
-        soup = BeautifulSoup(resp.text, "html.parser")
+        soup = parsing.soup(resp.text, parsing.SCRIPTS)
 
         data = None
         to_find = "\n//<![CDATA[\n        window.authorAPI.setup("
@@ -3,12 +3,12 @@ from __future__ import annotations
 import warnings
 import httpx
 
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
 from dataclasses import dataclass, field
 from typing_extensions import Optional
 
 from . import course
-from ..util import commons
+from ..util import commons, parsing, transport
 
 
 @dataclass
@@ -75,7 +75,7 @@ class Session:
     async def logout(self):
         """Send a logout request to kerboodle. Might not have any effect"""
         resp = await self.rq.get("https://www.kerboodle.com/app")
-        soup = BeautifulSoup(resp.text, "html.parser")
+        soup = parsing.soup(resp.text, SoupStrainer("meta", {"name": "csrf-token"}))
 
         csrf_token_tag = soup.find("meta", {"name": "csrf-token"})
         resp = await self.rq.post(
@@ -90,13 +90,19 @@ class Session:
 
         print(f"Logged out with status code {resp.status_code}")
 
+    async def aclose(self):
+        """
+        Close this session's client. The shared connection pool stays open for other sessions.
+        """
+        await self.rq.aclose()
+
 
 async def login(
     institution_code: str, username: str, password: str, auto_update: bool = True
 ) -> Session:
-    rq = httpx.AsyncClient()
+    rq = transport.async_client()
     resp = await rq.get("https://www.kerboodle.com/users/login")
-    soup = BeautifulSoup(resp.text, "html.parser")
+    soup = parsing.soup(resp.text, parsing.INPUTS)
 
     qs = commons.eval_inputs(soup)
 
@@ -6,6 +6,7 @@ from dataclasses import dataclass
 from cryptography.hazmat.primitives.asymmetric import rsa, padding
 
 from kegscraper.util.commons import eval_inputs, consume_json
+from kegscraper.util import transport
 
 @dataclass
 class Session:
@@ -14,7 +15,7 @@ class Session:
        
 
 def login(username: str, password: str):
-    client = httpx.Client(
+    client = transport.client(
         headers={}  # add user agent here if you want
     )
 
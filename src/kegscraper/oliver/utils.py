@@ -9,7 +9,7 @@ def api_fetch(url: str, rq: httpx.Client):
 
     url = f"https://kegs.oliverasp.co.uk/library/home/api/{url}"
     # For some reason it seems that it provides us with some query params then redirects us
-    text = commons.REQ.get(url).text
+    text = rq.get(url).text
     soup = BeautifulSoup(text, "html.parser")
 
     qs = {}
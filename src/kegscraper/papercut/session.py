@@ -2,14 +2,13 @@ from __future__ import annotations
 
 import mimetypes
 
-import dateparser
 import requests
 from bs4 import BeautifulSoup
 from datetime import datetime
 
 from dataclasses import dataclass
 
-from ..util import commons
+from ..util import commons, dates, parsing, transport
 
 from . import org
 
@@ -38,7 +37,7 @@ class Session:
         """
         response = self.rq.get(f"http://printing.kegs.local:9191/environment/dashboard/{self.username}")
 
-        self.update_by_env_dash_html(BeautifulSoup(response.text, "html.parser"))
+        self.update_by_env_dash_html(parsing.soup(response.text))
 
     def logout(self):
         """
@@ -51,7 +50,7 @@ class Session:
         Reassign session attributes by making a request to the main dashboard
         """
         resp = self.rq.get("http://printing.kegs.local:9191/app?service=page/UserSummary")
-        self.update_by_dash_html(BeautifulSoup(resp.text, "html.parser"))
+        self.update_by_dash_html(parsing.soup(resp.text))
 
     def __post_init__(self):
         self.organisation = org.Organisation(sess=self)
@@ -95,7 +94,7 @@ class Session:
                     elif stat.endswith(" bulb hours"):
                         self.organisation.energy = 60 * 60 * 60 * int(stat.replace(',', '').split()[0])
                     elif stat.startswith("Since\n"):
-                        self.organisation.since = dateparser.parse(stat[len("Since\n"):])
+                        self.organisation.since = dates.parse_date(stat[len("Since\n"):])
 
     def update_by_dash_html(self, soup: BeautifulSoup):
         """
@@ -132,7 +131,7 @@ class Session:
                     self.energy = val
                 case "since-date":
                     val = val.replace("Since", '').strip()
-                    self.since = dateparser.parse(val)
+                    self.since = dates.parse_date(val)
 
     def get_balance_graph(self, width: int=668, height: int=400) -> tuple[str, bytes]:
         resp = self.rq.get(f"http://printing.kegs.local:9191/app?service=chart/UserSummary/{width}/{height}/$Chart")
@@ -148,7 +147,7 @@ def login(username: str, password: str) -> Session:
     :param password:
     :return: A session object
     """
-    sess = requests.Session()
+    sess = transport.requests_session()
 
     # Make an initial request (to set cookies)
     sess.get("http://printing.kegs.local:9191/user")
@@ -187,6 +186,6 @@ def login(username: str, password: str) -> Session:
 
     ret = Session(rq=sess, username=username)
     # Since we receive the html of the main dashboard as the response content, we might as well parse it
-    ret.update_by_dash_html(BeautifulSoup(resp.text, "html.parser"))
+    ret.update_by_dash_html(parsing.soup(resp.text))
 
     return ret
@@ -0,0 +1,417 @@
+"""
+Persistent (SQLite) HTTP response cache, used beneath the shared transport. Enable it with transport.enable_cache()
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+from email.utils import parsedate_to_datetime
+from os import PathLike
+from pathlib import Path
+from typing import Any, AsyncIterator, Awaitable, Callable, Iterator, Optional
+
+import httpx
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    status INTEGER NOT NULL,
+    headers TEXT NOT NULL,
+    content BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    expires REAL NOT NULL,
+    accessed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed);
+"""
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    """Responses served from the cache (including ones revalidated with a 304)"""
+    misses: int = 0
+    revalidations: int = 0
+    """Conditional requests answered with 304 Not Modified"""
+    stores: int = 0
+    evictions: int = 0
+
+
+@dataclass
+class _Entry:
+    status: int
+    headers: list[tuple[str, str]]
+    content: bytes
+    expires: float
+
+    def to_response(self) -> httpx.Response:
+        return httpx.Response(
+            self.status, headers=self.headers, stream=httpx.ByteStream(self.content)
+        )
+
+
+class _Tee:
+    """
+    Collects the chunks of a response as they are read, and calls `store` with them if the whole body was read.
+    Bodies larger than `max_bytes` are dropped, as they would be evicted straight away
+    """
+
+    def __init__(self, store: Callable[[bytes], Any], max_bytes: int):
+        self._store = store
+        self._max_bytes = max_bytes
+        self._chunks: Optional[list[bytes]] = []
+        self._size = 0
+
+    def add(self, chunk: bytes):
+        if self._chunks is None:
+            return
+
+        self._size += len(chunk)
+        if self._size > self._max_bytes:
+            self._chunks = None
+        else:
+            self._chunks.append(chunk)
+
+    def finish(self):
+        if self._chunks is not None:
+            chunks, self._chunks = self._chunks, None
+            self._store(b"".join(chunks))
+
+
+class _AsyncTeeStream(httpx.AsyncByteStream):
+    def __init__(self, stream: httpx.AsyncByteStream, store: Callable[[bytes], Any], max_bytes: int):
+        self._stream = stream
+        self._tee = _Tee(store, max_bytes)
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        # Raw (still content-encoded) bytes are stored, as the headers are stored too
+        async for chunk in self._stream:
+            self._tee.add(chunk)
+            yield chunk
+        await asyncio.to_thread(self._tee.finish)
+
+    async def aclose(self) -> None:
+        await self._stream.aclose()
+
+
+class _TeeStream(httpx.SyncByteStream):
+    def __init__(self, stream: httpx.SyncByteStream, store: Callable[[bytes], Any], max_bytes: int):
+        self._stream = stream
+        self._tee = _Tee(store, max_bytes)
+
+    def __iter__(self) -> Iterator[bytes]:
+        for chunk in self._stream:
+            self._tee.add(chunk)
+            yield chunk
+        self._tee.finish()
+
+    def close(self) -> None:
+        self._stream.close()
+
+
+def default_path() -> Path:
+    """
+    Where the cache is kept by default: in the user's cache directory, rather than the working directory
+    """
+    if os.name == "nt":
+        base = Path(os.environ.get("LOCALAPPDATA") or Path.home() / "AppData" / "Local")
+    else:
+        base = Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache")
+    return base / "kegscraper" / "http_cache.sqlite"
+
+
+@dataclass
+class HTTPCache:
+    """
+    An SQLite-backed cache for GET responses.
+
+    Entries are keyed by method, url (including query params) and the session identity (the cookies sent),
+    so sessions never see each other's pages.
+    Cache-Control, Expires, ETag and Last-Modified are honoured. Stale entries with an ETag/Last-Modified are revalidated
+    with a conditional request.
+    Most pages behind a login are sent with 'Cache-Control: no-store', so `ttl_overrides` can be used to cache them anyway:
+    it maps url regexes to a number of seconds to treat matching responses as fresh for, regardless of their headers.
+    When the cache is larger than `max_bytes`, least recently used entries are evicted.
+    Responses still stream to the caller: a response is stored once it has been read to the end, and responses
+    that can't be stored are passed through untouched.
+    The cache holds logged-in pages, so its file is only readable by its owner. On the async path, the database
+    is used from a worker thread, so lookups and stores don't block the event loop.
+    """
+
+    path: Optional[str | PathLike] = None
+    """The SQLite file. None for default_path()"""
+    max_bytes: int = 64 * 1024 * 1024
+    default_ttl: Optional[float] = None
+    """Seconds to keep responses that have no caching headers for. None to not store them"""
+    ttl_overrides: dict[str, float] = field(default_factory=dict)
+
+    stats: CacheStats = field(default_factory=CacheStats)
+
+    _db: sqlite3.Connection = field(init=False, repr=False)
+    _lock: threading.Lock = field(init=False, repr=False, default_factory=threading.Lock)
+    _overrides: list[tuple[re.Pattern, float]] = field(init=False, repr=False)
+    _total: int = field(init=False, repr=False)
+    """Running total of the stored content size, so storing doesn't need to sum the table"""
+
+    def __post_init__(self):
+        path = Path(self.path if self.path is not None else default_path())
+        path.parent.mkdir(parents=True, exist_ok=True, mode=0o700)
+        # Create the file owner-only before sqlite opens it. The mode is only used on creation, so also tighten old files
+        os.close(os.open(path, os.O_RDWR | os.O_CREAT, 0o600))
+        os.chmod(path, 0o600)
+
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript(_SCHEMA)
+        self._overrides = [
+            (re.compile(pattern), ttl) for pattern, ttl in self.ttl_overrides.items()
+        ]
+        self._total = self._db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()[0]
+
+    # --- Keys and freshness ---
+    @staticmethod
+    def key(request: httpx.Request) -> str:
+        identity = "\n".join(
+            ";".join(request.headers.get_list(name))
+            for name in ("cookie", "authorization")
+        )
+        return hashlib.sha256(
+            f"{request.method} {request.url}\n{identity}".encode()
+        ).hexdigest()
+
+    def _override_ttl(self, url: str) -> Optional[float]:
+        for pattern, ttl in self._overrides:
+            if pattern.search(url):
+                return ttl
+        return None
+
+    def _expiry(self, url: str, response: httpx.Response, now: float) -> Optional[float]:
+        """:return: when a response stops being fresh, or None if it shouldn't be stored"""
+        override = self._override_ttl(url)
+        if override is not None:
+            return now + override
+
+        directives = {}
+        for directive in response.headers.get("cache-control", "").split(","):
+            name, _, value = directive.strip().partition("=")
+            directives[name.lower()] = value.strip('"')
+
+        if "no-store" in directives:
+            return None
+        if "no-cache" in directives:
+            return now
+
+        if "max-age" in directives:
+            try:
+                return now + int(directives["max-age"])
+            except ValueError:
+                return now
+
+        if "expires" in response.headers:
+            try:
+                return parsedate_to_datetime(response.headers["expires"]).timestamp()
+            except (TypeError, ValueError):
+                return now
+
+        if "etag" in response.headers or "last-modified" in response.headers:
+            # Can't be used without asking the server, but saves the download if it hasn't changed
+            return now
+
+        if self.default_ttl is not None:
+            return now + self.default_ttl
+        return None
+
+    # --- Storage ---
+    def _lookup(self, key: str) -> Optional[_Entry]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT status, headers, content, expires FROM responses WHERE key = ?",
+                (key,),
+            ).fetchone()
+            if row is None:
+                return None
+
+            self._db.execute(
+                "UPDATE responses SET accessed = ? WHERE key = ?", (time.time(), key)
+            )
+            self._db.commit()
+
+        status, headers, content, expires = row
+        return _Entry(status, [tuple(h) for h in json.loads(headers)], content, expires)
+
+    def _store(self, key: str, url: str, entry: _Entry):
+        headers = [(k, v) for k, v in entry.headers if k.lower() != "set-cookie"]
+
+        with self._lock:
+            old = self._db.execute(
+                "SELECT size FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    key,
+                    url,
+                    entry.status,
+                    json.dumps(headers),
+                    entry.content,
+                    len(entry.content),
+                    entry.expires,
+                    time.time(),
+                ),
+            )
+            self._total += len(entry.content) - (old[0] if old else 0)
+            self._evict()
+            self._db.commit()
+        self.stats.stores += 1
+
+    def _set_expiry(self, key: str, expires: float):
+        with self._lock:
+            self._db.execute(
+                "UPDATE responses SET expires = ? WHERE key = ?", (expires, key)
+            )
+            self._db.commit()
+
+    def _evict(self):
+        """Remove least recently used entries until the cache fits in max_bytes. Must hold the lock"""
+        if self._total <= self.max_bytes:
+            return
+
+        for key, size in self._db.execute(
+            "SELECT key, size FROM responses ORDER BY accessed"
+        ).fetchall():
+            self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self.stats.evictions += 1
+            self._total -= size
+            if self._total <= self.max_bytes:
+                break
+
+    @property
+    def size(self) -> int:
+        """Total size of the cached content in bytes"""
+        with self._lock:
+            return self._total
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM responses")
+            self._db.commit()
+            self._total = 0
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    # --- Request handling ---
+    def _prepare(self, request: httpx.Request) -> tuple[Optional[str], Optional[_Entry]]:
+        """
+        :return: the key (None if the request can't be cached) and the stored entry, if there is one.
+        If the entry is stale, conditional headers are added to the request.
+        """
+        if request.method != "GET":
+            return None, None
+
+        key = self.key(request)
+        entry = self._lookup(key)
+        if entry is None or entry.expires > time.time():
+            return key, entry
+
+        headers = dict((k.lower(), v) for k, v in entry.headers)
+        if "etag" in headers:
+            request.headers["If-None-Match"] = headers["etag"]
+        if "last-modified" in headers:
+            request.headers["If-Modified-Since"] = headers["last-modified"]
+        return key, entry
+
+    def _not_modified(self, key: str, url: str, entry: _Entry, response: httpx.Response) -> httpx.Response:
+        expires = self._expiry(url, response, time.time())
+        self._set_expiry(key, expires if expires is not None else time.time())
+        self.stats.hits += 1
+        self.stats.revalidations += 1
+        return entry.to_response()
+
+    def _tee(self, key: str, url: str, response: httpx.Response, is_async: bool) -> httpx.Response:
+        """
+        Pass a fresh 200 response through, storing it once the consumer has read all of it (if it can be stored).
+        Responses that can't be stored are returned untouched, so they still stream without being buffered
+        """
+        expires = self._expiry(url, response, time.time())
+        if expires is None:
+            return response
+
+        def store(content: bytes):
+            self._store(
+                key, url, _Entry(response.status_code, response.headers.multi_items(), content, expires)
+            )
+
+        if is_async:
+            assert isinstance(response.stream, httpx.AsyncByteStream)
+            response.stream = _AsyncTeeStream(response.stream, store, self.max_bytes)
+        else:
+            assert isinstance(response.stream, httpx.SyncByteStream)
+            response.stream = _TeeStream(response.stream, store, self.max_bytes)
+        return response
+
+    async def handle_async_request(
+        self,
+        request: httpx.Request,
+        send: Callable[[httpx.Request], Awaitable[httpx.Response]],
+    ) -> httpx.Response:
+        """
+        Answer a request from the cache, or with `send` (storing the response if possible).
+        The database is used in a worker thread, so the event loop isn't blocked
+        """
+        key, entry = await asyncio.to_thread(self._prepare, request)
+        if key is None:
+            return await send(request)
+
+        if entry is not None and entry.expires > time.time():
+            self.stats.hits += 1
+            return entry.to_response()
+
+        response = await send(request)
+        url = str(request.url)
+
+        if entry is not None and response.status_code == 304:
+            await response.aclose()
+            return await asyncio.to_thread(self._not_modified, key, url, entry, response)
+
+        self.stats.misses += 1
+        if response.status_code != 200:
+            return response
+        return self._tee(key, url, response, True)
+
+    def handle_request(
+        self,
+        request: httpx.Request,
+        send: Callable[[httpx.Request], httpx.Response],
+    ) -> httpx.Response:
+        """Sync version of handle_async_request"""
+        key, entry = self._prepare(request)
+        if key is None:
+            return send(request)
+
+        if entry is not None and entry.expires > time.time():
+            self.stats.hits += 1
+            return entry.to_response()
+
+        response = send(request)
+        url = str(request.url)
+
+        if entry is not None and response.status_code == 304:
+            response.close()
+            return self._not_modified(key, url, entry, response)
+
+        self.stats.misses += 1
+        if response.status_code != 200:
+            return response
+        return self._tee(key, url, response, False)
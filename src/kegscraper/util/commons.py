@@ -10,6 +10,7 @@ import httpx
 import string
 import warnings
 import copy
+from collections import Counter
 from datetime import datetime
 from typing import Any, Final, TypeVar
 from inspect import signature
@@ -17,9 +18,9 @@ from inspect import signature
 import httpx
 from bs4 import BeautifulSoup
 
-from . import exceptions
+from . import exceptions, transport
 
-REQ: Final[httpx.AsyncClient] = httpx.AsyncClient()
+REQ: Final[httpx.AsyncClient] = transport.async_client()
 T = TypeVar("T")
 
 DIGITS: Final = tuple("0123456789")
@@ -54,59 +55,31 @@ def webscrape_section(
     return cls(section)
 
 
-def _read_json_number(_string: str) -> float | int:
-    ret = ""
+_JSON_DECODER: Final = json.JSONDecoder()
 
-    minus = _string[0] == "-"
-    if minus:
-        ret += "-"
-        _string = _string[1:]
 
-    def read_fraction(sub: str):
-        sub_ret = ""
-        if sub[0] == ".":
-            sub_ret += "."
-            sub = sub[1:]
-            while sub[0] in DIGITS:
-                sub_ret += sub[0]
-                sub = sub[1:]
-
-        return sub_ret, sub
-
-    def read_exponent(sub: str):
-        sub_ret = ""
-        if sub[0].lower() == "e":
-            sub_ret += sub[0]
-            sub = sub[1:]
-
-            if sub[0] in "-+":
-                sub_ret += sub[0]
-                sub = sub[1:]
-
-            if sub[0] not in DIGITS:
-                raise exceptions.UnclosedJSONError(f"Invalid exponent {sub}")
-
-            while sub[0] in DIGITS:
-                sub_ret += sub[0]
-                sub = sub[1:]
-
-        return sub_ret
-
-    if _string[0] == "0":
-        ret += "0"
-        _string = _string[1:]
-
-    elif _string[0] in DIGITS[1:9]:
-        while _string[0] in DIGITS:
-            ret += _string[0]
-            _string = _string[1:]
-
-    frac, _string = read_fraction(_string)
-    ret += frac
+def scan_json(
+    _string: str, i: int = 0
+) -> tuple[str | float | int | dict | list | bool | None, int]:
+    """
+    Reads a JSON value starting at index `i` of a string and stops at its natural end
+    (i.e. when brackets close, or when quotes end, etc.). Leading whitespace is skipped.
+    :return: the value, and the index just after the end of the value
+    """
+    # raw_decode scans from i in place, so this is linear in the length of the value
+    while i < len(_string) and _string[i] in " \t\n\r":
+        i += 1
 
-    ret += read_exponent(_string)
+    try:
+        return _JSON_DECODER.raw_decode(_string, i)
+    except json.JSONDecodeError as e:
+        if e.pos >= len(_string) or e.msg.startswith("Unterminated string"):
+            raise exceptions.UnclosedJSONError(
+                f"Unclosed JSON string, read {_string[i:i + 100]!r}..."
+            ) from e
 
-    return json.loads(ret)
+        warnings.warn(f"Failed to decode: {_string[i:e.pos + 1]!r}")
+        raise e
 
 
 def consume_json(
@@ -115,50 +88,7 @@ def consume_json(
     """
     Reads a JSON string and stops at the natural end (i.e. when brackets close, or when quotes end, etc.)
     """
-    # Named by ChatGPT
-    section = _string[i:]
-    if section.startswith("true"):
-        return True
-    elif section.startswith("false"):
-        return False
-    elif section.startswith("null"):
-        return None
-    elif section[0] in "0123456789.-":
-        return _read_json_number(section)
-
-    depth = 0
-    json_text = ""
-    out_string = True
-
-    for char in section:
-        json_text += char
-
-        if char == '"':
-            if len(json_text) > 1:
-                unescaped = json_text[-2] != "\\"
-            else:
-                unescaped = True
-            if unescaped:
-                out_string ^= True
-                if out_string:
-                    depth -= 1
-                else:
-                    depth += 1
-
-        if out_string:
-            if char in "[{":
-                depth += 1
-            elif char in "}]":
-                depth -= 1
-
-        if depth == 0 and json_text.strip():
-            try:
-                return json.loads(json_text.strip())
-            except Exception as e:
-                warnings.warn(f"Failed to decode: {json_text.strip()!r}")
-                raise e
-
-    raise exceptions.UnclosedJSONError(f"Unclosed JSON string, read {json_text}")
+    return scan_json(_string, i)[0]
 
 
 def generate_page_range(
@@ -238,23 +168,28 @@ def get_mode_attr(attr: str, objs: list[Any]) -> tuple[bool, Any]:
     :param objs: object list with attribute `attr`
     :return: success bool, then mode value
     """
-    counts = []
-    for obj in objs:
-        if hasattr(obj, attr):
-            this_value = getattr(obj, attr)
-
-            for i, (value, count) in enumerate(counts):
-                if value == this_value:
-                    counts[i][1] += 1
-                    break
-            else:
-                counts.append([this_value, 1])
-
-    if counts:
-        return True, max(counts, key=lambda x: x[1])[0]
-    else:
+    values = [getattr(obj, attr) for obj in objs if hasattr(obj, attr)]
+    if not values:
         return False, None
 
+    try:
+        # Ties go to the value seen first, as below
+        return True, Counter(values).most_common(1)[0][0]
+    except TypeError:
+        # Unhashable values
+        pass
+
+    counts = []
+    for this_value in values:
+        for i, (value, count) in enumerate(counts):
+            if value == this_value:
+                counts[i][1] += 1
+                break
+        else:
+            counts.append([this_value, 1])
+
+    return True, max(counts, key=lambda x: x[1])[0]
+
 
 def get_mode(objs: list[Any], no_dunder: bool = False):
     """
@@ -0,0 +1,79 @@
+"""
+Date parsing shared by the scrapers: fast paths for the fixed formats the sites use, with dateparser as the fallback
+"""
+
+from __future__ import annotations
+
+import functools
+import re
+
+from datetime import datetime
+from typing import Final, Optional
+
+import dateparser
+
+_ISO: Final = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+# Moodle userdate formats, e.g. 'Monday, 1 January 2024, 10:00 AM', and .NET style dates (month first, as dateparser reads them)
+FIXED_FORMATS: Final = (
+    "%A, %d %B %Y, %I:%M %p",
+    "%A, %d %B %Y, %H:%M",
+    "%A, %d %B %Y",
+    "%d %B %Y, %I:%M %p",
+    "%d %B %Y, %H:%M",
+    "%d %B %Y",
+    "%d %b %Y",
+    "%m/%d/%Y %I:%M:%S %p",
+    "%m/%d/%Y",
+)
+
+
+def parse_fixed(text: str) -> Optional[datetime]:
+    """
+    Parse a date in one of the known fixed formats (ISO 8601, or FIXED_FORMATS)
+    :return: the datetime, or None if it isn't in a known format
+    """
+    if _ISO.match(text):
+        try:
+            return datetime.fromisoformat(text.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+
+    for fmt in FIXED_FORMATS:
+        try:
+            return datetime.strptime(text, fmt)
+        except ValueError:
+            continue
+    return None
+
+
+@functools.lru_cache(maxsize=4096)
+def _parse_fixed_cached(text: str) -> Optional[datetime]:
+    # The fixed formats are fully specified, so the result only depends on the text
+    return parse_fixed(text)
+
+
+def parse_date(text: Optional[str]) -> Optional[datetime]:
+    """
+    Parse a date string like dateparser.parse, but quickly for the known fixed formats, which are memoised.
+    Other strings are parsed by dateparser every time, as its result can depend on the current date
+    (e.g. 'yesterday', or 'Monday 2024').
+    :return: the datetime, or None if it could not be parsed
+    """
+    if text is None:
+        return None
+
+    text = " ".join(text.split())
+    if not text:
+        return None
+
+    return _parse_fixed_cached(text) or dateparser.parse(text)
+
+
+def cache_info():
+    """The hit/miss stats of the parse_date memo"""
+    return _parse_fixed_cached.cache_info()
+
+
+def clear_cache():
+    _parse_fixed_cached.cache_clear()
@@ -1,4 +1,6 @@
 """Exceptions for the kegscraping package"""
+from __future__ import annotations
+
 
 class UnclosedJSONError(Exception):
     """
@@ -25,4 +27,10 @@ class UnimplementedWarning(Warning):
     pass
 
 class WebServiceError(Exception):
-    pass
\ No newline at end of file
+    """
+    Raised when a moodle webservice call reports an error.
+    `errorcode` is moodle's error code (e.g. 'invalidsesskey') if it was given.
+    """
+    def __init__(self, message: str = "", errorcode: str | None = None):
+        super().__init__(message)
+        self.errorcode = errorcode
@@ -0,0 +1,106 @@
+"""
+Paginator class, for streaming items out of paged listings
+"""
+
+from __future__ import annotations
+
+import asyncio
+import itertools
+from collections import deque
+from dataclasses import dataclass
+from typing import AsyncIterator, Awaitable, Callable, Generic, Iterator, Optional, TypeVar
+
+from . import commons
+
+T = TypeVar("T")
+
+
+@dataclass
+class Paginator(Generic[T]):
+    """
+    Async iterator over exactly the items [offset, offset + limit) of a paged listing.
+
+    Pages are requested with `fetch_page(page_number)`, keeping up to `prefetch` pages in flight ahead of the consumer,
+    so items are streamed without the whole listing having to be held in memory.
+    Iteration stops early at the first empty page.
+
+    e.g.:
+    async for entry in Paginator(fetch_page, limit=50, offset=5, items_per_page=10):
+        ...
+    """
+
+    fetch_page: Callable[[int], Awaitable[list[T]]]
+
+    limit: Optional[int] = 10
+    """Number of items to yield. None to carry on until an empty page"""
+    offset: int = 0
+    items_per_page: int = 10
+    starting_page: int = 1
+    """Page number of the page with index 0"""
+
+    prefetch: int = 4
+    """Max number of pages requested at once"""
+    stop_on_short_page: bool = False
+    """Whether a page with fewer than items_per_page items should be treated as the last page"""
+
+    def _pages(self) -> tuple[Iterator[int], int]:
+        """:return: the page numbers to fetch, and the number of items to skip on the first page"""
+        if self.limit is None:
+            if self.offset < 0:
+                raise ValueError(f"offset {self.offset!r} < 0")
+
+            first = self.starting_page + self.offset // self.items_per_page
+            return itertools.count(first), self.offset % self.items_per_page
+
+        page_range, start_idxs = commons.generate_page_range(
+            self.limit, self.offset, self.items_per_page, self.starting_page
+        )
+        if not start_idxs:
+            return iter(()), 0
+
+        return iter(page_range), self.offset - start_idxs[0]
+
+    async def __aiter__(self) -> AsyncIterator[T]:
+        pages, skip = self._pages()
+        remaining = self.limit
+
+        queue: deque[asyncio.Future[list[T]]] = deque()
+
+        def fill():
+            while len(queue) < max(self.prefetch, 1):
+                page = next(pages, None)
+                if page is None:
+                    break
+                queue.append(asyncio.ensure_future(self.fetch_page(page)))
+
+        try:
+            fill()
+            while queue and (remaining is None or remaining > 0):
+                items = await queue.popleft()
+                fill()
+
+                if not items:
+                    return
+
+                is_short = len(items) < self.items_per_page
+
+                end = None if remaining is None else skip + remaining
+                items = items[skip:end]
+                skip = 0
+
+                for item in items:
+                    if remaining is not None:
+                        remaining -= 1
+                    yield item
+
+                if is_short and self.stop_on_short_page:
+                    return
+        finally:
+            for future in queue:
+                future.cancel()
+            if queue:
+                await asyncio.gather(*queue, return_exceptions=True)
+
+    async def collect(self) -> list[T]:
+        """Fetch all the items into a list"""
+        return [item async for item in self]
@@ -0,0 +1,83 @@
+"""
+HTML parsing with a choice of BeautifulSoup backend, and strainers for building only part of a page
+"""
+
+from __future__ import annotations
+
+import importlib.util
+from typing import Callable, Final, Optional
+
+from bs4 import BeautifulSoup, SoupStrainer, Tag
+
+LXML_AVAILABLE: Final[bool] = importlib.util.find_spec("lxml") is not None
+
+BACKENDS: Final = ("lxml", "html.parser")
+
+backend: str = "html.parser"
+"""
+The parser used by soup(). Python's html.parser by default, so results don't depend on what else is installed.
+lxml is faster, but builds slightly different trees from broken HTML: install the `lxml` extra and call set_backend("lxml") to use it
+"""
+
+
+def set_backend(name: str) -> None:
+    """
+    Choose the parser used by soup(), e.g. set_backend("html.parser")
+    """
+    global backend
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown parser backend {name!r}. Choose from {BACKENDS}")
+    if name == "lxml" and not LXML_AVAILABLE:
+        raise ValueError("lxml is not installed")
+
+    backend = name
+
+
+def soup(markup: str | bytes, strainer: Optional[SoupStrainer] = None) -> BeautifulSoup:
+    """
+    Parse HTML with the current backend.
+    :param strainer: If given, only elements matching it (and everything inside them) are built,
+    which saves a lot of time and memory when only a small part of a page is needed
+    """
+    return BeautifulSoup(markup, backend, parse_only=strainer)
+
+
+def has_class(*names: str) -> Callable[[Optional[str]], bool]:
+    """
+    Make a SoupStrainer attribute filter that matches elements with any of the given classes.
+    While parsing, the class attribute is still one string, so a strainer with {"class": "x"} would not match class="x y"
+    """
+    wanted = set(names)
+
+    def match(value: Optional[str]) -> bool:
+        if value is None:
+            return False
+        if not isinstance(value, str):
+            value = " ".join(value)
+        return not wanted.isdisjoint(value.split())
+
+    return match
+
+
+INPUTS: Final = SoupStrainer(["input", "select"])
+"""Strainer for pages that are only needed for commons.eval_inputs"""
+
+MAIN: Final = SoupStrainer("div", {"role": "main"})
+"""Strainer for the main region of a moodle page"""
+
+SCRIPTS: Final = SoupStrainer("script")
+
+
+def inner_html(elem: Optional[Tag]) -> Optional[str]:
+    """
+    The HTML inside an element, as a string. Models keep this rather than the element,
+    since an element keeps the whole tree it was parsed in alive
+    """
+    return None if elem is None else elem.decode_contents()
+
+
+def fragment(markup: Optional[str]) -> Optional[BeautifulSoup]:
+    """
+    Parse a stored HTML fragment (e.g. from inner_html or a webservice) on demand
+    """
+    return None if markup is None else BeautifulSoup(markup, "html.parser")
@@ -0,0 +1,295 @@
+"""
+Shared HTTP transport (connection pool) used by every kegscraper session.
+
+Each session still gets its own client (and so its own cookies), but all of their connections come from one pool,
+so many sessions to the same site reuse keep-alive connections and TLS handshakes instead of opening their own.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import importlib.util
+import threading
+import weakref
+from dataclasses import dataclass, fields
+from typing import Final, Optional
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+from . import cache as _cache
+
+HTTP2_AVAILABLE: Final[bool] = importlib.util.find_spec("h2") is not None
+
+
+@dataclass
+class TransportConfig:
+    """
+    Settings for the shared connection pool. Changes only apply to pools opened afterwards.
+    """
+
+    max_connections: int = 100
+    max_keepalive_connections: int = 20
+    keepalive_expiry: float = 30.0
+
+    max_connections_per_host: Optional[int] = 10
+    """
+    Max number of requests to a single host waiting for their response headers at once. None for no limit.
+    Response bodies being streamed don't hold a slot, so requests made while streams are open can't deadlock
+    """
+
+    http2: bool = True
+    """Use HTTP/2 where the server supports it. Needs the `h2` package to be installed"""
+
+    retries: int = 0
+    """Number of times to retry failed connection attempts"""
+
+    @property
+    def limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive_connections,
+            keepalive_expiry=self.keepalive_expiry,
+        )
+
+    @property
+    def use_http2(self) -> bool:
+        return self.http2 and HTTP2_AVAILABLE
+
+
+config = TransportConfig()
+
+
+def configure(**kwargs) -> TransportConfig:
+    """
+    Update the shared transport config, e.g. configure(max_connections_per_host=4).
+    Call this before making any requests, as pools that are already open keep their old limits.
+    """
+    names = {f.name for f in fields(TransportConfig)}
+    for key, value in kwargs.items():
+        if key not in names:
+            raise TypeError(f"Unknown transport setting {key!r}")
+        setattr(config, key, value)
+
+    return config
+
+
+@dataclass
+class _LoopPool:
+    """The connection pool and per-host limits belonging to one event loop"""
+
+    transport: httpx.AsyncBaseTransport
+    host_limit: Optional[int]
+    semaphores: dict[str, asyncio.Semaphore]
+
+    def host_semaphore(self, host: str) -> asyncio.Semaphore | None:
+        if self.host_limit is None:
+            return None
+
+        if host not in self.semaphores:
+            self.semaphores[host] = asyncio.Semaphore(self.host_limit)
+        return self.semaphores[host]
+
+
+class SharedAsyncTransport(httpx.AsyncBaseTransport):
+    """
+    An async transport whose connection pool is shared by every client using it.
+
+    Closing a client does not close the pool - use `aclose()` from this module for that.
+    Connections cannot be moved between event loops, so one pool is kept per event loop.
+    """
+
+    def __init__(self):
+        self._pools: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, _LoopPool] = (
+            weakref.WeakKeyDictionary()
+        )
+
+    def _pool(self) -> _LoopPool:
+        loop = asyncio.get_running_loop()
+
+        pool = self._pools.get(loop)
+        if pool is None:
+            pool = _LoopPool(
+                httpx.AsyncHTTPTransport(
+                    limits=config.limits,
+                    http2=config.use_http2,
+                    retries=config.retries,
+                ),
+                config.max_connections_per_host,
+                {},
+            )
+            self._pools[loop] = pool
+
+        return pool
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if cache is not None:
+            return await cache.handle_async_request(request, self._send)
+        return await self._send(request)
+
+    async def _send(self, request: httpx.Request) -> httpx.Response:
+        pool = self._pool()
+
+        semaphore = pool.host_semaphore(request.url.host)
+        if semaphore is None:
+            return await pool.transport.handle_async_request(request)
+
+        # The host's slot is only held until the headers arrive. Holding it until the body is closed would deadlock
+        # a caller that makes more requests to the host while max_connections_per_host responses are still open
+        async with semaphore:
+            return await pool.transport.handle_async_request(request)
+
+    async def aclose(self) -> None:
+        """Called when a client using this transport is closed. The pool is shared, so this does nothing."""
+
+    async def close_pool(self) -> None:
+        """Close the pool belonging to the running event loop"""
+        pool = self._pools.pop(asyncio.get_running_loop(), None)
+        if pool is not None:
+            await pool.transport.aclose()
+
+
+class SharedTransport(httpx.BaseTransport):
+    """
+    The sync equivalent of SharedAsyncTransport, for httpx.Client sessions.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._transport: Optional[httpx.HTTPTransport] = None
+
+    def _pool(self) -> httpx.HTTPTransport:
+        with self._lock:
+            if self._transport is None:
+                self._transport = httpx.HTTPTransport(
+                    limits=config.limits,
+                    http2=config.use_http2,
+                    retries=config.retries,
+                )
+            return self._transport
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        if cache is not None:
+            return cache.handle_request(request, self._pool().handle_request)
+        return self._pool().handle_request(request)
+
+    def close(self) -> None:
+        """Called when a client using this transport is closed. The pool is shared, so this does nothing."""
+
+    def close_pool(self) -> None:
+        with self._lock:
+            transport, self._transport = self._transport, None
+        if transport is not None:
+            transport.close()
+
+
+class _SharedHTTPAdapter(HTTPAdapter):
+    """
+    An HTTPAdapter mounted on many requests sessions. Closing one session must not close the pools of the others,
+    so close() does nothing - use close() from this module for that.
+    """
+
+    def close(self) -> None:
+        """Called when a session using this adapter is closed. The pools are shared, so this does nothing."""
+
+    def close_pool(self) -> None:
+        super().close()
+
+
+ASYNC_TRANSPORT: Final[SharedAsyncTransport] = SharedAsyncTransport()
+TRANSPORT: Final[SharedTransport] = SharedTransport()
+
+REQUESTS_POOL_HOSTS: Final[int] = 10
+"""Number of hosts the shared requests adapter keeps a connection pool for"""
+
+_adapter: Optional[_SharedHTTPAdapter] = None
+
+cache: Optional[_cache.HTTPCache] = None
+"""The response cache used by httpx sessions, if enabled"""
+
+
+def async_client(**kwargs) -> httpx.AsyncClient:
+    """
+    Make a new httpx.AsyncClient (with its own cookies and headers) that uses the shared connection pool
+    """
+    kwargs.setdefault("transport", ASYNC_TRANSPORT)
+    return httpx.AsyncClient(**kwargs)
+
+
+def client(**kwargs) -> httpx.Client:
+    """
+    Make a new httpx.Client (with its own cookies and headers) that uses the shared connection pool
+    """
+    kwargs.setdefault("transport", TRANSPORT)
+    return httpx.Client(**kwargs)
+
+
+def requests_adapter() -> HTTPAdapter:
+    """
+    Get the HTTPAdapter shared by requests.Session sessions (requests does not support HTTP/2)
+    """
+    global _adapter
+    if _adapter is None:
+        # pool_connections is the number of per-host pools, and pool_maxsize the connections kept in each
+        _adapter = _SharedHTTPAdapter(
+            pool_connections=REQUESTS_POOL_HOSTS,
+            pool_maxsize=config.max_keepalive_connections,
+            max_retries=config.retries,
+        )
+    return _adapter
+
+
+def requests_session() -> requests.Session:
+    """
+    Make a new requests.Session that uses the shared HTTPAdapter
+    """
+    sess = requests.Session()
+    adapter = requests_adapter()
+    sess.mount("http://", adapter)
+    sess.mount("https://", adapter)
+    return sess
+
+
+def enable_cache(
+    http_cache: Optional[_cache.HTTPCache] = None, /, **kwargs
+) -> _cache.HTTPCache:
+    """
+    Start caching responses for all httpx sessions (requests sessions, i.e. papercut, are not cached).
+    Pass an HTTPCache, or kwargs to make one, e.g. enable_cache(path="cache.sqlite", ttl_overrides={"/tag/index.php": 600})
+    :return: the cache, which has hit/miss counters in its `stats`
+    """
+    global cache
+    if http_cache is None:
+        http_cache = _cache.HTTPCache(**kwargs)
+
+    cache = http_cache
+    return cache
+
+
+def disable_cache() -> None:
+    """Stop caching responses and close the cache"""
+    global cache
+    if cache is not None:
+        cache.close()
+        cache = None
+
+
+async def aclose() -> None:
+    """
+    Close the shared async connection pool for the running event loop.
+    Clients can still be used afterwards; a new pool is opened when needed.
+    """
+    await ASYNC_TRANSPORT.close_pool()
+
+
+def close() -> None:
+    """
+    Close the shared sync connection pools (httpx and requests)
+    """
+    global _adapter
+    TRANSPORT.close_pool()
+
+    if _adapter is not None:
+        _adapter.close_pool()
+        _adapter = None
@@ -5,3 +5,5 @@ Anything to do with the vle website, aka kegsnet: https://vle.kegs.org.uk/
 
 from .session import Session, login, login_by_moodle
 from .file import File
+from .watcher import ForumWatcher
+from .directory import DirectoryCrawler
@@ -7,11 +7,10 @@ from urllib.parse import urlparse, parse_qs
 import bs4
 from typing_extensions import Any, Self, Optional
 
-import dateparser
-from bs4 import PageElement, BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
 
 from . import session, user, tag, file
-from ..util import commons, exceptions
+from ..util import commons, dates, exceptions, paginator, parsing
 
 
 @dataclass
@@ -25,12 +24,13 @@ class External:
     id: Optional[int] = None
 
 
-@dataclass
+@dataclass(slots=True)
 class Comment:
     _session: session.Session = field(repr=False)
 
     id: Optional[int] = None
-    content: Optional[BeautifulSoup] = field(repr=False, default=None)
+    content: Optional[str] = field(repr=False, default=None)
+    """HTML of the comment"""
     format: Optional[str] = "0"  # Idk what this is
     created: Optional[datetime] = None
     author: Optional[user.User] = None
@@ -43,21 +43,26 @@ class Comment:
         cls, data: dict[str, str | bool], _entry: Entry, _session: session.Session
     ) -> Self:
         return cls(
-            data.get("id"),
-            BeautifulSoup(data.get("content", ""), "html.parser"),
-            data.get("format"),
-            datetime.fromtimestamp(int(data.get("timecreated"))),
-            _session.connect_partial_user(
+            _session=_session,
+            id=data.get("id"),
+            content=data.get("content", ""),
+            format=data.get("format"),
+            created=datetime.fromtimestamp(int(data.get("timecreated"))),
+            author=_session.connect_partial_user(
                 id=int(data.get("userid")), name=data.get("fullname")
             ),
-            data.get("delete"),
-            _entry,
-            _session,
+            deletable=data.get("delete"),
+            _entry=_entry,
         )
 
+    @property
+    def content_soup(self) -> Optional[BeautifulSoup]:
+        """The content, parsed (each time this is accessed)"""
+        return parsing.fragment(self.content)
+
     @property
     def text(self):
-        return self.content.text
+        return self.content_soup.text
 
     def delete(self):
         response = self._session.rq.post(
@@ -89,7 +94,7 @@ class Comment:
             warnings.warn(f"Possibly couldn't delete {self}.{extra}")
 
 
-@dataclass
+@dataclass(slots=True)
 class Entry:
     _session: session.Session = field(repr=False)
 
@@ -99,10 +104,12 @@ class Entry:
     date_created: Optional[datetime] = None
     date_modified: Optional[datetime] = None
     publishstate: Optional[str] = None
-    content: PageElement | Any | None = field(repr=False, default=None)
+    content: Optional[str] = field(repr=False, default=None)
+    """HTML of the entry"""
 
     attachments: list[file.File] | None = None
-    images: PageElement | Any = field(repr=False, default=None)
+    images: Optional[str] = field(repr=False, default=None)
+    """HTML of the attached images"""
     tags: list[tag.Tag] | None = None
 
     external_blog: Optional[External] = None
@@ -114,6 +121,15 @@ class Entry:
     def url(self):
         return f"https://vle.kegs.org.uk/blog/index.php?entryid={self.id}"
 
+    @property
+    def content_soup(self) -> Optional[BeautifulSoup]:
+        """The content, parsed (each time this is accessed)"""
+        return parsing.fragment(self.content)
+
+    @property
+    def images_soup(self) -> Optional[BeautifulSoup]:
+        return parsing.fragment(self.images)
+
     @classmethod
     def from_json(cls, data: dict[str, Any], _sess: session.Session) -> Self:
         if data["module"] == "blog_external":
@@ -131,7 +147,7 @@ class Entry:
             date_created=datetime.fromtimestamp(data["created"]),
             date_modified=datetime.fromtimestamp(data["lastmodified"]),
             publishstate=data["publishstate"],
-            content=BeautifulSoup(data["summary"], "html.parser"),
+            content=data["summary"],
             attachments=[
                 file.File.from_json2(attch, _sess) for attch in data["attachmentfiles"]
             ],
@@ -144,7 +160,7 @@ class Entry:
         resp = await self._session.rq.get(
             "https://vle.kegs.org.uk/blog/index.php", params={"entryid": self.id}
         )
-        soup = BeautifulSoup(resp.text, "html.parser")
+        soup = parsing.soup(resp.text, SoupStrainer("div", {"id": f"b{self.id}"}))
 
         div = soup.find("div", {"id": f"b{self.id}"})
         if div is None:
@@ -179,7 +195,7 @@ class Entry:
         )
 
         date_str = author_anchor.next.next.text
-        self.date_created = dateparser.parse(date_str)
+        self.date_created = dates.parse_date(date_str)
 
         external_div = header.find("div", {"class": "externalblog"})
         if external_div:
@@ -197,10 +213,12 @@ class Entry:
         audience = div.text.strip()
         self.publishstate = {"Anyone on this site": "site"}.get(audience)
 
-        self.images = main.find("div", {"class": "attachedimages"})
+        self.images = parsing.inner_html(
+            main.find("div", {"class": "attachedimages"})
+        )
 
-        self.content = main.find("div", {"class": "no-overflow"}).find(
-            "div", {"class": "no-overflow"}
+        self.content = parsing.inner_html(
+            main.find("div", {"class": "no-overflow"}).find("div", {"class": "no-overflow"})
         )
 
         external_div = main.find("div", {"class": "externalblog"})
@@ -238,13 +256,8 @@ class Entry:
         if self.context_id is None:
             await self.update_from_id()
 
-        data_lst = []
-        for page, _ in zip(
-            *commons.generate_page_range(
-                limit, offset, items_per_page=999, starting_page=0
-            )
-        ):
-            data_lst += (
+        async def fetch_page(page: int) -> list[Comment]:
+            data_lst = (
                 await self._session.rq.post(
                     "https://vle.kegs.org.uk/comment/comment_ajax.php",
                     data={
@@ -260,8 +273,11 @@ class Entry:
                     },
                 )
             ).json()["list"]
+            return [Comment.from_json(data, self, self._session) for data in data_lst]
 
-        return [Comment.from_json(data, self, self._session) for data in data_lst]
+        return await paginator.Paginator(
+            fetch_page, limit=limit, offset=offset, items_per_page=999, starting_page=0
+        ).collect()
 
     async def post_comment(self, content: str) -> Comment:
         if self.context_id is None:
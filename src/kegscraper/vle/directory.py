@@ -0,0 +1,192 @@
+"""
+DirectoryCrawler class, for listing vle users over ranges of ids with batched webservice lookups
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import warnings
+
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing_extensions import Any, AsyncIterator, Optional
+
+from . import session, user
+
+
+@dataclass
+class DirectoryCrawler:
+    """
+    Crawls the user ids in [start, stop) in chunks of `chunk_size` ids per core_user_get_users_by_field call,
+    with `concurrency` workers, yielding User objects as each chunk completes.
+    Workers wait while `concurrency` finished chunks are waiting to be consumed, so a slow consumer slows the crawl
+    rather than piling up results.
+
+    Ids that the webservice does not return are probed once through their profile page (up to `concurrency` at once),
+    and any DELETED_USER/INVALID_USER/FORBIDDEN_USER flag found is recorded in `flags`, so those ids are never looked
+    up again. A probe that fails is skipped with a warning. Set `probe_missing` to False to treat them as absent instead,
+    which saves a request per missing id on sparse ranges.
+
+    With a `checkpoint` file, progress is saved as a watermark (every id below it is done) and the flags,
+    so a crawl that is stopped can be resumed by making a crawler with the same checkpoint.
+
+    e.g.:
+    async for _user in DirectoryCrawler(sess, 4000, 5000, checkpoint="users.json").crawl():
+        ...
+    """
+
+    sess: session.Session
+    start: int
+    stop: int
+    chunk_size: int = 100
+    concurrency: int = 4
+    probe_missing: bool = True
+    checkpoint: Optional[str | os.PathLike] = None
+
+    watermark: int = field(init=False)
+    """Every id below this has been crawled"""
+    flags: dict[int, str] = field(init=False, default_factory=dict)
+    """id: flag (e.g. user.DELETED_USER) for ids found not to be readable users"""
+
+    def __post_init__(self):
+        self.watermark = self.start
+        if self.checkpoint is not None:
+            self._load()
+
+    def _load(self):
+        try:
+            with open(self.checkpoint, encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+
+        if (data["start"], data["stop"]) != (self.start, self.stop):
+            raise ValueError(
+                f"Checkpoint {self.checkpoint} is for ids [{data['start']}, {data['stop']}), not [{self.start}, {self.stop})"
+            )
+
+        self.watermark = data["watermark"]
+        self.flags = {int(_id): flag for _id, flag in data["flags"].items()}
+
+    def save(self):
+        """Write the checkpoint (if there is a checkpoint file)"""
+        if self.checkpoint is None:
+            return
+
+        path = Path(self.checkpoint)
+        tmp = path.with_name(path.name + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "start": self.start,
+                    "stop": self.stop,
+                    "watermark": self.watermark,
+                    "flags": self.flags,
+                },
+                f,
+            )
+        tmp.replace(path)
+
+    @property
+    def done(self) -> bool:
+        return self.watermark >= self.stop
+
+    async def _probe(self, _id: int) -> Optional[user.User]:
+        """
+        Look up an id the webservice didn't return through its profile page, recording its flag if it has one
+        """
+        try:
+            resp = await self.sess.rq.get(
+                "https://vle.kegs.org.uk/user/profile.php", params={"id": _id}
+            )
+            flag = user.profile_flag(resp.text)
+            if flag is not None:
+                self.flags[_id] = flag
+                return None
+
+            _user = user.User(id=_id, _session=self.sess)
+            _user.update_from_profile(resp.text)
+            return _user
+        except Exception as e:
+            warnings.warn(f"Could not probe user id {_id}: {e!r}")
+            return None
+
+    async def _crawl_chunk(self, ids: list[int], semaphore: asyncio.Semaphore) -> list[user.User]:
+        data: list[dict[str, Any]] = await self.sess.get_users(ids) if ids else []
+
+        users = []
+        for user_data in data:
+            _user = user.User(_session=self.sess)
+            _user.update_from_json(user_data)
+            users.append(_user)
+
+        if self.probe_missing:
+            found = {_user.id for _user in users}
+
+            async def probe(_id: int):
+                async with semaphore:
+                    return await self._probe(_id)
+
+            probed = await asyncio.gather(*(probe(_id) for _id in ids if _id not in found))
+            users += [_user for _user in probed if _user is not None]
+
+        users.sort(key=lambda _user: _user.id)
+        return users
+
+    async def crawl(self) -> AsyncIterator[user.User]:
+        """
+        Crawl from the watermark to `stop`, yielding users as each chunk completes (chunks may finish out of order)
+        """
+        probe_semaphore = asyncio.Semaphore(self.concurrency)
+
+        chunk_starts = list(range(self.watermark, self.stop, self.chunk_size))
+        todo = iter(chunk_starts)
+        results: asyncio.Queue[tuple[int, list[user.User] | BaseException]] = asyncio.Queue(
+            maxsize=self.concurrency
+        )
+
+        async def worker():
+            for chunk_start in todo:
+                ids = [
+                    _id
+                    for _id in range(chunk_start, min(chunk_start + self.chunk_size, self.stop))
+                    if _id not in self.flags
+                ]
+                try:
+                    result = await self._crawl_chunk(ids, probe_semaphore)
+                except Exception as e:
+                    await results.put((chunk_start, e))
+                    return
+                await results.put((chunk_start, result))
+
+        workers = [
+            asyncio.ensure_future(worker())
+            for _ in range(min(self.concurrency, len(chunk_starts)))
+        ]
+
+        finished: set[int] = set()
+        try:
+            for _ in chunk_starts:
+                chunk_start, result = await results.get()
+                if isinstance(result, BaseException):
+                    raise result
+
+                for _user in result:
+                    yield _user
+
+                # Move the watermark over the chunks that are finished without a gap
+                finished.add(chunk_start)
+                while self.watermark in finished:
+                    finished.discard(self.watermark)
+                    self.watermark = min(self.watermark + self.chunk_size, self.stop)
+                self.save()
+        finally:
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+    async def collect(self) -> list[user.User]:
+        """Crawl into a list of users, sorted by id"""
+        return sorted([_user async for _user in self.crawl()], key=lambda _user: _user.id)
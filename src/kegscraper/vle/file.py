@@ -14,7 +14,7 @@ from . import session
 from . import user as _user
 
 
-@dataclass
+@dataclass(slots=True)
 class File:
     """
     Class representing both files and directories in kegsnet
@@ -82,8 +82,16 @@ class File:
         await self._session.file_save_changes()
 
     @classmethod
-    async def from_json(cls, data: dict, _session: session.Session) -> Self:
-        """Load a file from JSON data"""
+    def from_json(
+        cls,
+        data: dict,
+        _session: session.Session,
+        user: Optional[_user.User] = None,
+    ) -> Self:
+        """
+        Load a file from JSON data
+        :param user: the user who owns the file
+        """
         return cls(
             name=data.get("filename"),
             path=data.get("filepath"),
@@ -96,7 +104,7 @@ class File:
             icon_url=data.get("icon"),
             datemodified=datetime.fromtimestamp(data["datemodified"]),
             datecreated=datetime.fromtimestamp(data["datecreated"]),
-            user=await _session.connected_user,
+            user=user,
             _session=_session,
         )
 
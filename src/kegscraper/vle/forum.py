@@ -2,20 +2,43 @@
 
 from __future__ import annotations
 
+import asyncio
+
 from urllib.parse import urlparse, parse_qs
 from datetime import datetime
 
-import dateparser
 import bs4
 
 from dataclasses import dataclass, field
 from bs4 import BeautifulSoup, NavigableString, PageElement
-from typing_extensions import Optional
+from typing_extensions import Any, Final, Literal, Optional
 
 from . import session, user
+from ..util import dates, exceptions, paginator, parsing
 
+# Sort orders for mod_forum_get_forum_discussions
+SORT_DEFAULT: Final = -1
+SORT_LASTPOST_DESC: Final = 1
+SORT_LASTPOST_ASC: Final = 2
+SORT_CREATED_DESC: Final = 3
+SORT_CREATED_ASC: Final = 4
+SORT_REPLIES_DESC: Final = 5
+SORT_REPLIES_ASC: Final = 6
 
-@dataclass
+HTML_FALLBACK_ERRORCODES: Final = frozenset(
+    {"servicenotavailable", "accessexception", "nopermissions", "webservicesnotenabled"}
+)
+"""Webservice error codes meaning a method is disabled or not allowed for this user, so the HTML page is scraped instead"""
+
+DISCUSSIONS_PER_PAGE: Final = 100
+"""Number of discussions on a page of the forum page (moodle's forum_manydiscussions default)"""
+
+
+def _should_fall_back(e: exceptions.WebServiceError) -> bool:
+    return e.errorcode in HTML_FALLBACK_ERRORCODES
+
+
+@dataclass(slots=True)
 class Post:
     """Represents a post in a discussion in a forum on the kegsnet website"""
 
@@ -27,10 +50,20 @@ class Post:
     date: Optional[datetime] = None
     title: Optional[str] = None
     content: Optional[str] = field(repr=False, default=None)
+    """HTML of the post"""
 
     _discussion: Optional[Discussion] = None
 
-    async def update_from_html(self, elem: bs4.Tag):
+    @property
+    def content_soup(self) -> Optional[BeautifulSoup]:
+        """The content, parsed (each time this is accessed)"""
+        return parsing.fragment(self.content)
+
+    def update_from_html(self, elem: bs4.Tag, users: Optional[dict[int, user.User]] = None):
+        """
+        Update the post from its HTML in a discussion page. The creator is a partial user (id and name) - no profile is fetched
+        :param users: users by id to share between posts, so each author is only one User object
+        """
         # --- Data from the <header> tag
         header = elem.find("header")
         assert header is not None
@@ -42,11 +75,14 @@ class Post:
         user_url = user_anchor.attrs.get("href")
         uid = int(parse_qs(urlparse(user_url).query)["id"][0])
 
-        self.creator = await self._session.connect_user_by_id(uid)
-        # We can actually provide the name of the creator, even if other data is inaccessible
-        self.creator.name = user_anchor.text
+        if users is None:
+            users = {}
+        if uid not in users:
+            # We can actually provide the name of the creator, even if other data is inaccessible
+            users[uid] = self._session.connect_partial_user(id=uid, name=user_anchor.text)
+        self.creator = users[uid]
 
-        self.date = dateparser.parse(header.find("time").text)
+        self.date = dates.parse_date(header.find("time").text)
 
         # Other data
         temp = elem.find(
@@ -59,6 +95,30 @@ class Post:
 
         self.content = str(elem.find("div", {"class": "post-content-container"}))
 
+    def update_from_json(self, data: dict[str, Any], users: Optional[dict[int, user.User]] = None):
+        """
+        Update the post from a post returned by mod_forum_get_discussion_posts
+        :param users: users by id to share between posts, so each author is only one User object
+        """
+        self.id = data["id"]
+        self.title = data.get("subject")
+        self.content = data.get("message")
+        if data.get("timecreated"):
+            self.date = datetime.fromtimestamp(data["timecreated"])
+
+        author = data.get("author") or {}
+        uid = author.get("id")
+        if uid is not None:
+            if users is None:
+                users = {}
+            if uid not in users:
+                users[uid] = self._session.connect_partial_user(
+                    id=uid,
+                    name=author.get("fullname"),
+                    image_url=(author.get("urls") or {}).get("profileimage"),
+                )
+            self.creator = users[uid]
+
 
 @dataclass
 class Discussion:
@@ -72,8 +132,10 @@ class Discussion:
     # author: user.User = None # It only shows a name & pfp - but not an actual link
 
     date_created: Optional[datetime] = None
+    date_modified: Optional[datetime] = None
     # last_post: Post = None
     reply_count: Optional[int] = None
+    pinned: Optional[bool] = None
 
     _forum: Optional[Forum] = field(repr=False, default=None)
     _top_post: Optional[Post] = field(repr=False, default=None)
@@ -115,22 +177,75 @@ class Discussion:
             elif i == 5:
                 # Date created
                 text = item.text.strip()
-                self.date_created = dateparser.parse(text)
+                self.date_created = dates.parse_date(text)
 
             else:
                 break
 
-    async def update(self):
+    def update_from_json(self, data: dict[str, Any]) -> None:
+        """
+        Update the discussion from a discussion returned by mod_forum_get_forum_discussions
+        """
+        self.id = data["discussion"]
+        self.name = data.get("name")
+        self.reply_count = data.get("numreplies")
+        self.pinned = data.get("pinned")
+        if data.get("created"):
+            self.date_created = datetime.fromtimestamp(data["created"])
+        if data.get("timemodified"):
+            self.date_modified = datetime.fromtimestamp(data["timemodified"])
+
+    async def update(
+        self,
+        hydrate_users: bool = False,
+        *,
+        sort_direction: Literal["ASC", "DESC"] = "ASC",
+    ):
         """
-        Update the discussion from the corresponding url. Requires an id
+        Update the discussion and its posts using the webservice, or the discussion page if that is disabled. Requires an id
+        :param hydrate_users: also fetch the details of every post author, with one batched webservice call
+        :param sort_direction: order of the posts by time created. The discussion page is always oldest first
         :return:
         """
+        users: dict[int, user.User] = {}
+        try:
+            data = await self._session.webservice(
+                "mod_forum_get_discussion_posts",
+                discussionid=self.id,
+                sortby="created",
+                sortdirection=sort_direction,
+            )
+        except exceptions.WebServiceError as e:
+            if not _should_fall_back(e):
+                raise
+            await self._update_by_html(users)
+        else:
+            self._top_post = None
+            self.posts = []
+            for post_data in data["posts"]:
+                post = Post(_discussion=self, _session=self._session)
+                post.update_from_json(post_data, users)
+                self.posts.append(post)
+
+                if not post_data.get("hasparent"):
+                    self._top_post = post
+
+            if self._top_post is not None and self.name is None:
+                self.name = self._top_post.title
+
+        if hydrate_users:
+            await self._session.hydrate_users(list(users.values()))
+
+    async def _update_by_html(self, users: dict[int, user.User]):
+        """
+        Update the discussion by scraping the discussion page
+        """
         resp = await self._session.rq.get(
             "https://vle.kegs.org.uk/mod/forum/discuss.php",
             params={"d": self.id, "mode": 1},
         )
 
-        soup = BeautifulSoup(resp.text, "html.parser")
+        soup = parsing.soup(resp.text, parsing.MAIN)
 
         elem = soup.find("h3", {"class": "discussionname"})
         assert elem is not None
@@ -142,13 +257,19 @@ class Discussion:
         assert top_post_html is not None
         top_post_html = top_post_html.find("div", core_attrs)
 
-        self._top_post = Post(_discussion=self, _session=self._session)
-        await self._top_post.update_from_html(top_post_html)
-
+        self._top_post = None
         self.posts = []
         for post_html in post_htmls:
-            self.posts.append(Post(_discussion=self, _session=self._session))
-            await self.posts[-1].update_from_html(post_html)
+            post = Post(_discussion=self, _session=self._session)
+            post.update_from_html(post_html, users)
+            self.posts.append(post)
+
+            if post_html is top_post_html:
+                self._top_post = post
+
+        if self._top_post is None:
+            self._top_post = Post(_discussion=self, _session=self._session)
+            self._top_post.update_from_html(top_post_html, users)
 
     @property
     def url(self) -> str:
@@ -178,12 +299,91 @@ class Forum:
     description: Optional[str] = None
     contents: Optional[list[Discussion]] = None
 
-    async def update_by_id(self):
-        """Update attributes by requesting the corresponding webpage. Requires an id"""
+    async def _get_discussions(
+        self, page: int, per_page: int, sort_order: int = SORT_DEFAULT
+    ) -> list[Discussion]:
+        """
+        Fetch a page (from 0) of discussions using mod_forum_get_forum_discussions
+        """
+        data = await self._session.batched_webservice(
+            "mod_forum_get_forum_discussions",
+            forumid=self.id,
+            sortorder=sort_order,
+            page=page,
+            perpage=per_page,
+        )
+
+        discussions = []
+        for discussion_data in data["discussions"]:
+            discussion = Discussion(_forum=self, _session=self._session)
+            discussion.update_from_json(discussion_data)
+            discussions.append(discussion)
+        return discussions
+
+    def iter_discussions(
+        self,
+        *,
+        limit: Optional[int] = None,
+        offset: int = 0,
+        per_page: int = 50,
+        sort_order: int = SORT_DEFAULT,
+        prefetch: int = 4,
+    ) -> paginator.Paginator[Discussion]:
+        """
+        Stream the forum's discussions, paged and sorted by the server
+        :param limit: number of discussions. None for all of them
+        :param sort_order: one of the SORT_ constants, e.g. SORT_CREATED_DESC
+        :param prefetch: max number of pages requested at once
+        """
+        return paginator.Paginator(
+            lambda page: self._get_discussions(page, per_page, sort_order),
+            limit=limit,
+            offset=offset,
+            items_per_page=per_page,
+            starting_page=0,
+            prefetch=prefetch,
+            stop_on_short_page=True,
+        )
+
+    async def update_by_id(
+        self, per_page: int = DISCUSSIONS_PER_PAGE, sort_order: int = SORT_DEFAULT
+    ):
+        """
+        Update the name, description and first page of discussions using the webservice,
+        or the forum page if that is disabled or not allowed. Requires an id.
+        :param per_page: number of discussions to load into contents. Defaults to as many as the forum page shows
+        :param sort_order: one of the SORT_ constants
+        """
+        try:
+            cm_data, self.contents = await asyncio.gather(
+                self._session.batched_webservice(
+                    "core_course_get_course_module_by_instance",
+                    module="forum",
+                    instance=self.id,
+                ),
+                self._get_discussions(0, per_page, sort_order),
+            )
+            # The description (intro) is only given when listing the forums of the forum's course
+            forums = await self._session.batched_webservice(
+                "mod_forum_get_forums_by_courses", courseids=[cm_data["cm"]["course"]]
+            )
+        except exceptions.WebServiceError as e:
+            if not _should_fall_back(e):
+                raise
+            await self._update_by_html()
+        else:
+            self.name = cm_data["cm"]["name"]
+            for forum_data in forums:
+                if forum_data["id"] == self.id:
+                    self.description = parsing.fragment(forum_data.get("intro", "")).text
+                    break
+
+    async def _update_by_html(self):
+        """Update attributes by scraping the forum page"""
         resp = await self._session.rq.get(
             "https://vle.kegs.org.uk/mod/forum/view.php", params={"f": self.id}
         )
-        soup = BeautifulSoup(resp.text, "html.parser")
+        soup = parsing.soup(resp.text, parsing.MAIN)
 
         container = soup.find("div", {"role": "main"})
         assert container is not None
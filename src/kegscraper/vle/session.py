@@ -5,24 +5,28 @@ Session class and login/login by moodle function
 from __future__ import annotations
 
 import json
+import os
 import re
 import atexit
-from typing_extensions import Optional
+from pathlib import Path
+from typing_extensions import AsyncIterator, Callable, Optional
 import warnings
 import httpx
 import asyncio
 
-from typing import Literal, Any
+from typing import Final, Literal, Any
 from datetime import datetime
 from dataclasses import dataclass, field
 
-import dateparser
 import requests
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
 from urllib.parse import urlparse, parse_qs
 
 from . import file, user, forum, blog, tag, calendar, course
-from ..util import commons, exceptions
+from ..util import commons, dates, exceptions, paginator, parsing, transport
+
+
+_M_CFG: Final = re.compile(r"M\.cfg\s*=\s*\{")
 
 
 @dataclass
@@ -39,6 +43,10 @@ class Session:
     _user_id: int | None = None
     _user: user.User | None = None
     _username: str | None = None
+    _batcher: WebServiceBatcher | None = field(repr=False, default=None)
+    _home_load: asyncio.Future | None = field(repr=False, default=None)
+    _files_load: asyncio.Future | None = field(repr=False, default=None)
+    _user_load: asyncio.Future | None = field(repr=False, default=None)
 
     async def __aenter__(self):
         await self.assert_login()
@@ -46,6 +54,7 @@ class Session:
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
         await self.logout()
+        await self.aclose()
         return False
 
     # --- Session/auth related methods ---
@@ -62,24 +71,68 @@ class Session:
     async def sesskey(self):
         """Get the sesskey query parameter used in various functions. Webscraped from JS..."""
         if self._sesskey is None:
-            pfx = "var M = {}; M.yui = {};\nM.pageloadstarttime = new Date();\nM.cfg = "
+            await self._load_home()
 
-            resp = await self.rq.get("https://vle.kegs.org.uk/")
-            soup = BeautifulSoup(resp.text, "html.parser")
+        return self._sesskey
 
-            self._sesskey = None
-            for script in soup.find_all("script"):
-                text = script.text
-                if '"sesskey":' in text:
-                    i = text.find(pfx)
-                    if i > -1:
-                        i += len(pfx) - 1
-                        data = commons.consume_json(text, i)
+    # --- Bootstrap values (sesskey, user id, file ids) ---
+    async def bootstrap(self, refresh: bool = False):
+        """
+        Load the sesskey, user id and file manager ids. These come from 2 pages, which are fetched concurrently and only parsed once.
+        The properties for these values call this lazily, so you only need to call it to load them all up front.
+        :param refresh: Whether to reload values that have already been fetched
+        """
+        if refresh:
+            self._sesskey = self._user_id = None
+            self._file_client_id = self._file_item_id = None
+
+        loads = []
+        if self._sesskey is None or self._user_id is None:
+            loads.append(self._load_home())
+        if self._file_client_id is None or self._file_item_id is None:
+            loads.append(self._load_files())
+
+        await asyncio.gather(*loads)
+
+    async def _load_home(self):
+        """Load the values from the home page, sharing the request with any concurrent callers"""
+        if self._home_load is None or self._home_load.done():
+            self._home_load = asyncio.ensure_future(self._bootstrap_home())
+        await asyncio.shield(self._home_load)
+
+    async def _load_files(self):
+        """Load the values from the private files page, sharing the request with any concurrent callers"""
+        if self._files_load is None or self._files_load.done():
+            self._files_load = asyncio.ensure_future(self._bootstrap_files())
+        await asyncio.shield(self._files_load)
+
+    async def _bootstrap_home(self):
+        resp = await self.rq.get("https://vle.kegs.org.uk/")
+        text = resp.text
+
+        # The sesskey is in the M.cfg JSON, which can be read straight out of the page
+        match = _M_CFG.search(text)
+        if match is not None:
+            data = commons.consume_json(text, match.end() - 1)
+            if isinstance(data, dict):
+                self._sesskey = data.get("sesskey")
+
+        soup = parsing.soup(text, SoupStrainer("a", {"title": "View profile"}))
+        urltag = soup.find("a", {"title": "View profile"})
+        if urltag is not None:
+            parsed = parse_qs(urlparse(urltag.attrs["href"]).query)
+            self._user_id = int(parsed["id"][0])
 
-                        if isinstance(data, dict):
-                            self._sesskey = data.get("sesskey")
+    async def _bootstrap_files(self):
+        resp = await self.rq.get("https://vle.kegs.org.uk/user/files.php")
+        soup = parsing.soup(resp.text, SoupStrainer(["div", "input"]))
 
-        return self._sesskey
+        for div in soup.find_all("div", {"class": "filemanager w-100 fm-loading"}):
+            self._file_client_id = div.attrs["id"].split("filemanager-")[1]
+
+        elem = soup.find("input", {"id": "id_files_filemanager"})
+        if elem is not None:
+            self._file_item_id = elem.attrs.get("value")
 
     async def connect_notifications(
         self,
@@ -111,11 +164,7 @@ class Session:
     async def file_client_id(self):
         """Get the client id value used for file management"""
         if self._file_client_id is None:
-            resp = await self.rq.get("https://vle.kegs.org.uk/user/files.php")
-            soup = BeautifulSoup(resp.text, "html.parser")
-
-            for div in soup.find_all("div", {"class": "filemanager w-100 fm-loading"}):
-                self._file_client_id = div.attrs["id"].split("filemanager-")[1]
+            await self._load_files()
 
         return self._file_client_id
 
@@ -123,21 +172,24 @@ class Session:
     async def connected_user(self) -> user.User:
         """Fetch the connected user to this session"""
         if not self._user:
-            self._user = await self.connect_user_by_id(self.user_id)
+            # Share the profile scrape with any concurrent callers
+            if self._user_load is None or self._user_load.done():
+                self._user_load = asyncio.ensure_future(self._load_connected_user())
+            await asyncio.shield(self._user_load)
 
         assert self._user
         return self._user
 
+    async def _load_connected_user(self):
+        self._user = await self.connect_user_by_id(await self.user_id)
+
     @property
     async def file_item_id(self):
         """Fetch the item id value used for file management"""
         if self._file_item_id is None:
-            resp = await self.rq.get("https://vle.kegs.org.uk/user/files.php")
-            soup = BeautifulSoup(resp.text, "html.parser")
-            elem = soup.find("input", {"id": "id_files_filemanager"})
-            assert elem is not None
-            self._file_item_id = elem.attrs.get("value")
+            await self._load_files()
 
+        assert self._file_item_id is not None
         return self._file_item_id
 
     @property
@@ -145,7 +197,7 @@ class Session:
         """Fetch the connected user's username"""
         if self._username is None:
             resp = await self.rq.get("https://vle.kegs.org.uk/login/index.php")
-            soup = BeautifulSoup(resp.text, "html.parser")
+            soup = parsing.soup(resp.text, SoupStrainer(attrs={"role": "alert"}))
             for alert_elem in soup.find_all(attrs={"role": "alert"}):
                 alert = alert_elem.text
 
@@ -164,16 +216,9 @@ class Session:
     async def user_id(self):
         """Fetch the connected user's user id"""
         if self._user_id is None:
-            resp = await self.rq.get("https://vle.kegs.org.uk/")
-            soup = BeautifulSoup(resp.text, "html.parser")
-
-            urltag = soup.find("a", {"title": "View profile"})
-            assert urltag is not None
-            url = urltag.attrs["href"]
-
-            parsed = parse_qs(urlparse(url).query)
-            self._user_id = int(parsed["id"][0])
+            await self._load_home()
 
+        assert self._user_id is not None
         return self._user_id
 
     async def assert_login(self):
@@ -192,10 +237,16 @@ class Session:
         print(f"Logged out with status code {resp.status_code}")
         return resp
 
+    async def aclose(self):
+        """
+        Close this session's client. The shared connection pool stays open for other sessions.
+        """
+        await self.rq.aclose()
+
     # --- Connecting ---
     async def connect_user_by_id(self, _id: int) -> user.User:
         """Get a user by ID and attach this session object to it"""
-        ret = user.User(_id, _session=self)
+        ret = user.User(id=_id, _session=self)
         await ret.update_from_id()
         return ret
 
@@ -229,6 +280,27 @@ class Session:
         )
         return data
 
+    async def hydrate_users(self, users: list[user.User]) -> list[user.User]:
+        """
+        Fill in the details of partial users (with ids) using one core_user_get_users_by_field call, instead of
+        scraping each profile page. Users the webservice does not return are left as they are
+        :return: the users that were updated
+        """
+        by_id: dict[int, list[user.User]] = {}
+        for _user in users:
+            if _user.id is not None:
+                by_id.setdefault(_user.id, []).append(_user)
+
+        if not by_id:
+            return []
+
+        updated = []
+        for data in await self.get_users(list(by_id)):
+            for _user in by_id.get(data.get("id"), []):
+                _user.update_from_json(data)
+                updated.append(_user)
+        return updated
+
     def connect_partial_user(self, **kwargs):
         """
         Connect to a user with given kwargs without any updating
@@ -254,27 +326,150 @@ class Session:
                 "https://vle.kegs.org.uk/repository/draftfiles_ajax.php",
                 params={"action": "list"},
                 data={
-                    "sesskey": self.sesskey,
-                    "clientid": self.file_client_id,
-                    "itemid": self.file_item_id,
+                    "sesskey": await self.sesskey,
+                    "clientid": await self.file_client_id,
+                    "itemid": await self.file_item_id,
                     "filepath": fp,
                 },
             )
         ).json()
 
-    async def files_in_dir(self, fp: str) -> list[file.File]:
-        """Fetch files in a given directory"""
+    async def files_in_dir(
+        self, fp: str, owner: Optional[user.User] = None
+    ) -> list[file.File]:
+        """
+        Fetch files in a given directory
+        :param owner: the user to attach to the files. Defaults to the connected user
+        """
+        if owner is None:
+            owner = await self.connected_user
+
         data = (await self._file_data(fp))["list"]
-        files = []
-        for file_data in data:
-            files.append(file.File.from_json(file_data, self))
-        return files
+        return [file.File.from_json(file_data, self, owner) for file_data in data]
 
     @property
     async def files(self):
         """Fetch the files in the root directory"""
         return await self.files_in_dir("/")
 
+    async def walk_files(
+        self, fp: str = "/", *, concurrency: int = 8
+    ) -> AsyncIterator[file.File]:
+        """
+        Recursively yield the files and folders under a directory, listing up to `concurrency` directories at once.
+        Files are yielded as each directory listing arrives, so the order is not fixed.
+        """
+        owner = await self.connected_user
+        semaphore = asyncio.Semaphore(concurrency)
+        results: asyncio.Queue[list[file.File] | BaseException] = asyncio.Queue()
+        tasks: set[asyncio.Task] = set()
+
+        async def list_dir(path: str):
+            async with semaphore:
+                try:
+                    results.put_nowait(await self.files_in_dir(path, owner))
+                except Exception as e:
+                    results.put_nowait(e)
+
+        def start_listing(path: str):
+            task = asyncio.ensure_future(list_dir(path))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+        start_listing(fp)
+        pending = 1
+        try:
+            while pending:
+                result = await results.get()
+                pending -= 1
+
+                if isinstance(result, BaseException):
+                    raise result
+
+                for _file in result:
+                    if _file.is_dir:
+                        assert _file.path is not None
+                        start_listing(_file.path)
+                        pending += 1
+                    yield _file
+        finally:
+            outstanding = list(tasks)
+            for task in outstanding:
+                task.cancel()
+            # Wait for the cancellations, so no task is left pending and no exception goes unretrieved
+            await asyncio.gather(*outstanding, return_exceptions=True)
+
+    async def download_files(
+        self,
+        target_dir: str | os.PathLike,
+        fp: str = "/",
+        *,
+        concurrency: int = 4,
+        on_progress: Optional[Callable[[file.File, int, int], Any]] = None,
+    ) -> list[Path]:
+        """
+        Download all private files under a directory into `target_dir`, keeping the folder structure.
+
+        Downloads can be resumed: files that already exist with the right size are skipped,
+        and partial downloads (.part files) are continued with a range request where possible.
+        :param fp: directory to download
+        :param concurrency: max number of files to download at once
+        :param on_progress: called with (file, bytes done, total bytes) as each file downloads
+        :return: the paths of all the downloaded files
+        """
+        target = Path(target_dir).resolve()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def download(_file: file.File) -> Path:
+            assert _file.path is not None and _file.name is not None and _file.url is not None
+            dest = (target / _file.path.lstrip("/") / _file.name).resolve()
+            if not dest.is_relative_to(target):
+                raise ValueError(f"Refusing to write {_file} outside of {target}")
+
+            total = _file.size or 0
+            if dest.exists() and dest.stat().st_size == total:
+                if on_progress is not None:
+                    on_progress(_file, total, total)
+                return dest
+
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            part = dest.with_name(dest.name + ".part")
+            done = part.stat().st_size if part.exists() else 0
+
+            async with semaphore:
+                headers = {"Range": f"bytes={done}-"} if done else {}
+                async with self.rq.stream("GET", _file.url, headers=headers) as resp:
+                    if done and resp.status_code == 416:
+                        # Range not satisfiable: the .part file is already complete
+                        if on_progress is not None:
+                            on_progress(_file, done, total)
+                    else:
+                        # Raise before writing anything, so error pages are never saved as the file
+                        resp.raise_for_status()
+                        if resp.status_code != 206:
+                            done = 0  # The server ignored the range, so start again
+                        with open(part, "ab" if done else "wb") as f:
+                            async for chunk in resp.aiter_bytes():
+                                f.write(chunk)
+                                done += len(chunk)
+                                if on_progress is not None:
+                                    on_progress(_file, done, total)
+
+            part.replace(dest)
+            return dest
+
+        downloads = [
+            asyncio.ensure_future(download(_file))
+            async for _file in self.walk_files(fp)
+            if not _file.is_dir
+        ]
+        try:
+            return list(await asyncio.gather(*downloads))
+        finally:
+            for task in downloads:
+                task.cancel()
+            await asyncio.gather(*downloads, return_exceptions=True)
+
     async def add_filepath(
         self, fp: str, data: bytes, author: str = "", _license: str = "unknown"
     ):
@@ -394,23 +589,20 @@ class Session:
         if userid is None:
             userid = await self.user_id
 
-        entries = []
-        for page, _ in zip(*commons.generate_page_range(limit, offset, 10, 0)):
+        async def fetch_page(page: int) -> list[blog.Entry]:
             resp = await self.rq.get(
                 "https://vle.kegs.org.uk/blog/index.php",
                 params={"blogpage": page, "userid": userid},
             )
-            soup = BeautifulSoup(resp.text, "html.parser")
-            entries += self._find_blog_entires(soup)
+            soup = parsing.soup(resp.text, parsing.MAIN)
+            return self._find_blog_entires(soup)
 
-        return entries
+        return await paginator.Paginator(
+            fetch_page, limit=limit, offset=offset, items_per_page=10, starting_page=0
+        ).collect()
 
-    async def connect_blog_entries(
+    def _blog_entry_filters(
         self,
-        *,
-        limit: int = 10,
-        offset: int = 0,
-        # search filters
         _tag: Optional[tag.Tag] = None,
         _course: Optional[course.Course] = None,
         _user: Optional[user.User] = None,
@@ -422,13 +614,7 @@ class Session:
         groupid: Optional[int] = None,
         courseid: Optional[int] = None,
         search: Optional[str] = None,
-    ):
-        if offset != 0:
-            warnings.warn(
-                "offset+limit -> page+perpage conversion has not been made yet! Offset will be ignored",
-                category=exceptions.UnimplementedWarning,
-            )
-
+    ) -> list[dict[str, Any]]:
         filters = []
 
         def add_filter(name: str, value):
@@ -451,13 +637,78 @@ class Session:
         add_filter("courseid", courseid)
         add_filter("search", search)
 
-        data = await self.webservice(
-            "core_blog_get_entries", page=0, perpage=limit, filters=filters
+        return filters
+
+    def iter_blog_entries(
+        self,
+        *,
+        limit: Optional[int] = 10,
+        offset: int = 0,
+        prefetch: int = 4,
+        **filters,
+    ) -> paginator.Paginator[blog.Entry]:
+        """
+        Stream blog entries. Takes the same search filters as connect_blog_entries
+        :param limit: number of entries to yield. None for all of them
+        :param prefetch: number of pages to request at once
+        """
+        filter_list = self._blog_entry_filters(**filters)
+        per_page = max(1, min(limit or 100, 100))
+
+        async def fetch_page(page: int) -> list[blog.Entry]:
+            data = await self.webservice(
+                "core_blog_get_entries",
+                page=page,
+                perpage=per_page,
+                filters=filter_list,
+            )
+            return [
+                blog.Entry.from_json(entry_data, self)
+                for entry_data in data["entries"]
+            ]
+
+        return paginator.Paginator(
+            fetch_page,
+            limit=limit,
+            offset=offset,
+            items_per_page=per_page,
+            starting_page=0,
+            prefetch=prefetch,
         )
 
-        return [
-            blog.Entry.from_json(entry_data, self) for entry_data in data["entries"]
-        ]
+    async def connect_blog_entries(
+        self,
+        *,
+        limit: int = 10,
+        offset: int = 0,
+        # search filters
+        _tag: Optional[tag.Tag] = None,
+        _course: Optional[course.Course] = None,
+        _user: Optional[user.User] = None,
+        tagname: Optional[str] = None,
+        tagid: Optional[int] = None,
+        userid: Optional[int] = None,
+        cmid: Optional[int] = None,  # idk what this one is
+        entryid: Optional[int] = None,
+        groupid: Optional[int] = None,
+        courseid: Optional[int] = None,
+        search: Optional[str] = None,
+    ) -> list[blog.Entry]:
+        return await self.iter_blog_entries(
+            limit=limit,
+            offset=offset,
+            _tag=_tag,
+            _course=_course,
+            _user=_user,
+            tagname=tagname,
+            tagid=tagid,
+            userid=userid,
+            cmid=cmid,
+            entryid=entryid,
+            groupid=groupid,
+            courseid=courseid,
+            search=search,
+        ).collect()
 
     async def connect_blog_entry_by_id(self, _id: int):
         entry = blog.Entry(id=_id, _session=self)
@@ -467,7 +718,7 @@ class Session:
     # --- Tags ---
 
     async def connect_tag_by_name(self, name: str) -> tag.Tag:
-        _tag = tag.Tag(name, _session=self)
+        _tag = tag.Tag(name=name, _session=self)
         await _tag.update()
         return _tag
 
@@ -496,7 +747,10 @@ class Session:
         )
         ret = calendar.Calendar(_sess=self)
 
-        soup = BeautifulSoup(resp.text, "html.parser")
+        soup = parsing.soup(
+            resp.text,
+            SoupStrainer("div", {"class": parsing.has_class("calendarwrapper")}),
+        )
         div = soup.find("div", {"class": "calendarwrapper"})
 
         if view_type == "month":
@@ -521,7 +775,7 @@ class Session:
                     row_text = row.text.strip()
                     match row_type:
                         case "When":
-                            _date = dateparser.parse(row_text)
+                            _date = dates.parse_date(row_text)
                             assert _date is not None
                             cal_event.date = _date
                         case "Event type":
@@ -555,35 +809,113 @@ class Session:
         :param args:args to send to webservice api
         :return:
         """
+        return (await self.webservice_many([(name, args)]))[0]
+
+    async def _post_webservice(
+        self, calls: list[tuple[str, dict[str, Any]]]
+    ) -> list[dict[str, Any] | None]:
+        """
+        Send one POST containing all the given calls. If the sesskey has expired, it is refreshed and the calls from the
+        first one that failed onwards are resent (moodle stops at the first failure, so the ones before it succeeded).
+        :return: the raw response for each call, or None if moodle did not get round to it
+        """
+        responses = await self._send_webservice(calls)
+
+        failed = next(
+            (
+                i
+                for i, response in enumerate(responses)
+                if response is not None and _webservice_errorcode(response) == "invalidsesskey"
+            ),
+            None,
+        )
+        if failed is not None:
+            self._sesskey = None
+            responses[failed:] = await self._send_webservice(calls[failed:])
+
+        return responses
+
+    async def _send_webservice(
+        self, calls: list[tuple[str, dict[str, Any]]]
+    ) -> list[dict[str, Any] | None]:
         data = (
             await self.rq.post(
                 "https://vle.kegs.org.uk/lib/ajax/service.php",
-                params={"sesskey": await self.sesskey},  # "info": name
-                json=[{"methodname": name, "args": args}],
+                params={"sesskey": await self.sesskey},
+                json=[
+                    {"index": i, "methodname": name, "args": args}
+                    for i, (name, args) in enumerate(calls)
+                ],
             )
         ).json()
 
-        skip = False
         if isinstance(data, dict):
-            skip = "error" in data
+            # The whole request failed (e.g. invalid sesskey), so every call gets the same error
+            return [data] * len(calls)
 
-        if not skip:
-            data = data[0]
+        return data + [None] * (len(calls) - len(data))
 
-        if data["error"]:
-            try:
-                raise exceptions.WebServiceError(
-                    f"{data['exception']['errorcode']!r}: {data['exception']['message']!r}"
-                )
-            except KeyError:
-                try:
+    async def webservice_many(
+        self,
+        calls: list[tuple[str, dict[str, Any]]],
+        *,
+        return_exceptions: bool = False,
+        chunk_size: int = 100,
+    ) -> list[Any]:
+        """
+        Make many webservice calls, packing up to `chunk_size` calls into each request
+        :param calls: list of (methodname, args) tuples
+        :param return_exceptions: if True, failed calls have their WebServiceError put in the result list instead of being raised
+        :param chunk_size: max number of calls sent in one request
+        :return: the data of each call, in the same order as `calls`
+        """
+        results: list[Any] = [None] * len(calls)
+
+        for chunk_start in range(0, len(calls), chunk_size):
+            pending = list(range(chunk_start, min(chunk_start + chunk_size, len(calls))))
+
+            while pending:
+                responses = await self._post_webservice([calls[i] for i in pending])
+
+                # Moodle stops processing a batch at the first failing call, so the calls after it need resending
+                skipped = []
+                for i, response in zip(pending, responses):
+                    if response is None:
+                        skipped.append(i)
+                        continue
+
+                    try:
+                        results[i] = _webservice_result(response)
+                    except exceptions.WebServiceError as e:
+                        results[i] = e
+
+                if len(skipped) == len(pending):
                     raise exceptions.WebServiceError(
-                        f"{data['errorcode']!r}: {data['error']!r}"
+                        f"No responses received for {len(pending)} webservice calls"
                     )
-                except KeyError:
-                    raise exceptions.WebServiceError(f"Error: {data}")
+                pending = skipped
+
+        if not return_exceptions:
+            for result in results:
+                if isinstance(result, exceptions.WebServiceError):
+                    raise result
+
+        return results
+
+    @property
+    def batcher(self) -> WebServiceBatcher:
+        """The webservice batcher attached to this session, used by batched_webservice"""
+        if self._batcher is None:
+            self._batcher = WebServiceBatcher(self)
+        return self._batcher
 
-        return data["data"]
+    async def batched_webservice(self, name, /, **args):
+        """
+        Same as webservice, except that calls made at around the same time (e.g. with asyncio.gather) are sent in one request
+        :param name:methodname of webservice api, e.g. core_course_search_courses
+        :param args:args to send to webservice api
+        """
+        return await self.batcher.call(name, **args)
 
     async def search_courses(self, query: str):
         data = await self.webservice(
@@ -606,6 +938,103 @@ class Session:
         return data
 
 
+def _webservice_errorcode(data: dict[str, Any]) -> str | None:
+    """Get the error code of a failed webservice response"""
+    if not data.get("error"):
+        return None
+
+    exception = data.get("exception")
+    if isinstance(exception, dict) and "errorcode" in exception:
+        return exception["errorcode"]
+    return data.get("errorcode")
+
+
+def _webservice_result(data: dict[str, Any]) -> Any:
+    """Get the data from a webservice response, raising an error if it failed"""
+    if data["error"]:
+        exception = data.get("exception")
+        if isinstance(exception, dict) and "errorcode" in exception:
+            raise exceptions.WebServiceError(
+                f"{exception['errorcode']!r}: {exception.get('message')!r}",
+                exception["errorcode"],
+            )
+        elif "errorcode" in data:
+            raise exceptions.WebServiceError(
+                f"{data['errorcode']!r}: {data['error']!r}", data["errorcode"]
+            )
+        else:
+            raise exceptions.WebServiceError(f"Error: {data}")
+
+    return data["data"]
+
+
+@dataclass
+class WebServiceBatcher:
+    """
+    Coalesces webservice calls made within `window` seconds of each other into one request
+    """
+
+    session: Session = field(repr=False)
+
+    window: float = 0.01
+    max_size: int = 100
+
+    _pending: list[tuple[str, dict[str, Any], asyncio.Future]] = field(
+        repr=False, default_factory=list
+    )
+    _timer: Optional[asyncio.TimerHandle] = field(repr=False, default=None)
+    _tasks: set[asyncio.Task] = field(repr=False, default_factory=set)
+
+    async def call(self, name: str, /, **args) -> Any:
+        """Queue a webservice call and wait for its result"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((name, args, future))
+
+        if len(self._pending) >= self.max_size:
+            self._send_pending()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._send_pending)
+
+        return await future
+
+    async def flush(self):
+        """Send any queued calls now and wait for all sent batches to finish"""
+        self._send_pending()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def _send_pending(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.ensure_future(self._send(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, batch: list[tuple[str, dict[str, Any], asyncio.Future]]):
+        try:
+            results = await self.session.webservice_many(
+                [(name, args) for name, args, _ in batch], return_exceptions=True
+            )
+        except Exception as e:
+            for *_, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (*_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+
 # --- * ---
 
 
@@ -617,11 +1046,11 @@ async def login(username: str, password: str) -> Session:
     :return: a new session
     """
 
-    rq = httpx.AsyncClient(headers=commons.headers.copy(), follow_redirects=True)
+    rq = transport.async_client(headers=commons.headers.copy(), follow_redirects=True)
 
     resp = await rq.get("https://vle.kegs.org.uk/login/index.php")
 
-    inputs = commons.eval_inputs(BeautifulSoup(resp.text, "html.parser"))
+    inputs = commons.eval_inputs(parsing.soup(resp.text, parsing.INPUTS))
     inputs["username"] = username
     inputs["password"] = password
     # inputs["anchor"] = None
@@ -637,7 +1066,7 @@ async def login_by_moodle(moodle_cookie: str) -> Session:
     :param moodle_cookie: The MoodleSession cookie (see in the application/storage tab of your browser devtools when you log in)
     :return: A new session
     """
-    rq = httpx.AsyncClient(
+    rq = transport.async_client(
         cookies={"MoodleSession": moodle_cookie}, follow_redirects=True
     )
 
@@ -8,23 +8,26 @@ import warnings
 from dataclasses import dataclass, field
 from urllib.parse import urlparse, parse_qs
 import httpx
-from typing_extensions import Self, Optional
+from typing_extensions import AsyncIterator, Final, Self, Optional
 
-import dateparser
+import bs4
 import requests
-from bs4 import BeautifulSoup, PageElement
+from bs4 import BeautifulSoup, PageElement, SoupStrainer
 from . import session, user, blog
-from ..util import commons
+from ..util import commons, dates, paginator, parsing
 
+TAGINDEX_PER_PAGE: Final[int] = 5
 
-@dataclass
+
+@dataclass(slots=True)
 class Tag:
     _session: session.Session = field(repr=False)
 
     name: Optional[str] = None
     exists: Optional[bool] = None
 
-    description: Optional[PageElement] = field(default=None, repr=False)
+    description: Optional[str] = field(default=None, repr=False)
+    """HTML of the tag description"""
     related_tags: list[Tag] = field(default_factory=list)
 
     id: Optional[int] = None
@@ -44,6 +47,11 @@ class Tag:
             _session=_sess,
         )
 
+    @property
+    def description_soup(self) -> Optional[BeautifulSoup]:
+        """The description, parsed (each time this is accessed)"""
+        return parsing.fragment(self.description)
+
     @property
     def url(self):
         if self.id:
@@ -57,7 +65,7 @@ class Tag:
     def _update_from_response(self, response: httpx.Response):
         self.exists = response.url != "https://vle.kegs.org.uk/tag/search.php"
         if self.exists:
-            soup = BeautifulSoup(response.text, "html.parser")
+            soup = parsing.soup(response.text, parsing.MAIN)
             main = soup.find("div", {"role": "main"})
 
             assert main is not None
@@ -70,7 +78,9 @@ class Tag:
             self.id = int(q_parse["id"][0])
 
             # get desc
-            self.description = main.find("div", {"class": "tag-description"})
+            self.description = parsing.inner_html(
+                main.find("div", {"class": "tag-description"})
+            )
 
             # get related tags
             self.related_tags.clear()
@@ -95,92 +105,132 @@ class Tag:
         resp = await self._session.rq.get(self.url)
         self._update_from_response(resp)
 
-    async def connect_interested_users(self, limit: int = 5, offset: int = 0):
-        users = []
-
-        for page in commons.generate_page_range(limit, offset, 5, 0)[0]:
-            data = await self._session.webservice(
-                "core_tag_get_tagindex",
-                tagindex={
-                    "tc": 1,
-                    "tag": self.name,
-                    "ta": 1,  # 1 = users, 3 = courses, 7 = blog posts.
-                    "page": str(page),
-                },
-            )
-
-            soup = BeautifulSoup(data["content"], "html.parser")
-
-            lis = soup.find_all("li", {"class": "media"})
-            if not lis:
-                break  # if it is empty, don't need to make more webreqs
+    async def _get_tagindex(self, page: int, ta: int) -> BeautifulSoup:
+        """
+        Fetch a page of the tag index
+        :param ta: tag area. 1 = users, 3 = courses, 7 = blog posts.
+        """
+        data = await self._session.batched_webservice(
+            "core_tag_get_tagindex",
+            tagindex={
+                "tc": 1,
+                "tag": self.name,
+                "ta": ta,
+                "page": str(page),
+            },
+        )
+        return BeautifulSoup(data["content"], "html.parser")
 
-            for li in lis:
-                a = li.find("a")
-                href = a.attrs["href"]
-                q_parse = parse_qs(urlparse(href).query)
+    def _iter_tagindex(
+        self, ta: int, limit: int, offset: int, concurrency: int
+    ) -> paginator.Paginator[bs4.Tag]:
+        """
+        Stream the <li> items of tag index pages, fetching `concurrency` pages at a time and stopping at the first empty page
+        """
 
-                uid = int(q_parse["id"][0])
+        async def fetch_page(page: int) -> list[bs4.Tag]:
+            # Concurrent calls are coalesced into one webservice request by the session's batcher
+            soup = await self._get_tagindex(page, ta)
+            return soup.find_all("li", {"class": "media"})
+
+        return paginator.Paginator(
+            fetch_page,
+            limit=limit,
+            offset=offset,
+            items_per_page=TAGINDEX_PER_PAGE,
+            starting_page=0,
+            prefetch=concurrency,
+        )
 
-                img = a.find("img")
-                src = img.attrs["src"]
+    def _user_from_li(self, li: bs4.Tag) -> user.User:
+        a = li.find("a")
+        href = a.attrs["href"]
+        q_parse = parse_qs(urlparse(href).query)
 
-                body = li.find("div", {"class": "media-body"})
-                name = body.text.strip()
+        uid = int(q_parse["id"][0])
 
-                users.append(
-                    user.User(id=uid, name=name, image_url=src, _session=self._session)
-                )
+        img = a.find("img")
+        src = img.attrs["src"]
 
-        return users
+        body = li.find("div", {"class": "media-body"})
+        name = body.text.strip()
 
-    async def connect_tagged_blog_entries(self, limit: int = 5, offset: int = 0):
-        entries = []
+        return user.User(id=uid, name=name, image_url=src, _session=self._session)
 
-        for page in commons.generate_page_range(limit, offset, 5, 0)[0]:
-            data = self._req_get_tagindex(page, 7).json()[0]["data"]["content"]
-            soup = BeautifulSoup(data, "html.parser")
+    def _entry_from_li(self, li: bs4.Tag) -> blog.Entry:
+        a = li.find("a")
+        href = a.attrs["href"]
+        q_parse = parse_qs(urlparse(href).query)
 
-            for li in soup.find_all("li", {"class": "media"}):
-                a = li.find("a")
-                href = a.attrs["href"]
-                q_parse = parse_qs(urlparse(href).query)
+        uid = int(q_parse["id"][0])
 
-                uid = int(q_parse["id"][0])
+        img = a.find("img")
+        src = img.attrs["src"]
 
-                img = a.find("img")
-                src = img.attrs["src"]
+        body = li.find("div", {"class": "media-body"})
 
-                body = li.find("div", {"class": "media-body"})
+        entry_a = body.find("a")
+        subject = entry_a.contents[0].strip()
 
-                entry_a = body.find("a")
-                subject = entry_a.contents[0].strip()
+        href = entry_a.attrs["href"]
+        q_parse = parse_qs(urlparse(href).query)
+        entry_id = int(q_parse["entryid"][0])
 
-                href = entry_a.attrs["href"]
-                q_parse = parse_qs(urlparse(href).query)
-                entry_id = int(q_parse["entryid"][0])
+        muted = body.find("div", {"class": "muted"})
+        split = muted.text.split(",")
+        author_name = split[0].strip()
+        date = dates.parse_date(",".join(split[1:]))
 
-                muted = body.find("div", {"class": "muted"})
-                split = muted.text.split(",")
-                author_name = split[0].strip()
-                date = dateparser.parse(",".join(split[1:]))
+        author = user.User(
+            id=uid, name=author_name, image_url=src, _session=self._session
+        )
 
-                author = user.User(
-                    id=uid, name=author_name, image_url=src, _session=self._session
-                )
+        assert date is not None
+        return blog.Entry(
+            id=entry_id,
+            subject=subject,
+            date_created=date,
+            author=author,
+            _session=self._session,
+        )
 
-                assert date is not None
-                entries.append(
-                    blog.Entry(
-                        id=entry_id,
-                        subject=subject,
-                        date_created=date,
-                        author=author,
-                        _session=self._session,
-                    )
-                )
+    async def iter_interested_users(
+        self, limit: int = 5, offset: int = 0, *, concurrency: int = 4
+    ) -> AsyncIterator[user.User]:
+        """
+        Yield users interested in this tag, fetching `concurrency` pages at a time
+        """
+        async for li in self._iter_tagindex(1, limit, offset, concurrency):
+            yield self._user_from_li(li)
+
+    async def connect_interested_users(
+        self, limit: int = 5, offset: int = 0, *, concurrency: int = 4
+    ) -> list[user.User]:
+        return [
+            _user
+            async for _user in self.iter_interested_users(
+                limit, offset, concurrency=concurrency
+            )
+        ]
 
-        return entries
+    async def iter_tagged_blog_entries(
+        self, limit: int = 5, offset: int = 0, *, concurrency: int = 4
+    ) -> AsyncIterator[blog.Entry]:
+        """
+        Yield blog entries tagged with this tag, fetching `concurrency` pages at a time
+        """
+        async for li in self._iter_tagindex(7, limit, offset, concurrency):
+            yield self._entry_from_li(li)
+
+    async def connect_tagged_blog_entries(
+        self, limit: int = 5, offset: int = 0, *, concurrency: int = 4
+    ) -> list[blog.Entry]:
+        return [
+            entry
+            async for entry in self.iter_tagged_blog_entries(
+                limit, offset, concurrency=concurrency
+            )
+        ]
 
     async def edit(
         self,
@@ -212,7 +262,7 @@ class Tag:
             "https://vle.kegs.org.uk/tag/edit.php", params={"id": self.id}
         )
 
-        soup = BeautifulSoup(resp.text, "html.parser")
+        soup = parsing.soup(resp.text, SoupStrainer("input"))
 
         # it appears that order matters??? Not sure
         assert related_tags is not None
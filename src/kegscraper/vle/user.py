@@ -1,20 +1,35 @@
 from __future__ import annotations
 
-import dateparser
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
 from typing_extensions import Final, Optional
 from dataclasses import dataclass, field
 import warnings
 from datetime import datetime
 
 from . import session
+from ..util import dates, parsing
 
 DELETED_USER: Final[str] = "This user account has been deleted"
 INVALID_USER: Final[str] = "Invalid user"
 FORBIDDEN_USER: Final[str] = "The details of this user are not available to you"
 
+_PROFILE_STRAINER: Final = SoupStrainer(
+    ["div", "img"],
+    {"class": parsing.has_class("page-header-headings", "userpicture", "userprofile")},
+)
 
-@dataclass
+
+def profile_flag(text: str) -> Optional[str]:
+    """
+    :return: DELETED_USER, INVALID_USER or FORBIDDEN_USER if a profile page's HTML shows it, otherwise None
+    """
+    for flag in (DELETED_USER, INVALID_USER, FORBIDDEN_USER):
+        if flag in text:
+            return flag
+    return None
+
+
+@dataclass(slots=True)
 class User:
     _session: session.Session = field(repr=False)
 
@@ -35,6 +50,7 @@ class User:
     last_access: Optional[datetime] = field(repr=False, default=None)
 
     description: Optional[str] = field(repr=False, default=None)
+    """HTML of the profile description"""
 
     flags: list[str] = field(repr=False, default_factory=list)
 
@@ -48,17 +64,48 @@ class User:
             == "https://vle.kegs.org.uk/theme/image.php/trema/core/1585328846/u/f1"
         )
 
+    @property
+    def description_soup(self) -> Optional[BeautifulSoup]:
+        """The description, parsed (each time this is accessed)"""
+        return parsing.fragment(self.description)
+
     @property
     async def profile_image(self) -> bytes:
         assert self.image_url is not None, "Need image url to get image!"
         return (await self._session.rq.get(self.image_url)).content
 
+    def update_from_json(self, data: dict):
+        """
+        Update from a user as returned by the core_user_get_users_by_field webservice
+        """
+        self.id = data.get("id", self.id)
+        self.name = data.get("fullname", self.name)
+        self.email = data.get("email", self.email)
+        self.image_url = data.get("profileimageurl", self.image_url)
+        self.city = data.get("city", self.city)
+        self.country = data.get("country", self.country)
+        self.web_page = data.get("url", self.web_page)
+        self.description = data.get("description", self.description)
+
+        if data.get("interests"):
+            self.interests = [interest.strip() for interest in data["interests"].split(",")]
+
+        if data.get("firstaccess"):
+            self.first_access = datetime.fromtimestamp(data["firstaccess"])
+        if data.get("lastaccess"):
+            self.last_access = datetime.fromtimestamp(data["lastaccess"])
+
     async def update_from_id(self):
         resp = await self._session.rq.get(
             "https://vle.kegs.org.uk/user/profile.php", params={"id": self.id}
         )
-        text = resp.text
-        soup = BeautifulSoup(text, "html.parser")
+        self.update_from_profile(resp.text)
+
+    def update_from_profile(self, text: str):
+        """
+        Update from the HTML of the user's profile page
+        """
+        soup = parsing.soup(text, _PROFILE_STRAINER)
 
         self.flags = []
 
@@ -87,7 +134,9 @@ class User:
 
             user_profile = soup.find("div", {"class": "userprofile"})
             assert user_profile is not None
-            self.description = user_profile.find("div", {"class": "description"})
+            self.description = parsing.inner_html(
+                user_profile.find("div", {"class": "description"})
+            )
 
             categories = user_profile.find_all("section", {"class", "node_category"})
 
@@ -111,13 +160,13 @@ class User:
                         item_name = dl.find("dt").contents[0]
 
                         if item_name == "Email address":
-                            self.email = dl.find("a").contents[0]
+                            self.email = str(dl.find("a").contents[0])
 
                         elif item_name == "City/town":
-                            self.city = dd.contents[0]
+                            self.city = str(dd.contents[0])
 
                         elif item_name == "Country":
-                            self.country = dd.contents[0]
+                            self.country = str(dd.contents[0])
 
                         elif item_name == "Web page":
                             self.web_page = dl.find("a").get("href")
@@ -138,7 +187,7 @@ class User:
                 elif category_name == "Course details":
                     for anchor in category.find_all("a"):
                         courses.append(
-                            (anchor.get("href").split("=")[-1], anchor.contents[0])
+                            (anchor.get("href").split("=")[-1], str(anchor.contents[0]))
                         )
                     if courses:
                         self.courses = courses
@@ -155,6 +204,6 @@ class User:
                         date_str = date_str[: date_str.find("(")]
 
                         if i == 0:
-                            self.first_access = dateparser.parse(date_str)
+                            self.first_access = dates.parse_date(date_str)
                         else:
-                            self.last_access = dateparser.parse(date_str)
+                            self.last_access = dates.parse_date(date_str)
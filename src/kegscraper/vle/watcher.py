@@ -0,0 +1,183 @@
+"""
+ForumWatcher class, for polling forums and only fetching the discussions that changed
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+
+from datetime import datetime
+from dataclasses import dataclass, field
+from os import PathLike
+from typing_extensions import Any, AsyncIterator, Optional
+
+from . import session, forum
+
+
+@dataclass
+class DiscussionState:
+    """What a ForumWatcher last saw of a discussion"""
+
+    date_modified: Optional[float]
+    reply_count: Optional[int]
+    last_post_id: Optional[int] = None
+
+
+@dataclass
+class ForumWatcher:
+    """
+    Polls some forums for new posts.
+
+    Each poll lists discussions by latest post first (through the webservice), and stops listing at the first
+    unpinned discussion that has not changed since the last poll. Only discussions whose reply count or modification
+    time changed are fetched, and only their posts newer than the last seen post (or created since the last poll) are returned.
+
+    Discussions the watcher has not seen before are only fetched if they were modified after `since`
+    (default: when the watcher was made), so the first poll doesn't fetch the whole forum.
+    The state can be saved to/loaded from a JSON file.
+    """
+
+    sess: session.Session
+    forum_ids: list[int]
+    since: datetime = field(default_factory=datetime.now)
+    """Posts created before this are never reported. Moves forward with each poll"""
+    concurrency: int = 4
+    """Max number of discussions fetched at once"""
+    per_page: int = 20
+
+    discussions: dict[int, dict[int, DiscussionState]] = field(default_factory=dict)
+    """forum id: {discussion id: state}"""
+
+    def _changed(self, forum_id: int, discussion: forum.Discussion) -> bool:
+        modified = discussion.date_modified.timestamp() if discussion.date_modified else None
+
+        state = self.discussions.get(forum_id, {}).get(discussion.id)
+        if state is None:
+            # Not seen before, so only worth fetching if there has been activity since
+            return modified is not None and modified > self.since.timestamp()
+
+        return (modified, discussion.reply_count) != (state.date_modified, state.reply_count)
+
+    async def _changed_discussions(self, _forum: forum.Forum) -> list[forum.Discussion]:
+        # Pages are fetched one at a time, as most polls stop on the first one
+        changed = []
+        page = 0
+        while True:
+            discussions = await _forum._get_discussions(
+                page, self.per_page, forum.SORT_LASTPOST_DESC
+            )
+            for discussion in discussions:
+                if self._changed(_forum.id, discussion):
+                    changed.append(discussion)
+                elif not discussion.pinned:
+                    # Discussions are sorted by latest post, so the rest are unchanged too
+                    return changed
+
+            if len(discussions) < self.per_page:
+                return changed
+            page += 1
+
+    async def poll(self) -> list[forum.Post]:
+        """
+        Check the forums for new posts
+        :return: the new posts, oldest first
+        """
+        polled_at = datetime.now()
+        since = self.since.timestamp()
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def fetch(forum_id: int, discussion: forum.Discussion) -> list[forum.Post]:
+            async with semaphore:
+                await discussion.update()
+
+            states = self.discussions.setdefault(forum_id, {})
+            state = states.get(discussion.id)
+            last_post_id = state.last_post_id if state else None
+
+            if last_post_id is not None:
+                new_posts = [post for post in discussion.posts if post.id > last_post_id]
+            else:
+                new_posts = [
+                    post
+                    for post in discussion.posts
+                    if post.date is not None and post.date.timestamp() > since
+                ]
+
+            post_ids = [post.id for post in discussion.posts if post.id is not None]
+            states[discussion.id] = DiscussionState(
+                discussion.date_modified.timestamp() if discussion.date_modified else None,
+                discussion.reply_count,
+                max(post_ids + ([last_post_id] if last_post_id is not None else []), default=None),
+            )
+            return new_posts
+
+        forums = [forum.Forum(forum_id, _session=self.sess) for forum_id in self.forum_ids]
+        changed = await asyncio.gather(*(self._changed_discussions(_forum) for _forum in forums))
+
+        results = await asyncio.gather(
+            *(
+                fetch(_forum.id, discussion)
+                for _forum, discussions in zip(forums, changed)
+                for discussion in discussions
+            )
+        )
+
+        self.since = polled_at
+        posts = [post for new_posts in results for post in new_posts]
+        posts.sort(key=lambda post: (post.date or datetime.min, post.id or 0))
+        return posts
+
+    async def watch(self, interval: float = 300) -> AsyncIterator[forum.Post]:
+        """
+        Poll forever, every `interval` seconds, yielding each new post as it is found
+        """
+        while True:
+            for post in await self.poll():
+                yield post
+            await asyncio.sleep(interval)
+
+    def to_json(self) -> dict[str, Any]:
+        return {
+            "since": self.since.isoformat(),
+            "discussions": {
+                str(forum_id): {
+                    str(discussion_id): [state.date_modified, state.reply_count, state.last_post_id]
+                    for discussion_id, state in states.items()
+                }
+                for forum_id, states in self.discussions.items()
+            },
+        }
+
+    @classmethod
+    def from_json(cls, sess: session.Session, forum_ids: list[int], data: dict[str, Any], **kwargs) -> ForumWatcher:
+        return cls(
+            sess,
+            forum_ids,
+            since=datetime.fromisoformat(data["since"]),
+            discussions={
+                int(forum_id): {
+                    int(discussion_id): DiscussionState(*state)
+                    for discussion_id, state in states.items()
+                }
+                for forum_id, states in data["discussions"].items()
+            },
+            **kwargs,
+        )
+
+    def save(self, path: str | PathLike):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_json(), f)
+
+    @classmethod
+    def load(cls, sess: session.Session, forum_ids: list[int], path: str | PathLike, **kwargs) -> ForumWatcher:
+        """
+        Load a watcher saved with `save`. If the file does not exist, start a new one
+        """
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return cls(sess, forum_ids, **kwargs)
+
+        return cls.from_json(sess, forum_ids, data, **kwargs)
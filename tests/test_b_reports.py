@@ -0,0 +1,65 @@
+import base64
+import io
+import random
+
+import pytest
+
+from kegscraper.bromcom import reports
+
+
+def _json_string(data: bytes, rng: random.Random) -> bytes:
+    """Encode data like GetReport does: a JSON string of base64, with some characters escaped"""
+    out = [b'"']
+    for char in base64.b64encode(data).decode():
+        if char == "/":
+            out.append(rng.choice([b"/", b"\\/"]))
+        elif char in "+=" and rng.random() < 0.5:
+            out.append(b"\\u%04x" % ord(char))
+        else:
+            out.append(char.encode())
+    out.append(b'"')
+    return b"".join(out)
+
+
+def test_base64_writer_fuzz():
+    rng = random.Random(1234)
+    for _ in range(300):
+        data = rng.randbytes(rng.randint(0, 300))
+        encoded = _json_string(data, rng)
+
+        # Split at random points, so chunks end mid-escape and mid-quad
+        cuts = sorted(rng.sample(range(len(encoded) + 1), rng.randint(0, min(len(encoded), 20))))
+        chunkings = [
+            [encoded[i:j] for i, j in zip([0, *cuts], [*cuts, len(encoded)])],
+            [encoded[i : i + 1] for i in range(len(encoded))],
+        ]
+
+        for chunks in chunkings:
+            f = io.BytesIO()
+            writer = reports._Base64Writer(f)
+            for chunk in chunks:
+                writer.feed(chunk)
+            writer.close()
+
+            assert f.getvalue() == data
+            assert writer.size == len(data)
+
+
+@pytest.mark.parametrize(
+    "body",
+    [
+        b"<!DOCTYPE html><html><body>Login</body></html>",
+        b'{"error": "Report not found"}',
+        b'"QUJD<b>RA=="',
+        b'"QUJD\\"RA=="',
+        b'"QUJDRA==',
+        b'"QUJDRA=="<html>',
+        b'"QUJDRA"',
+    ],
+)
+def test_base64_writer_rejects_other_bodies(body):
+    writer = reports._Base64Writer(io.BytesIO())
+    with pytest.raises(ValueError):
+        for i in range(0, len(body), 3):
+            writer.feed(body[i : i + 3])
+        writer.close()
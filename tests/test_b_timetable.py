@@ -1,7 +1,13 @@
 from kegscraper import bromcom
 import os
 import asyncio
+from datetime import datetime, timedelta
 from pprint import pprint
+from urllib.parse import parse_qs
+
+import httpx
+
+from kegscraper.bromcom import timetable, attendance, lessontable, sync
 
 
 async def test_b_timetable():
@@ -39,5 +45,233 @@ async def test_b_timetable():
     print(await sess.bookmarks_data)
 
 
+def test_mode_timetable():
+    monday = datetime(2024, 9, 2, 9)
+    lessons = []
+    for week in range(4):
+        for day in range(5):
+            for period, subject in (("1", "Maths"), ("2", "English")):
+                if week == 2 and day == 0 and period == "1":
+                    subject = "PSHE"
+                start = monday + timedelta(weeks=week, days=day, hours=int(period))
+                lessons.append(
+                    timetable.Lesson(
+                        period, subject, None, "R1", None, None, None,
+                        start, start + timedelta(hours=1),
+                    )
+                )
+
+    mode = timetable.get_mode_timetable(lessons)
+    assert list(mode) == timetable.WEEKDAYS
+    assert mode["Monday"]["1"].subject == "Maths"
+    assert mode["Monday"]["1"] is lessons[0]
+    assert mode["Friday"]["2"].subject == "English"
+
+
+def test_attendance_chart():
+    page = b"""<script type="text/javascript">
+    $(document).ready(function () {
+        var AttendanceChart = c3.generate({
+            bindto : "#AttendanceChart",
+            data: {
+                columns:[["Present (P)", 176],
+                    ["Late (L)", 21], ["Authorised Absence (C)", 3]],
+                type: 'donut'
+            }
+        });
+    });</script>"""
+
+    columns = attendance.extract_chart_columns(page)
+    assert columns == [["Present (P)", 176], ["Late (L)", 21], ["Authorised Absence (C)", 3]]
+    assert attendance.extract_chart_columns(b"<html></html>") is None
+
+    breakdown = attendance.AttendanceBreakdown.from_columns(columns)
+    assert breakdown.total == 200
+    assert (breakdown.present, breakdown.late) == (176, 21)
+    assert breakdown.attendance_rate == 197 / 200
+
+
+def test_lesson_table():
+    monday = datetime(2024, 9, 2, 9)
+    lessons = []
+    for week in range(2):
+        for day in range(5):
+            for period, subject in (("1", "Maths"), ("2", "English")):
+                start = monday + timedelta(weeks=week, days=day, hours=int(period))
+                lessons.append(
+                    timetable.Lesson(
+                        period, subject, None, "R1" if week == 0 else None, "Mr A", 12, week,
+                        start, start + timedelta(hours=1), week_a_b="ab"[week],
+                    )
+                )
+    lessons.append(timetable.Lesson("3", "PSHE", None, None, None, None, None, None, None))
+
+    table = lessontable.LessonTable.from_lessons(lessons)
+    assert len(table) == 21
+    assert table.to_lessons() == lessons
+
+    maths_b = table.filter(subject="Maths", week_a_b="b")
+    assert [lesson.start.weekday() for lesson in maths_b] == [0, 1, 2, 3, 4]
+    assert all(lesson.room is None and lesson.week_id == 1 for lesson in maths_b)
+    assert len(table.filter(room=None)) == 11
+    assert len(table.filter(start=None)) == 1
+    assert len(table.filter(subject="Art")) == 0
+
+    first_week = table.between(monday, monday + timedelta(weeks=1))
+    assert first_week.to_lessons() == lessons[:10]
+
+    groups = table.group_by("weekday", "period")
+    assert list(groups)[:2] == [(0, "1"), (0, "2")]
+    assert groups[(4, "2")].column("start") == [lessons[9].start, lessons[19].start]
+    assert groups[(None, "3")].to_lessons() == lessons[20:]
+
+
+class _FakeTimetableSession:
+    """Serves a timetable of one lesson a day, with an optional room change"""
+
+    def __init__(self, weeks: list[timetable.WeekDate]):
+        self.username = "student"
+        self.weeks = weeks
+        self.room_changes: dict[datetime, str] = {}
+
+    @property
+    async def week_index(self) -> timetable.WeekIndex:
+        return timetable.WeekIndex(self.weeks)
+
+    async def get_timetable_range(self, start_idx: int, end_idx: int) -> list[timetable.Lesson]:
+        lessons = []
+        for wdate in self.weeks[start_idx:end_idx]:
+            for day in range(5):
+                start = wdate.date + timedelta(days=day, hours=9)
+                room = self.room_changes.get(start, "R1")
+                lessons.append(
+                    timetable.Lesson("1", "Maths", None, room, None, None, None, start, start + timedelta(hours=1))
+                )
+        return lessons
+
+
+def test_timetable_sync_window(monkeypatch):
+    monday = datetime(2024, 9, 2)
+    weeks = [timetable.WeekDate(1, i, monday + timedelta(weeks=i)) for i in range(6)]
+    today = [monday + timedelta(days=1)]
+
+    class _Datetime(datetime):
+        @classmethod
+        def today(cls):
+            return today[0]
+
+    monkeypatch.setattr(sync, "datetime", _Datetime)
+
+    sess = _FakeTimetableSession(weeks)
+    timetable_sync = sync.TimetableSync(sess, weeks_ahead=2)
+    assert asyncio.run(timetable_sync.poll()) == []
+    assert asyncio.run(timetable_sync.poll()) == []
+
+    # A week later, the window covers a new week, whose lessons are not reported as added
+    today[0] += timedelta(weeks=1)
+    changed_start = monday + timedelta(weeks=1, days=2, hours=9)
+    sess.room_changes[changed_start] = "R2"
+    changes = asyncio.run(timetable_sync.poll())
+    assert [(change.kind, change.slot[0], change.changed_fields) for change in changes] == [
+        ("changed", changed_start, ["room"])
+    ]
+    assert len(timetable_sync.lessons) == 10
+
+    # The window end is kept between runs
+    restored = sync.TimetableSync.from_json(sess, timetable_sync.to_json())
+    assert restored.synced_until == timetable_sync.synced_until == monday + timedelta(weeks=3)
+    today[0] += timedelta(weeks=1)
+    assert asyncio.run(restored.poll()) == []
+
+
+def test_session_pool(tmp_path):
+    # username: the login token the mock site currently accepts
+    tokens = {}
+    logins = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/":
+            if request.method == "GET":
+                return httpx.Response(200, text='<input name="__RequestVerificationToken" value="x">')
+
+            form = parse_qs(request.content.decode())
+            username = form["username"][0]
+            logins.append(username)
+            tokens[username] = f"{username}-{len(logins)}"
+            return httpx.Response(200, headers={"Set-Cookie": f"auth={tokens[username]}; Path=/"})
+
+        auth = request.headers.get("Cookie", "").removeprefix("auth=")
+        if auth not in tokens.values():
+            return httpx.Response(302, headers={"Location": "/"})
+        return httpx.Response(200, text="Dashboard")
+
+    accounts = [bromcom.Account(1, username, "password") for username in ("a", "b")]
+    client_kwargs = {"transport": httpx.MockTransport(handler)}
+
+    async def start_pool() -> bromcom.SessionPool:
+        pool = bromcom.SessionPool(accounts, tmp_path, login_interval=0, client_kwargs=client_kwargs)
+        assert await pool.start() == {}
+        return pool
+
+    async def main():
+        pool = await start_pool()
+        assert pool.logins == 2 and sorted(logins) == ["a", "b"]
+        await pool.aclose()
+        assert (tmp_path / "a.json").stat().st_mode & 0o777 == 0o600
+
+        # Saved sessions that still work are reused, so only b logs in again
+        del tokens["b"]
+        logins.clear()
+        pool = await start_pool()
+        assert pool.logins == 1 and logins == ["b"]
+
+        # An expired session logs in again (once) and retries the requests
+        del tokens["a"]
+        logins.clear()
+        responses = await asyncio.gather(
+            *(pool.get("a").rq.get("https://www.bromcomvle.com/Home/Dashboard") for _ in range(3))
+        )
+        assert [response.text for response in responses] == ["Dashboard"] * 3
+        assert logins == ["a"] and pool.logins == 2
+        await pool.aclose()
+
+    asyncio.run(main())
+
+
+_DASHBOARD = """<span id="UsernameLabel"> A Student </span>
+<div><a title="Contact School">Contact</a><table>
+<tr><td><i class="icon"></i></td><td>Telephone:</td><td>01234 567890</td></tr>
+<tr><td><i class="icon"></i></td><td>Email:</td><td>office@example.com</td></tr>
+</table></div>"""
+
+
+def test_snapshot():
+    requested = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requested.append(request.url.path)
+        if request.url.path == "/Home/Dashboard":
+            return httpx.Response(200, text=_DASHBOARD)
+
+        widget = request.url.path.removeprefix("/Home/Get").removesuffix("WidgetData")
+        return httpx.Response(200, json=[{"widget": widget}])
+
+    async def main():
+        sess = bromcom.session.Session(rq=httpx.AsyncClient(transport=httpx.MockTransport(handler)), username="student")
+        snapshot = await sess.snapshot()
+
+        assert snapshot.name == "A Student" and await sess.name == "A Student"
+        assert snapshot.school_contact_details == {"Telephone": "01234 567890", "Email": "office@example.com"}
+        assert snapshot.attendance_status == [{"widget": "Attendance"}]
+        assert snapshot.reports_data == [{"widget": "Reports"}]
+        assert snapshot.exam_data == [{"widget": "ExamResults"}]
+        assert snapshot.bookmarks_data == [{"widget": "Bookmarks"}]
+        assert snapshot.homework_data == [{"widget": "Homework"}]
+
+    asyncio.run(main())
+    # The dashboard is fetched once, and the name is not fetched again
+    assert requested.count("/Home/Dashboard") == 1 and len(requested) == 6
+
+
 if __name__ == "__main__":
     asyncio.run(test_b_timetable())
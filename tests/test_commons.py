@@ -0,0 +1,90 @@
+import asyncio
+
+from datetime import datetime, timezone
+
+import pytest
+
+from kegscraper.util import commons, dates, exceptions, paginator
+
+
+def test_consume_json():
+    text = 'var M = {}; M.cfg = {"sesskey": "abc", "n": [1, 2.5e3, -0.5], "s": "a\\"}"}; M.yui = {};'
+    i = text.find("M.cfg = ") + len("M.cfg = ")
+
+    value, end = commons.scan_json(text, i)
+    assert value == {"sesskey": "abc", "n": [1, 2.5e3, -0.5], "s": 'a"}'}
+    assert text[end:].startswith("; M.yui")
+
+    assert commons.consume_json(text, i) == value
+    assert commons.consume_json("columns: [['x', 1]]".replace("'", '"'), 9) == [["x", 1]]
+    assert commons.consume_json("true, false") is True
+    assert commons.consume_json("  null") is None
+    assert commons.consume_json("-12}") == -12
+
+    with pytest.raises(exceptions.UnclosedJSONError):
+        commons.consume_json('{"a": [1, 2')
+    with pytest.raises(exceptions.UnclosedJSONError):
+        commons.consume_json('{"a": "unclosed')
+
+
+def test_paginator():
+    data = list(range(23))
+    fetched = []
+
+    async def fetch_page(page: int) -> list[int]:
+        fetched.append(page)
+        return data[(page - 1) * 5 : page * 5]
+
+    def collect(**kwargs) -> list[int]:
+        fetched.clear()
+        return asyncio.run(
+            paginator.Paginator(fetch_page, items_per_page=5, **kwargs).collect()
+        )
+
+    assert collect(limit=7, offset=3) == data[3:10]
+    assert sorted(fetched) == [1, 2]
+
+    assert collect(limit=100, offset=21, prefetch=2) == data[21:]
+    assert collect(limit=None, offset=4) == data[4:]
+    assert collect(limit=0) == []
+
+
+@pytest.mark.parametrize(
+    "text, fixed, expected",
+    [
+        # Moodle userdate formats
+        ("Monday, 1 January 2024, 10:00 AM", True, datetime(2024, 1, 1, 10)),
+        ("Monday, 1 January 2024, 14:30", True, datetime(2024, 1, 1, 14, 30)),
+        ("  Tuesday,  2 January 2024 ", True, datetime(2024, 1, 2)),
+        ("5 Jan 2024", True, datetime(2024, 1, 5)),
+        # ISO 8601, including a Z suffix
+        ("2024-01-05T10:00:00Z", True, datetime(2024, 1, 5, 10, tzinfo=timezone.utc)),
+        ("2024-01-05", True, datetime(2024, 1, 5)),
+        # .NET style dates, month first
+        ("01/05/2024 3:04:05 PM", True, datetime(2024, 1, 5, 15, 4, 5)),
+        ("1/5/2024", True, datetime(2024, 1, 5)),
+        # Not a fixed format, so parsed by dateparser
+        ("January 5th, 2024", False, datetime(2024, 1, 5)),
+        ("garbage xyz", False, None),
+        ("", False, None),
+        (None, False, None),
+    ],
+)
+def test_parse_date(text, fixed, expected):
+    assert dates.parse_date(text) == expected
+    if text:
+        assert (dates.parse_fixed(" ".join(text.split())) is not None) == fixed
+
+
+def test_parse_date_only_memoises_fixed_formats(monkeypatch):
+    calls = []
+    monkeypatch.setattr(dates.dateparser, "parse", lambda text: calls.append(text))
+
+    dates.clear_cache()
+    for _ in range(2):
+        dates.parse_date("Monday 2024")
+        dates.parse_date("Monday, 1 January 2024")
+
+    # Relative dates can change with the current date, so dateparser is asked every time
+    assert calls == ["Monday 2024", "Monday 2024"]
+    assert dates.cache_info().hits == 2
@@ -1,5 +1,9 @@
 import asyncio
+
+import httpx
+
 from kegscraper import it
+from kegscraper.util import commons
 
 
 async def test_it():
@@ -10,5 +14,49 @@ async def test_it():
             print(resp)
 
 
+# Newest first, 3 to a listing page, like the site
+_NEWS_IDS = list(range(107, 99, -1))
+
+
+def _news_handler(request: httpx.Request) -> httpx.Response:
+    params = request.url.params
+    if "p" in params:
+        news_id = int(params["p"])
+        return httpx.Response(
+            200,
+            text=f"""<div class="singlepage">Post {news_id}</div><div id="content"><div class="postmeta">
+<!-- <span>Written by <b>Admin</b> on</span> --><abbr title="2024-01-01T10:00:00">1 Jan</abbr></div>
+<div id="singlepostwrapper"><a rel="category" href="/?cat=7">News</a></div><div class="entry"> Body {news_id} </div></div>""",
+        )
+
+    page = int(params["paged"])
+    ids = _NEWS_IDS[(page - 1) * 3: page * 3]
+    if not ids:
+        return httpx.Response(404)
+    # Each item is linked twice, by its title and its 'read more'
+    return httpx.Response(200, text="".join(f'<a rel="bookmark" href="/?p={i}">Post {i}</a>' * 2 for i in ids))
+
+
+def test_news_category(monkeypatch):
+    monkeypatch.setattr(commons, "REQ", httpx.AsyncClient(transport=httpx.MockTransport(_news_handler)))
+
+    async def main():
+        items = await it.load_news_category(limit=4, offset=2, concurrency=2)
+        assert [item.id for item in items] == _NEWS_IDS[2:6]
+        assert (items[0].title, items[0].author, items[0].content) == ("Post 105", "Admin", "Body 105")
+        assert items[0].category == it.Category(7, "News")
+
+        # Streaming gives every item, in whatever order they were fetched
+        assert sorted([item.id async for item in it.iter_news_category(concurrency=3)]) == sorted(_NEWS_IDS)
+
+        # Closing the stream early doesn't leave fetches running
+        stream = it.iter_news_category(concurrency=3)
+        await anext(stream)
+        await stream.aclose()
+        assert asyncio.all_tasks() == {asyncio.current_task()}
+
+    asyncio.run(main())
+
+
 if __name__ == "__main__":
     asyncio.run(test_it())
@@ -0,0 +1,99 @@
+import asyncio
+import os
+
+import httpx
+
+from kegscraper.util import cache, transport
+
+
+class _Chunks(httpx.AsyncByteStream):
+    """A response body that records how many chunks have been pulled from it"""
+
+    def __init__(self, n: int):
+        self.n = n
+        self.pulled = 0
+
+    async def __aiter__(self):
+        for i in range(self.n):
+            self.pulled += 1
+            yield b"%d" % i
+
+
+def test_cache_streams_responses(tmp_path):
+    http_cache = cache.HTTPCache(tmp_path / "cache.sqlite")
+    bodies = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        bodies.append(_Chunks(5))
+        cache_control = "no-store" if request.url.path == "/private" else "max-age=60"
+        return httpx.Response(
+            200, headers={"cache-control": cache_control}, stream=bodies[-1]
+        )
+
+    mock = httpx.MockTransport(handler)
+
+    async def get(path: str) -> tuple[bytes, list[int]]:
+        request = httpx.Request("GET", f"https://example.com{path}")
+        response = await http_cache.handle_async_request(request, mock.handle_async_request)
+
+        # Nothing is read until the consumer reads
+        pulled = [bodies[-1].pulled]
+        content = b""
+        async for chunk in response.aiter_raw():
+            content += chunk
+            pulled.append(bodies[-1].pulled)
+        await response.aclose()
+        return content, pulled
+
+    async def main():
+        assert await get("/private") == (b"01234", [0, 1, 2, 3, 4, 5])
+        assert http_cache.stats.stores == 0
+
+        assert await get("/public") == (b"01234", [0, 1, 2, 3, 4, 5])
+        assert http_cache.stats.stores == 1
+        assert http_cache.size == 5
+
+        # Served from the cache without a request
+        request = httpx.Request("GET", "https://example.com/public")
+        response = await http_cache.handle_async_request(request, mock.handle_async_request)
+        assert await response.aread() == b"01234"
+        assert len(bodies) == 2 and http_cache.stats.hits == 1
+
+    asyncio.run(main())
+    http_cache.close()
+
+    if os.name == "posix":
+        assert (tmp_path / "cache.sqlite").stat().st_mode & 0o777 == 0o600
+
+
+def test_nested_streams_dont_deadlock():
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, stream=_Chunks(3))
+
+    async def main():
+        pool = transport._LoopPool(httpx.MockTransport(handler), 1, {})
+        shared = transport.SharedAsyncTransport()
+        shared._pools[asyncio.get_running_loop()] = pool
+
+        async with httpx.AsyncClient(transport=shared) as client:
+            # More requests to the host while the only slot's response is still open
+            async with client.stream("GET", "https://example.com/outer") as outer:
+                async with client.stream("GET", "https://example.com/inner") as inner:
+                    assert await inner.aread() == b"012"
+                assert await client.get("https://example.com/other")
+                assert await outer.aread() == b"012"
+
+    asyncio.run(asyncio.wait_for(main(), 5))
+
+
+def test_closing_a_requests_session_keeps_the_shared_pool():
+    adapter = transport.requests_adapter()
+    first, second = transport.requests_session(), transport.requests_session()
+    assert first.get_adapter("https://example.com") is adapter is second.get_adapter("https://example.com")
+
+    pool = adapter.poolmanager.connection_from_url("https://example.com")
+    first.close()
+    assert adapter.poolmanager.connection_from_url("https://example.com") is pool
+
+    transport.close()
+    assert transport.requests_adapter() is not adapter
@@ -1,6 +1,13 @@
 import os
 import asyncio
+import json
+import datetime
+
+import httpx
+import pytest
+
 from kegscraper import vle
+from kegscraper.util import exceptions
 
 
 async def test_vle():
@@ -16,5 +23,298 @@ async def test_vle():
         )
 
 
+def test_batched_webservice():
+    posts = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls = json.loads(request.content)
+        posts.append([call["args"]["n"] for call in calls])
+
+        # Like moodle, stop at the first failing call
+        responses = []
+        for call in calls:
+            n = call["args"]["n"]
+            if n == 2:
+                responses.append(
+                    {"error": True, "exception": {"errorcode": "nopermissions", "message": "No"}}
+                )
+                break
+            responses.append({"error": False, "data": n * 10})
+        return httpx.Response(200, json=responses)
+
+    async def main():
+        rq = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        sess = vle.Session(rq=rq, _sesskey="key")
+
+        async def call(n: int):
+            return await sess.batched_webservice("method", n=n)
+
+        results = await asyncio.gather(*(call(n) for n in range(5)), return_exceptions=True)
+        assert results[:2] == [0, 10] and results[3:] == [30, 40]
+        assert isinstance(results[2], exceptions.WebServiceError)
+        assert results[2].errorcode == "nopermissions"
+
+        # 5 gathered calls are sent in 1 POST, then the calls after the error are resent
+        assert posts == [[0, 1, 2, 3, 4], [3, 4]]
+
+        posts.clear()
+        assert await sess.webservice_many([("method", {"n": n}) for n in (0, 1, 3)], chunk_size=2) == [0, 10, 30]
+        assert posts == [[0, 1], [3]]
+        with pytest.raises(exceptions.WebServiceError):
+            await sess.webservice_many([("method", {"n": n}) for n in (2, 3)])
+
+    asyncio.run(main())
+
+
+def test_webservice_resends_after_sesskey_refresh():
+    posts = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        sesskey = request.url.params["sesskey"]
+        calls = json.loads(request.content)
+        posts.append((sesskey, [call["args"]["n"] for call in calls]))
+
+        responses = []
+        for call in calls:
+            n = call["args"]["n"]
+            if sesskey == "old" and n >= 2:
+                responses.append({"error": True, "errorcode": "invalidsesskey", "error": "Expired"})
+                break
+            responses.append({"error": False, "data": n})
+        return httpx.Response(200, json=responses)
+
+    async def main():
+        sess = vle.Session(rq=httpx.AsyncClient(transport=httpx.MockTransport(handler)), _sesskey="old")
+
+        async def load_home():
+            sess._sesskey = "new"
+
+        sess._load_home = load_home
+        assert await sess.webservice_many([("method", {"n": n}) for n in range(4)]) == [0, 1, 2, 3]
+
+    asyncio.run(main())
+    # Only the calls from the expired one onwards are resent
+    assert posts == [("old", [0, 1, 2, 3]), ("new", [2, 3])]
+
+
+_PROFILE = """<div class="page-header-headings"><h1>Hidden User</h1></div>
+<img class="userpicture" src="small.png"><img class="userpicture" src="big.png">
+<div class="userprofile"><div class="description"><p>Hi</p></div></div>"""
+
+
+def test_directory_crawler(tmp_path):
+    profiles = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/user/profile.php":
+            _id = int(request.url.params["id"])
+            profiles.append(_id)
+            if _id == 3:
+                return httpx.Response(200, text=_PROFILE)
+            if _id == 7:
+                return httpx.Response(500, text="Server error")
+            return httpx.Response(200, text=vle.user.DELETED_USER)
+
+        # core_user_get_users_by_field: only even ids are readable users
+        (call,) = json.loads(request.content)
+        users = [{"id": _id, "fullname": f"User {_id}"} for _id in call["args"]["values"] if _id % 2 == 0]
+        return httpx.Response(200, json=[{"error": False, "data": users}])
+
+    def crawl(**kwargs) -> list[int]:
+        async def main():
+            sess = vle.Session(rq=httpx.AsyncClient(transport=httpx.MockTransport(handler)), _sesskey="key")
+            crawler = vle.DirectoryCrawler(sess, 0, 10, chunk_size=4, **kwargs)
+            return [_user.id for _user in await crawler.collect()], crawler
+
+        return asyncio.run(main())
+
+    # Missing ids are probed: 3 is a hidden user, 7 fails (and is skipped), and the rest are deleted
+    with pytest.warns(UserWarning, match="user id 7"):
+        ids, crawler = crawl(checkpoint=tmp_path / "users.json")
+    assert ids == [0, 2, 3, 4, 6, 8]
+    assert sorted(profiles) == [1, 3, 5, 7, 9]
+    assert crawler.flags == {1: vle.user.DELETED_USER, 5: vle.user.DELETED_USER, 9: vle.user.DELETED_USER}
+    assert crawler.done
+
+    # Without probing, missing ids are treated as absent
+    profiles.clear()
+    ids, _ = crawl(probe_missing=False)
+    assert ids == [0, 2, 4, 6, 8] and profiles == []
+
+
+_FORUM_PAGE = """<div role="main"><h2>Site news</h2><div id="intro"><p>Site announcements</p></div>
+<div id="discussions"><table class="table table-hover table-striped discussion-list"><tbody>
+<tr><td></td><td><a href="https://vle.kegs.org.uk/mod/forum/discuss.php?d=5">Hello</a></td><td></td>
+<td><a href="#">1</a></td><td></td><td>1 January 2024</td></tr>
+</tbody></table></div></div>"""
+
+
+def _forum_post(post_id: int, title: str, firstpost: bool = False) -> str:
+    return f"""<div class="{'firstpost' if firstpost else 'reply'}"><div data-region-content="forum-post-core">
+<header><div class="flex-column"><h3>{title}</h3><a href="https://vle.kegs.org.uk/user/view.php?id=7">A Person</a>
+<time>1 January 2024, 10:00</time></div></header>
+<a title="Permanent link to this post" href="https://vle.kegs.org.uk/mod/forum/discuss.php?d=5#p{post_id}">Permalink</a>
+<div class="post-content-container"><p>{title}</p></div></div></div>"""
+
+
+_DISCUSSION_PAGE = (
+    '<div role="main"><h3 class="discussionname">Hello</h3>'
+    + _forum_post(11, "Hello", firstpost=True)
+    + _forum_post(12, "Re: Hello")
+    + "</div>"
+)
+
+_FORUM_WEBSERVICE = {
+    "core_course_get_course_module_by_instance": {"cm": {"course": 2, "name": "Site news"}},
+    "mod_forum_get_forum_discussions": {
+        "discussions": [
+            {"discussion": 5, "name": "Hello", "numreplies": 1, "pinned": False,
+             "created": 1704067200, "timemodified": 1704103200}
+        ]
+    },
+    "mod_forum_get_forums_by_courses": [
+        {"id": 1, "intro": "<p>Another forum</p>"},
+        {"id": 377, "intro": "<p>Site <b>announcements</b></p>"},
+    ],
+    "mod_forum_get_discussion_posts": {
+        "posts": [
+            {"id": post_id, "subject": subject, "message": f"<p>{subject}</p>", "timecreated": 1704103200,
+             "author": {"id": 7, "fullname": "A Person"}, "hasparent": post_id != 11}
+            for post_id, subject in ((11, "Hello"), (12, "Re: Hello"))
+        ]
+    },
+    "core_user_get_users_by_field": [{"id": 7, "fullname": "A Person", "email": "a.person@example.com"}],
+}
+
+
+def _forum_session(errorcode=None) -> tuple[vle.Session, list[str]]:
+    """A session for a mock site, whose forum and course webservice methods fail with `errorcode` if given"""
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/lib/ajax/service.php":
+            responses = []
+            for call in json.loads(request.content):
+                requests.append(call["methodname"])
+                if errorcode is not None and call["methodname"].startswith(("mod_forum", "core_course")):
+                    responses.append({"error": True, "exception": {"errorcode": errorcode, "message": "No"}})
+                    break
+                responses.append({"error": False, "data": _FORUM_WEBSERVICE[call["methodname"]]})
+            return httpx.Response(200, json=responses)
+
+        requests.append(request.url.path)
+        assert request.url.path != "/user/profile.php", "Authors should not be fetched one by one"
+        page = {"/mod/forum/view.php": _FORUM_PAGE, "/mod/forum/discuss.php": _DISCUSSION_PAGE}
+        return httpx.Response(200, text=page[request.url.path])
+
+    return vle.Session(rq=httpx.AsyncClient(transport=httpx.MockTransport(handler)), _sesskey="key"), requests
+
+
+@pytest.mark.parametrize("errorcode", [None, "servicenotavailable", "nopermissions"])
+def test_forum(errorcode):
+    async def main():
+        sess, requests = _forum_session(errorcode)
+        _forum = await sess.connect_forum(377)
+        assert (_forum.name, _forum.description.strip()) == ("Site news", "Site announcements")
+        (discussion,) = _forum.contents
+        assert (discussion.id, discussion.name, discussion.reply_count) == (5, "Hello", 1)
+        assert discussion.date_created.date() == datetime.date(2024, 1, 1)
+
+        await discussion.update()
+        assert [(post.id, post.title) for post in discussion.posts] == [(11, "Hello"), (12, "Re: Hello")]
+        assert discussion._top_post is discussion.posts[0]
+        assert "Re: Hello" in discussion.posts[1].content
+        assert discussion.posts[0].creator.id == 7
+        return requests
+
+    requests = asyncio.run(main())
+    if errorcode is None:
+        assert "/mod/forum/view.php" not in requests and "/mod/forum/discuss.php" not in requests
+    else:
+        # Disabled or forbidden methods fall back to scraping the pages
+        assert "/mod/forum/view.php" in requests and requests[-1] == "/mod/forum/discuss.php"
+
+
+def test_forum_other_errors_are_raised():
+    async def main():
+        sess, requests = _forum_session("invalidparameter")
+        with pytest.raises(exceptions.WebServiceError):
+            await sess.connect_forum(377)
+        assert not any(request.startswith("/") for request in requests)
+
+    asyncio.run(main())
+
+
+@pytest.mark.parametrize("errorcode", [None, "servicenotavailable"])
+def test_discussion_hydrates_users(errorcode):
+    async def main():
+        sess, requests = _forum_session(errorcode)
+        discussion = vle.forum.Discussion(sess, id=5)
+        await discussion.update(hydrate_users=True)
+
+        # Both posts are by the same user, who is one object, filled in by one webservice call
+        first, second = discussion.posts
+        assert first.creator is second.creator
+        assert (first.creator.name, first.creator.email) == ("A Person", "a.person@example.com")
+        assert requests.count("core_user_get_users_by_field") == 1
+
+    asyncio.run(main())
+
+
+def test_forum_watcher(tmp_path):
+    since = datetime.datetime.now() - datetime.timedelta(hours=1)
+    start = since.timestamp()
+    # discussion id: (pinned, time modified, posts as (id, time created))
+    discussions = {
+        5: (False, start + 60, [(11, start - 60), (12, start + 60)]),
+        6: (False, start - 60, [(13, start - 60)]),
+    }
+    fetched = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        (call,) = json.loads(request.content)
+        args = call["args"]
+        if call["methodname"] == "mod_forum_get_forum_discussions":
+            assert args["sortorder"] == vle.forum.SORT_LASTPOST_DESC
+            ordered = sorted(discussions.items(), key=lambda item: -item[1][1])
+            data = {
+                "discussions": [
+                    {"discussion": _id, "pinned": pinned, "timemodified": modified, "numreplies": len(posts) - 1}
+                    for _id, (pinned, modified, posts) in ordered
+                ][args["page"] * args["perpage"]:][: args["perpage"]]
+            }
+        else:
+            fetched.append(args["discussionid"])
+            data = {
+                "posts": [
+                    {"id": post_id, "timecreated": created, "author": {"id": 7}}
+                    for post_id, created in discussions[args["discussionid"]][2]
+                ]
+            }
+        return httpx.Response(200, json=[{"error": False, "data": data}])
+
+    async def main():
+        sess = vle.Session(rq=httpx.AsyncClient(transport=httpx.MockTransport(handler)), _sesskey="key")
+        watcher = vle.ForumWatcher(sess, [377], since=since, per_page=1)
+
+        # Only the discussion modified since `since` is fetched, and only its post created since then is new
+        assert [post.id for post in await watcher.poll()] == [12]
+        assert fetched == [5]
+
+        # A reply moves 6 to the top. 5 is unchanged, so listing stops there and 5 isn't fetched again
+        replied = datetime.datetime.now().timestamp() + 60
+        discussions[6] = (False, replied, [(13, start - 60), (14, replied)])
+        fetched.clear()
+        watcher.save(tmp_path / "watcher.json")
+        watcher = vle.ForumWatcher.load(sess, [377], tmp_path / "watcher.json", per_page=1)
+        assert [post.id for post in await watcher.poll()] == [14]
+        assert fetched == [6]
+
+        fetched.clear()
+        assert await watcher.poll() == [] and fetched == []
+
+    asyncio.run(main())
+
+
 if __name__ == "__main__":
     asyncio.run(test_vle())